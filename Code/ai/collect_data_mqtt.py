@@ -2,17 +2,23 @@
 Script thu thập data từ HiveMQ và lưu vào CSV
 Chạy: python collect_data_mqtt.py
 
-Data sẽ được lưu vào: ai/data/sensor_live.csv
+Data sẽ được lưu vào: ai/data/sensor_store/ (Parquet theo ngày/device, cần pyarrow)
+hoặc ai/data/sensor_live.csv (SENSOR_SINK=csv)
 """
 
 import paho.mqtt.client as mqtt
 import json
-import csv
 import os
+import sys
 from datetime import datetime
 from pathlib import Path
 import ssl
 
+# Dùng chung writer group-commit với ai_service.py (src/sensor_writer.py)
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+from sensor_writer import GroupCommitWriter, SensorCsvWriter, payload_to_row
+from sensor_store import PYARROW_AVAILABLE, SENSOR_STORE_DIR, SensorStore
+
 # ===================== CẤU HÌNH =====================
 # Điền thông tin từ HiveMQ của bạn
 MQTT_BROKER = "6737c5bbe1cd42bc9fe23790f95a7e72.s1.eu.hivemq.cloud"
@@ -40,9 +46,22 @@ FIELDNAMES = [
     'soil_moist_pct',   # độ ẩm đất
 ]
 
+# Group-commit: gom dòng theo batch / flush interval thay vì open/close mỗi message
+WRITER_BATCH_SIZE = int(os.getenv("SENSOR_WRITER_BATCH_SIZE", 64))
+WRITER_FLUSH_INTERVAL = float(os.getenv("SENSOR_WRITER_FLUSH_INTERVAL", 1.0))
+WRITER_FSYNC = os.getenv("SENSOR_WRITER_FSYNC", "interval")  # never | interval | always
+
+# Sink: "parquet" (sensor_store) hoặc "csv" (sensor_live.csv)
+SENSOR_SINK = os.getenv("SENSOR_SINK", "parquet")
+STORE_BATCH_SIZE = int(os.getenv("SENSOR_STORE_BATCH_SIZE", 1024))
+STORE_FLUSH_INTERVAL = float(os.getenv("SENSOR_STORE_FLUSH_INTERVAL", 30.0))
+
 # Counter
 message_count = 0
 
+# Writer dùng chung (mở 1 lần trong main())
+writer = None
+
 # ===================== CALLBACK FUNCTIONS =====================
 
 def on_connect(client, userdata, flags, rc):
@@ -58,15 +77,8 @@ def on_connect(client, userdata, flags, rc):
         # Subscribe topic
         client.subscribe(MQTT_TOPIC, qos=1)
         
-        print(f"\n💾 Data will be saved to: {OUTPUT_FILE}")
+        print(f"\n💾 Data will be saved to: {writer.name}")
         print("⏳ Waiting for messages... (Press Ctrl+C to stop)\n")
-        
-        # Tạo file CSV nếu chưa có (với header)
-        if not OUTPUT_FILE.exists():
-            with open(OUTPUT_FILE, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
-                writer.writeheader()
-            print(f"📝 Created new CSV file: {OUTPUT_FILE}\n")
     else:
         print(f"❌ Connection FAILED with code {rc}")
         error_messages = {
@@ -87,28 +99,17 @@ def on_message(client, userdata, msg):
         payload_str = msg.payload.decode('utf-8')
         data = json.loads(payload_str)
         
-        # Timestamp hiện tại nếu không có trong payload
-        timestamp = data.get('timestamp', datetime.now().isoformat())
-        
         # Map data từ ESP32 format sang CSV format (theo báo cáo: 4 fields)
-        row = {
-            'ts': timestamp,
-            'device_id': data.get('device_id', 'esp32-01'),
-            'temp_c': data.get('temperature', 0),
-            'rh_pct': data.get('humidity', 0),
-            'pressure_hpa': data.get('pressure', 0),  # BME280 pressure
-            'soil_moist_pct': data.get('soilMoisture', 0),
-        }
+        # Timestamp hiện tại nếu không có trong payload
+        row = payload_to_row(data, default_ts=datetime.now().isoformat())
         
         # Validate: Kiểm tra có đủ data không
         if row['temp_c'] == 0 and row['rh_pct'] == 0 and row['soil_moist_pct'] == 0:
             print(f"⚠️  Warning: Received empty data, skipping...")
             return
         
-        # Ghi vào CSV
-        with open(OUTPUT_FILE, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
-            writer.writerow(row)
+        # Ghi vào CSV (buffer, flush theo batch / interval)
+        writer.write(row)
         
         message_count += 1
         
@@ -122,7 +123,7 @@ def on_message(client, userdata, msg):
         
         # Thông báo mỗi 10 messages
         if message_count % 10 == 0:
-            print(f"\n💾 Saved {message_count} records to {OUTPUT_FILE}\n")
+            print(f"\n💾 Saved {message_count} records to {writer.name}\n")
         
     except json.JSONDecodeError as e:
         print(f"❌ JSON parse error: {e}")
@@ -145,10 +146,31 @@ def on_log(client, userdata, level, buf):
 # ===================== MAIN =====================
 
 def main():
+    global writer
+
     print("\n" + "=" * 70)
     print("📡 MQTT DATA COLLECTOR - HiveMQ Cloud")
     print("=" * 70)
     
+    # Mở writer 1 lần: sensor store (Parquet) hoặc CSV (tạo file + header nếu chưa có)
+    if SENSOR_SINK == "parquet" and PYARROW_AVAILABLE:
+        writer = GroupCommitWriter(
+            SensorStore(SENSOR_STORE_DIR),
+            batch_size=STORE_BATCH_SIZE,
+            flush_interval=STORE_FLUSH_INTERVAL,
+            fsync_policy=WRITER_FSYNC,
+        )
+    else:
+        if SENSOR_SINK == "parquet":
+            print("⚠️  pyarrow chưa cài → ghi vào sensor_live.csv")
+        writer = SensorCsvWriter(
+            OUTPUT_FILE,
+            fieldnames=FIELDNAMES,
+            batch_size=WRITER_BATCH_SIZE,
+            flush_interval=WRITER_FLUSH_INTERVAL,
+            fsync_policy=WRITER_FSYNC,
+        )
+    
     # Tạo MQTT client
     client = mqtt.Client(
         client_id=f"collector_{datetime.now().timestamp()}",
@@ -190,9 +212,13 @@ def main():
         print("\n" + "=" * 70)
         print("⛔ Stopped by user")
         print(f"💾 Total records saved: {message_count}")
-        print(f"📁 File: {OUTPUT_FILE}")
-        print("=" * 70)
+        print(f"📁 Output: {writer.name}")
         client.disconnect()
+        writer.close()
+        stats = writer.stats()
+        print(f"⚡ Writer: {stats['rows_per_sec']:.2f} rows/s | "
+              f"flush avg {stats['flush_latency_avg_ms']:.2f} ms / max {stats['flush_latency_max_ms']:.2f} ms")
+        print("=" * 70)
         
     except Exception as e:
         print(f"\n❌ Error: {e}")
@@ -202,6 +228,9 @@ def main():
         print("   3. Make sure SSL/TLS is enabled (port 8883)")
         print("   4. Check firewall/network connection")
         print("   5. Test connection with MQTT Explorer first")
+    
+    finally:
+        writer.close()
 
 if __name__ == "__main__":
     main()
@@ -1,11 +1,17 @@
 """
 Script merge data mới với data cũ
 Chạy: python merge_data.py
+
+Data mới: data/sensor_store (Parquet, nếu có) hoặc data/sensor_live.csv
 """
 
+import sys
 import pandas as pd
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+from sensor_store import open_default_store
+
 DATA_DIR = Path(__file__).parent / "data"
 
 # Files
@@ -27,8 +33,14 @@ try:
         print(f"⚠️  Old file not found: {OLD_FILE}")
         df_old = pd.DataFrame()
     
-    # Đọc file mới
-    if NEW_FILE.exists():
+    # Đọc data mới (ưu tiên sensor store). Đọc toàn bộ như nhánh CSV để dòng
+    # trùng / đã sửa trong store thay dòng cũ giống nhau ở cả 2 nguồn
+    store = open_default_store()
+    if store is not None:
+        df_new = store.read()
+        print(f"✅ Loaded new data from {store.root.name}: {len(df_new)} records")
+        print(f"   Date range: {df_new['ts'].min()} to {df_new['ts'].max()}")
+    elif NEW_FILE.exists():
         df_new = pd.read_csv(NEW_FILE, parse_dates=['ts'])
         print(f"✅ Loaded new data: {len(df_new)} records")
         print(f"   Date range: {df_new['ts'].min()} to {df_new['ts'].max()}")
@@ -3,61 +3,66 @@ AI Service - Real-time MQTT Integration for Rain Nowcasting (Production)
 ========================================================================
 Service này:
 1. Subscribe MQTT topic 'sensor/data/push' để nhận data từ ESP32
-2. Lưu data vào sensor_live.csv (theo collect_data_mqtt.py)
+   (callback chỉ enqueue; worker pool parse + lưu + buffer, xem ingest_pipeline.py)
+2. Lưu data vào data/sensor_store (Parquet theo ngày/device) hoặc sensor_live.csv
 3. Lưu buffer 120 phút data (cần cho feature engineering)
 4. Tự động sinh lịch tưới 7 ngày từ scheduler.py khi start
 5. Tự động check và chạy inference 10 phút trước mỗi slot tưới (production)
 6. Publish kết quả dự báo + quyết định tưới lên topic 'ai/forecast/rain'
 7. Publish lịch tưới lên topic 'ai/schedule/irrigation'
 
-Run: python src/ai_service.py
+Khởi động nhanh (FAST_START=1, mặc định): import module này không load model,
+không import xgboost / scheduler / pre_irrigation_check. start() kết nối MQTT và
+nhận data vào buffer trước; warm_up() (thread nền) mới import phần nặng, load
+model rồi sinh lịch tưới. FAST_START=0: warm-up + lịch tưới xong mới kết nối.
+Đo: python src/bench_startup.py
+
+Run: python src/ai_service.py [--runtime threads|asyncio]
 """
 
 import os
 import json
 import time
 import logging
-import csv
 import ssl
 import threading
+import zlib
 from pathlib import Path
 from datetime import datetime, timedelta
-from collections import deque
 from typing import Dict, List, Optional
 
 import paho.mqtt.client as mqtt
-import pandas as pd
-import numpy as np
-import joblib
 from dotenv import load_dotenv
 
-# Feature engineering
-from feature_engineering import (
-    FEATURE_NAMES,
-    compute_feature_from_window,
-    FeatureVector,
-)
+# Model registry (load 1 lần / process lúc warm-up, reload khi file model đổi)
+from model_registry import get_registry
+from predictors import BACKENDS
+from batch_inference import CASCADE_STATS
+from inference_decision import DECISION_STATS
+from forecast_cache import get_forecast_cache
+from rolling_nowcast import ROLLING_NOWCAST, TOPIC_ROLLING, RollingNowcaster
+from metrics import METRICS, METRICS_PORT, serve_metrics, stage_timer
 
-# Scheduler imports (7-day irrigation plan)
-from scheduler import (
-    load_sensor as sched_load_sensor,
-    load_forecast_daily as sched_load_forecast_daily,
-    compute_soil_reference as sched_compute_soil_reference,
-    build_day_plans as sched_build_day_plans,
-    build_output_json as sched_build_output_json,
-)
+# Group-commit writer (sink: Parquet sensor store hoặc sensor_live.csv)
+from sensor_writer import DEFAULT_DEVICE_ID, SENSOR_LIVE_FIELDNAMES, GroupCommitWriter, SensorCsvWriter, payload_to_row
+from sensor_store import PYARROW_AVAILABLE, SENSOR_STORE_DIR, SensorStore
 
-# Pre-irrigation check imports
-try:
-    from pre_irrigation_check import (
-        load_schedule,
-        find_upcoming_slots,
-        run_forecast_for_slot,
-        update_slot_with_forecast,
-    )
-    PRE_IRRIGATION_AVAILABLE = True
-except ImportError:
-    PRE_IRRIGATION_AVAILABLE = False
+# Buffer 120 phút theo từng device + feature online (O(1) / reading)
+from sensor_buffer import PAYLOAD_KEYS, DeviceBufferPool, parse_epoch_seconds
+from streaming_features import StreamingFeatureEngine
+
+# MQTT callback → bounded queue → worker pool (parse, lưu, buffer)
+from ingest_pipeline import IngestPipeline
+
+# Nạp lại buffer từ cuối dữ liệu đã lưu khi khởi động
+from warm_start import WARM_START_MAX_AGE, warm_start
+
+# Cửa sổ cho forecast: buffer trong RAM, fallback sensor store / CSV
+from window_provider import HistoricalWindowProvider, LiveWindowProvider
+
+# scheduler.py (lịch tưới 7 ngày) + pre_irrigation_check.py: import lúc cần (warm-up),
+# xem _pre_irrigation() / generate_schedule()
+PRE_IRRIGATION_AVAILABLE: Optional[bool] = None  # None = chưa import
 
 # ===== Load environment =====
 load_dotenv()
@@ -93,11 +98,40 @@ EXT_WEATHER_CSV = DATA_DIR / "external_weather_60d.csv"
 
 # Sensor live CSV (lưu data từ MQTT - theo collect_data_mqtt.py)
 SENSOR_LIVE_CSV = DATA_DIR / "sensor_live.csv"
-SENSOR_LIVE_FIELDNAMES = ['ts', 'device_id', 'temp_c', 'rh_pct', 'pressure_hpa', 'soil_moist_pct']
+
+# Group-commit cho sensor_live.csv (batch / flush interval / fsync policy)
+SENSOR_WRITER_BATCH_SIZE = int(os.getenv("SENSOR_WRITER_BATCH_SIZE", 64))
+SENSOR_WRITER_FLUSH_INTERVAL = float(os.getenv("SENSOR_WRITER_FLUSH_INTERVAL", 1.0))
+SENSOR_WRITER_FSYNC = os.getenv("SENSOR_WRITER_FSYNC", "interval")  # never | interval | always
+
+# Sink: "parquet" (data/sensor_store, phân vùng ngày/device, cần pyarrow) hoặc "csv" (sensor_live.csv)
+SENSOR_SINK = os.getenv("SENSOR_SINK", "parquet")
+SENSOR_STORE_BATCH_SIZE = int(os.getenv("SENSOR_STORE_BATCH_SIZE", 1024))
+SENSOR_STORE_FLUSH_INTERVAL = float(os.getenv("SENSOR_STORE_FLUSH_INTERVAL", 30.0))
+
+# Per-device buffers: memory budget (tổng records) + idle eviction
+SENSOR_BUFFER_MAX_RECORDS = int(os.getenv("SENSOR_BUFFER_MAX_RECORDS", 240_000))
+SENSOR_BUFFER_IDLE_TTL = float(os.getenv("SENSOR_BUFFER_IDLE_TTL", 6 * 3600))
+
+# Warm start buffer từ sensor store / sensor_live.csv (0 = tắt)
+WARM_START = os.getenv("WARM_START", "1") == "1"
+
+# Số lock phân theo crc32(device_id): buffer + feature của 1 device cập nhật tuần tự
+DEVICE_LOCK_STRIPES = 64
+
+# Ingest queue (on_message chỉ enqueue; worker xử lý)
+# 1 = giữ đúng thứ tự nhận; > 1 an toàn nhờ lock theo device (xem handle_sensor_data)
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 1))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", 10_000))
+INGEST_DROP_POLICY = os.getenv("INGEST_DROP_POLICY", "drop_oldest")  # drop_newest | drop_oldest | block
+INGEST_BLOCK_TIMEOUT = float(os.getenv("INGEST_BLOCK_TIMEOUT", 1.0))
 
 # Schedule file
 SCHEDULE_FILE = DATA_DIR / "lich_tuoi.json"
 
+# Kết nối MQTT trước, import nặng + load model + lịch tưới trong thread nền
+FAST_START = os.getenv("FAST_START", "1") == "1"
+
 # ===== Setup logging =====
 logging.basicConfig(
     level=logging.INFO,
@@ -106,73 +140,100 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# ===== Load models =====
-logger.info("Loading AI models...")
-try:
-    with open(MODEL_DIR / "metadata.json", "r") as f:
-        META = json.load(f)
-    
-    MODEL_NOWCAST = joblib.load(MODEL_DIR / "xgb_nowcast.pkl")
-    MODEL_AMOUNT = joblib.load(MODEL_DIR / "xgb_amount.pkl")
-    
-    logger.info("✓ Models loaded successfully")
-except Exception as e:
-    logger.error(f"Failed to load models: {e}")
-    MODEL_NOWCAST = None
-    MODEL_AMOUNT = None
-    META = {}
-
-# ===== Sensor Buffer (120 phút / 24 records) =====
-class SensorBuffer:
-    """Buffer lưu 120 phút data sensor (24 records @ 5 min interval)"""
-    
-    def __init__(self, max_size: int = 24):
-        self.max_size = max_size
-        self.buffer = deque(maxlen=max_size)
-    
-    def add(self, data: Dict):
-        """Thêm data vào buffer"""
-        self.buffer.append(data)
-    
-    def is_ready(self) -> bool:
-        """Kiểm tra xem đã đủ data chưa (cần ít nhất 12 records = 60 phút)"""
-        return len(self.buffer) >= 12
-    
-    def to_dataframe(self) -> pd.DataFrame:
-        """Convert buffer thành DataFrame"""
-        if not self.buffer:
-            return pd.DataFrame()
-        
-        df = pd.DataFrame(list(self.buffer))
-        if 'timestamp' in df.columns:
-            df['ts'] = pd.to_datetime(df['timestamp'])
-        else:
-            df['ts'] = pd.to_datetime([datetime.utcnow()] * len(df))
-        
-        # Map MQTT format → CSV format
-        df['temp_c'] = df.get('temperature', 0)
-        df['rh_pct'] = df.get('humidity', 0)
-        df['pressure_hpa'] = df.get('pressure', 0)
-        df['soil_moist_pct'] = df.get('soilMoisture', 0)
-        
-        df = df.sort_values('ts')
-        return df
+# ===== Models =====
+# Registry dùng chung (pre_irrigation_check / inference_decision): load ở warm_up(), hot reload
+MODEL_REGISTRY = get_registry()
+
+
+def _pre_irrigation():
+    """Module pre_irrigation_check (import lần đầu khi cần); None nếu thiếu dependency"""
+    global PRE_IRRIGATION_AVAILABLE
+    if PRE_IRRIGATION_AVAILABLE is False:
+        return None
+    try:
+        import pre_irrigation_check
+    except ImportError as e:
+        PRE_IRRIGATION_AVAILABLE = False
+        logger.warning(f"Pre-irrigation check unavailable: {e}")
+        return None
+    PRE_IRRIGATION_AVAILABLE = True
+    return pre_irrigation_check
+
 
 # ===== MQTT Client =====
 class AIService:
     """AI Service với MQTT integration (Production)"""
     
-    def __init__(self):
-        self.client = mqtt.Client(
+    # Topics
+    TOPIC_SENSOR = "sensor/data/push"  # Subscribe: Nhận data từ ESP32
+    TOPIC_FORECAST = "ai/forecast/rain"  # Publish: Dự báo mưa + lượng mưa + quyết định tưới
+    TOPIC_SCHEDULE = "ai/schedule/irrigation"  # Publish: Lịch tưới 7 ngày
+    TOPIC_ROLLING = TOPIC_ROLLING  # Publish (retained): <topic>/<device_id> nowcast mỗi reading
+    
+    def __init__(self, client=None):
+        # client: inject client có API giống paho (vd. local_broker.LocalClient khi test)
+        self.client = client if client is not None else self._create_client()
+        
+        self.client.on_connect = self.on_connect
+        self.client.on_message = self.on_message
+        self.client.on_disconnect = self.on_disconnect
+        
+        # 120 phút / device, LRU khi vượt memory budget
+        self.buffers = DeviceBufferPool(
+            max_size=24,
+            max_total_records=SENSOR_BUFFER_MAX_RECORDS,
+            idle_ttl=SENSOR_BUFFER_IDLE_TTL,
+        )
+        # FeatureVector luôn sẵn sàng cho từng device
+        self.features = StreamingFeatureEngine(interval_seconds=300)
+        # Nowcast liên tục theo reading (rate limit từng device)
+        self.rolling = RollingNowcaster(self.features, self.publish_rolling) if ROLLING_NOWCAST else None
+        # Forecast đọc cửa sổ từ buffer (không đọc đĩa); slot cũ / device chưa ready → store / CSV
+        self.window_provider = LiveWindowProvider(
+            self.buffers, fallback=HistoricalWindowProvider(), lock_for=self._device_lock
+        )
+        self.running = False
+        self._started_at = time.monotonic()
+        self.fast_start = FAST_START
+        # Set khi đã kết nối MQTT / warm_up() xong; startup: mốc thời gian (giây)
+        self.connected = threading.Event()
+        self.warmed_up = threading.Event()
+        self.startup: Dict[str, float] = {}
+        
+        # Writer long-lived (group-commit) → sensor store hoặc sensor_live.csv
+        self.sensor_writer = self._open_sensor_writer()
+        
+        # Queue giữa paho network thread và xử lý (parse + lưu + buffer)
+        self.ingest = IngestPipeline(
+            self.process_sensor_message,
+            workers=INGEST_WORKERS,
+            max_queue=INGEST_QUEUE_SIZE,
+            drop_policy=INGEST_DROP_POLICY,
+            block_timeout=INGEST_BLOCK_TIMEOUT,
+        )
+        self._ingest_dropped = 0
+        
+        # Nhiều ingest worker: reading của cùng device không cập nhật buffer / feature song song
+        self._device_locks = [threading.Lock() for _ in range(DEVICE_LOCK_STRIPES)]
+        
+        # Ghi lịch tưới từ nhiều slot check (executor) không ghi đè lẫn nhau
+        self._schedule_lock = threading.Lock()
+        self._stop_event = threading.Event()
+    
+    def _create_client(self) -> mqtt.Client:
+        client = mqtt.Client(
             client_id="ai_service_" + str(int(time.time())),
             clean_session=True,
             protocol=mqtt.MQTTv311
         )
-        self.client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
-        
-        # Setup TLS nếu cần (theo collect_data_mqtt.py)
+        return self._configure_client(client)
+    
+    @staticmethod
+    def _configure_client(client: mqtt.Client) -> mqtt.Client:
+        """Credentials + TLS (theo collect_data_mqtt.py)"""
+        client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
         if USE_TLS:
-            self.client.tls_set(
+            client.tls_set(
                 ca_certs=None,
                 certfile=None,
                 keyfile=None,
@@ -180,82 +241,104 @@ class AIService:
                 tls_version=ssl.PROTOCOL_TLSv1_2,
                 ciphers=None
             )
+        return client
+    
+    def subscriptions(self) -> List[str]:
+        """Topic subscribe khi kết nối (worker_pool override cho shared subscription)"""
+        return [self.TOPIC_SENSOR]
+    
+    def _open_sensor_writer(self) -> GroupCommitWriter:
+        """Chọn sink theo SENSOR_SINK (fallback CSV nếu thiếu pyarrow)"""
+        if SENSOR_SINK == "parquet":
+            if PYARROW_AVAILABLE:
+                return GroupCommitWriter(
+                    SensorStore(SENSOR_STORE_DIR),
+                    batch_size=SENSOR_STORE_BATCH_SIZE,
+                    flush_interval=SENSOR_STORE_FLUSH_INTERVAL,
+                    fsync_policy=SENSOR_WRITER_FSYNC,
+                )
+            logger.warning("pyarrow not installed, falling back to sensor_live.csv")
         
-        self.client.on_connect = self.on_connect
-        self.client.on_message = self.on_message
-        self.client.on_disconnect = self.on_disconnect
-        
-        self.buffer = SensorBuffer(max_size=24)  # 120 phút
-        self.running = False
-        
-        # Topics
-        self.TOPIC_SENSOR = "sensor/data/push"  # Subscribe: Nhận data từ ESP32
-        self.TOPIC_FORECAST = "ai/forecast/rain"  # Publish: Dự báo mưa + lượng mưa + quyết định tưới
-        self.TOPIC_SCHEDULE = "ai/schedule/irrigation"  # Publish: Lịch tưới 7 ngày
-        
-        # Tạo file CSV nếu chưa có (theo collect_data_mqtt.py)
-        if not SENSOR_LIVE_CSV.exists():
-            DATA_DIR.mkdir(parents=True, exist_ok=True)
-            with open(SENSOR_LIVE_CSV, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=SENSOR_LIVE_FIELDNAMES)
-                writer.writeheader()
-            logger.info(f"✓ Created {SENSOR_LIVE_CSV.name}")
-    
-    def on_connect(self, client, userdata, flags, rc):
+        # Giữ file mở suốt vòng đời service (tạo file + header nếu chưa có)
+        return SensorCsvWriter(
+            SENSOR_LIVE_CSV,
+            fieldnames=SENSOR_LIVE_FIELDNAMES,
+            batch_size=SENSOR_WRITER_BATCH_SIZE,
+            flush_interval=SENSOR_WRITER_FLUSH_INTERVAL,
+            fsync_policy=SENSOR_WRITER_FSYNC,
+        )
+    
+    def on_connect(self, client, userdata, flags, rc, properties=None):
         """Callback khi kết nối thành công"""
         if rc == 0:
             logger.info(f"✓ Connected to MQTT broker: {MQTT_BROKER}:{MQTT_PORT}")
             logger.info(f"🔐 TLS/SSL: {'Enabled' if USE_TLS else 'Disabled'}")
-            client.subscribe(self.TOPIC_SENSOR, qos=1)
-            logger.info(f"✓ Subscribed to topic: {self.TOPIC_SENSOR}")
+            for topic in self.subscriptions():
+                client.subscribe(topic, qos=1)
+                logger.info(f"✓ Subscribed to topic: {topic}")
+            if not self.connected.is_set():
+                self.startup["connect_s"] = time.monotonic() - self._started_at
+                self.connected.set()
         else:
             logger.error(f"Connection failed with code {rc}")
     
-    def on_disconnect(self, client, userdata, rc):
+    def on_disconnect(self, client, userdata, rc, properties=None):
         """Callback khi mất kết nối"""
         logger.warning(f"Disconnected from MQTT broker (rc={rc})")
         if rc != 0:
             logger.info("Attempting to reconnect...")
     
     def on_message(self, client, userdata, msg):
-        """Xử lý message từ sensor/data/push (theo collect_data_mqtt.py)"""
+        """Nhận message từ sensor/data/push: chỉ enqueue, không I/O trên network thread"""
+        if msg.topic == self.TOPIC_SENSOR:
+            with stage_timer("mqtt_receive"):
+                accepted = self.ingest.submit(msg.payload)
+            if not accepted:
+                logger.debug(f"Ingest queue full, dropped message from {msg.topic}")
+    
+    def process_sensor_message(self, payload):
+        """Worker của ingest queue: decode + xử lý 1 message sensor"""
         try:
-            topic = msg.topic
-            payload = msg.payload.decode("utf-8")
-            logger.info(f"← Received message from {topic}")
-            
-            if topic == self.TOPIC_SENSOR:
-                self.handle_sensor_data(payload)
-        
+            if isinstance(payload, (bytes, bytearray)):
+                payload = payload.decode("utf-8")
+            logger.debug(f"← Processing message from {self.TOPIC_SENSOR}")
+            self.handle_sensor_data(payload)
         except Exception as e:
             logger.error(f"Error handling message: {e}", exc_info=True)
     
+    def log_ingest_stats(self):
+        """Log metrics ingest queue; cảnh báo khi có message bị bỏ"""
+        stats = self.ingest.stats()
+        dropped = stats["dropped"] - self._ingest_dropped
+        self._ingest_dropped = stats["dropped"]
+        msg = (
+            f"Ingest queue: depth {stats['depth']}/{stats['capacity']} (max {stats['max_depth']}) "
+            f"| processed {stats['processed']} | dropped {stats['dropped']} | failed {stats['failed']} "
+            f"| age avg {stats['age_avg_ms']:.1f} ms / max {stats['age_max_ms']:.1f} ms "
+            f"| oldest pending {stats['oldest_age_ms']:.1f} ms"
+        )
+        if dropped:
+            logger.warning(f"{msg} (+{dropped} dropped, policy={self.ingest.drop_policy})")
+        else:
+            logger.debug(msg)
+    
+    def _device_lock(self, device_id: str) -> threading.Lock:
+        return self._device_locks[zlib.crc32(device_id.encode("utf-8")) % len(self._device_locks)]
+    
     def save_to_sensor_live_csv(self, data: Dict):
-        """Lưu dữ liệu sensor vào sensor_live.csv (theo collect_data_mqtt.py)"""
+        """Lưu dữ liệu sensor vào sensor store / sensor_live.csv (theo collect_data_mqtt.py)"""
         try:
-            with open(SENSOR_LIVE_CSV, 'a', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=SENSOR_LIVE_FIELDNAMES)
-                
-                # Map data từ ESP32 format sang CSV format (theo collect_data_mqtt.py)
-                timestamp = data.get('timestamp', datetime.utcnow().isoformat())
-                row = {
-                    'ts': timestamp,
-                    'device_id': data.get('device_id', 'esp32-01'),
-                    'temp_c': float(data.get('temperature', 0)),
-                    'rh_pct': float(data.get('humidity', 0)),
-                    'pressure_hpa': float(data.get('pressure', 0)),
-                    'soil_moist_pct': float(data.get('soilMoisture', 0)),
-                }
-                writer.writerow(row)
-            
-            logger.debug(f"✓ Saved to {SENSOR_LIVE_CSV.name}")
+            # Map data từ ESP32 format sang CSV format, ghi theo batch (group-commit)
+            self.sensor_writer.write(payload_to_row(data))
+            logger.debug(f"✓ Queued for {self.sensor_writer.name}")
         except Exception as e:
-            logger.error(f"Error saving to CSV: {e}", exc_info=True)
+            logger.error(f"Error saving sensor data: {e}", exc_info=True)
     
     def handle_sensor_data(self, payload: str):
         """Xử lý dữ liệu sensor từ MQTT"""
         try:
-            data = json.loads(payload)
+            with stage_timer("json_decode"):
+                data = json.loads(payload)
             
             # Validate data (chỉ cần 4 trường: temperature, humidity, pressure, soilMoisture)
             required_fields = ["temperature", "humidity", "pressure", "soilMoisture"]
@@ -268,11 +351,39 @@ class AIService:
                 data["timestamp"] = datetime.utcnow().isoformat()
             
             # Lưu vào CSV (theo collect_data_mqtt.py)
-            self.save_to_sensor_live_csv(data)
+            with stage_timer("persist"):
+                self.save_to_sensor_live_csv(data)
             
-            # Add to buffer
-            self.buffer.add(data)
-            logger.info(f"✓ Added to buffer | Size: {len(self.buffer.buffer)}/{self.buffer.max_size}")
+            # Reading vừa parse (không đọc lại đuôi buffer: worker khác có thể đã ghi thêm)
+            device_id = str(data.get("device_id", DEFAULT_DEVICE_ID))
+            reading = (
+                parse_epoch_seconds(data["timestamp"]),
+                *(float(data.get(key, 0) or 0) for key in PAYLOAD_KEYS),
+            )
+            
+            with self._device_lock(device_id):
+                # Add to buffer của device
+                self.buffers.add(data)
+                buf = self.buffers.get(device_id)
+                
+                # Cập nhật feature online; reading lệch thứ tự → dựng lại từ buffer (đã sắp xếp)
+                fv = None
+                if buf is not None:
+                    fv = self.features.update(device_id, *reading)
+                    if fv is None and reading[0] < (self.features.last_ts(device_id) or 0):
+                        fv = self.features.rebuild(device_id, buf.window())
+            # Đang warm-up → bỏ qua (không chặn worker ingest chờ load model)
+            if fv is not None and self.rolling is not None and self.warmed_up.is_set():
+                self.rolling.on_reading(device_id)
+            if buf is not None and len(buf) == buf.min_ready:
+                logger.info(
+                    f"✓ Buffer [{device_id}] ready "
+                    f"({time.monotonic() - self._started_at:.0f}s after startup)"
+                )
+            logger.info(
+                f"✓ Added to buffer [{device_id}] | Size: {len(buf) if buf else 0}/{self.buffers.max_size} "
+                f"| Devices: {len(self.buffers)}"
+            )
             
         except json.JSONDecodeError as e:
             logger.error(f"Invalid JSON payload: {e}")
@@ -285,11 +396,19 @@ class AIService:
         Sinh JSON lịch tưới 7 ngày bằng scheduler.py (theo scheduler.py)
         """
         try:
-            sensor_df = sched_load_sensor()
-            forecast_daily = sched_load_forecast_daily()
-            soil_ref_7d = sched_compute_soil_reference(sensor_df)
-            plans = sched_build_day_plans(forecast_daily, soil_ref_7d)
-            schedule_json = sched_build_output_json(plans)
+            from scheduler import (
+                build_day_plans,
+                build_output_json,
+                compute_soil_reference,
+                load_forecast_daily,
+                load_sensor,
+            )
+            
+            sensor_df = load_sensor()
+            forecast_daily = load_forecast_daily()
+            soil_ref_7d = compute_soil_reference(sensor_df)
+            plans = build_day_plans(forecast_daily, soil_ref_7d)
+            schedule_json = build_output_json(plans)
             
             # Tính forecast_trigger_ts cho tất cả slots (start_ts - 10 phút) - PRODUCTION
             for slot in schedule_json.get("slots", []):
@@ -321,7 +440,8 @@ class AIService:
     
     def check_and_run_pre_irrigation(self):
         """Tự động check slots và chạy inference trước 10 phút (production)"""
-        if not PRE_IRRIGATION_AVAILABLE:
+        pre = _pre_irrigation()
+        if pre is None:
             return
         
         try:
@@ -329,17 +449,18 @@ class AIService:
                 logger.debug("No schedule file found for pre-irrigation check")
                 return
             
-            schedule = load_schedule(SCHEDULE_FILE)
+            schedule = pre.load_schedule(SCHEDULE_FILE)
             now = datetime.utcnow()
             
             # Tìm slots có forecast_trigger_ts trong vòng 15 phút (hoặc slot tiếp theo)
-            upcoming_slots = find_upcoming_slots(schedule, lookahead_minutes=15, find_next=True)
+            upcoming_slots = pre.find_upcoming_slots(schedule, lookahead_minutes=15, find_next=True)
             
             if not upcoming_slots:
                 return
             
             logger.info(f"🔮 Found {len(upcoming_slots)} slot(s) for pre-irrigation check")
             
+            due_slots = []
             for slot in upcoming_slots:
                 start_ts_str = slot.get("start_ts", "")
                 trigger_ts_str = slot.get("forecast_trigger_ts", "")
@@ -347,55 +468,273 @@ class AIService:
                 if not start_ts_str or not trigger_ts_str:
                     continue
                 
-                start_ts = datetime.fromisoformat(start_ts_str.replace("Z", ""))
                 trigger_ts = datetime.fromisoformat(trigger_ts_str.replace("Z", ""))
                 
-                # Kiểm tra xem đã check chưa
-                if slot.get("forecast_checked_at"):
+                # Kiểm tra xem đã check chưa / slot thuộc worker khác
+                if slot.get("forecast_checked_at") or not self.owns_slot(slot):
                     continue
                 
                 # Kiểm tra xem đã đến thời điểm trigger chưa (trong vòng 5 phút)
                 time_to_trigger = (trigger_ts - now).total_seconds() / 60
                 if -5 <= time_to_trigger <= 5:
-                    logger.info(f"⏰ Running pre-irrigation check for slot at {start_ts.strftime('%Y-%m-%d %H:%M')}")
-                    
-                    # Chạy forecast
-                    forecast_result = run_forecast_for_slot(slot)
-                    updated_slot = update_slot_with_forecast(slot, forecast_result)
-                    
-                    # Publish forecast (bao gồm dự báo mưa + lượng mưa + quyết định tưới)
-                    # Gộp tất cả vào cùng 1 output: ai/forecast/rain
-                    forecast_payload = {
-                        "timestamp": datetime.utcnow().isoformat() + "Z",
-                        "slot_id": start_ts_str,
-                        "predictions": forecast_result.get("predictions", {}),
-                        "sensor_ref": forecast_result.get("sensor_ref", {}),
-                        "recommendation": forecast_result.get("recommendation", {}),
-                    }
-                    
-                    self.client.publish(self.TOPIC_FORECAST, json.dumps(forecast_payload, ensure_ascii=False), qos=1)
-                    logger.info(f"→ Published forecast (with decision) to {self.TOPIC_FORECAST}")
-                    logger.info(f"   Slot: {start_ts.strftime('%Y-%m-%d %H:%M')}")
-                    logger.info(f"   Decision: {'✅ TƯỚI' if forecast_result.get('recommendation', {}).get('should_irrigate') else '⏸️  HOÃN'}")
-                    
-                    # Cập nhật schedule
-                    for i, s in enumerate(schedule.get("slots", [])):
-                        if s.get("start_ts") == start_ts_str:
-                            schedule["slots"][i] = updated_slot
-                            break
-                    
-                    # Lưu schedule đã cập nhật
-                    with open(SCHEDULE_FILE, "w", encoding="utf-8") as f:
-                        json.dump(schedule, f, ensure_ascii=False, indent=2)
+                    due_slots.append(slot)
+            
+            # Các slot đến hạn cùng lúc: 1 batch inference
+            for forecast_payload, forecast_result in self.run_slot_checks(due_slots):
+                self.publish_forecast(forecast_payload, forecast_result)
                     
         except Exception as e:
             logger.error(f"Error in pre-irrigation check: {e}", exc_info=True)
     
-    def start(self):
-        """Khởi động service"""
+    def schedule_mtime(self) -> Optional[float]:
+        """mtime file lịch tưới (None nếu chưa có / không có pre-irrigation)"""
+        if _pre_irrigation() is None or not SCHEDULE_FILE.exists():
+            return None
+        return SCHEDULE_FILE.stat().st_mtime
+    
+    def pending_slots(self) -> List[Dict]:
+        """Các slot trong lịch tưới chưa được forecast check"""
+        if self.schedule_mtime() is None:
+            return []
+        schedule = _pre_irrigation().load_schedule(SCHEDULE_FILE)
+        return [
+            s for s in schedule.get("slots", [])
+            if not s.get("forecast_checked_at") and self.owns_slot(s)
+        ]
+    
+    def owns(self, device_id: str) -> bool:
+        """Service có giữ buffer cho device này không (worker_pool: theo partition)"""
+        return True
+    
+    def owns_slot(self, slot: Dict) -> bool:
+        """Service có chạy forecast cho slot này không (worker_pool: theo device_id)"""
+        return True
+    
+    def run_slot_check(self, slot: Dict):
+        """Chạy forecast cho 1 slot (xem run_slot_checks)."""
+        return self.run_slot_checks([slot])[0]
+    
+    def run_slot_checks(self, slots: List[Dict]) -> List[tuple]:
+        """
+        Chạy forecast cho các slot đến hạn (1 batch) + lưu slot đã cập nhật vào lịch tưới.
+        
+        CPU-bound (feature + predict) → asyncio runtime gọi qua executor.
+        Returns: [(forecast_payload, forecast_result)] theo thứ tự slots; việc publish do caller làm.
+        """
+        if not slots:
+            return []
+        pre = _pre_irrigation()
+        for slot in slots:
+            start_ts = datetime.fromisoformat(slot.get("start_ts", "").replace("Z", ""))
+            logger.info(f"⏰ Running pre-irrigation check for slot at {start_ts.strftime('%Y-%m-%d %H:%M')}")
+        
+        # Chạy forecast (nowcast + amount: 1 lần gọi mỗi model cho cả batch)
+        forecast_results = pre.run_forecasts_for_slots(slots, window_provider=self.window_provider)
+        
+        outputs = []
+        updated_slots = []
+        for slot, forecast_result in zip(slots, forecast_results):
+            updated_slots.append(pre.update_slot_with_forecast(slot, forecast_result))
+            # Gộp tất cả vào cùng 1 output: ai/forecast/rain
+            forecast_payload = {
+                "timestamp": datetime.utcnow().isoformat() + "Z",
+                "slot_id": slot.get("start_ts", ""),
+                "decision_path": forecast_result.get("decision_path"),
+                "predictions": forecast_result.get("predictions", {}),
+                "sensor_ref": forecast_result.get("sensor_ref", {}),
+                "recommendation": forecast_result.get("recommendation", {}),
+            }
+            outputs.append((forecast_payload, forecast_result))
+        
+        self.save_slots(updated_slots)
+        return outputs
+    
+    def save_slot(self, updated_slot: Dict):
+        """Ghi slot đã check vào lịch tưới (đọc lại file để không ghi đè slot khác)"""
+        self.save_slots([updated_slot])
+    
+    def save_slots(self, updated_slots: List[Dict]):
+        """Ghi các slot đã check vào lịch tưới (1 lần đọc + ghi file cho cả batch)"""
+        by_start = {s.get("start_ts"): s for s in updated_slots}
+        with self._schedule_lock, stage_timer("schedule_save"):
+            schedule = _pre_irrigation().load_schedule(SCHEDULE_FILE)
+            for i, s in enumerate(schedule.get("slots", [])):
+                if s.get("start_ts") in by_start:
+                    schedule["slots"][i] = by_start[s.get("start_ts")]
+            
+            # Lưu schedule đã cập nhật
+            with open(SCHEDULE_FILE, "w", encoding="utf-8") as f:
+                json.dump(schedule, f, ensure_ascii=False, indent=2)
+    
+    def publish_forecast(self, forecast_payload: Dict, forecast_result: Dict):
+        """Publish forecast (bao gồm dự báo mưa + lượng mưa + quyết định tưới)"""
+        with stage_timer("publish"):
+            self.client.publish(self.TOPIC_FORECAST, json.dumps(forecast_payload, ensure_ascii=False), qos=1)
+        logger.info(f"→ Published forecast (with decision) to {self.TOPIC_FORECAST}")
+        logger.info(f"   Slot: {forecast_payload['slot_id']}")
+        logger.info(f"   Decision: {'✅ TƯỚI' if forecast_result.get('recommendation', {}).get('should_irrigate') else '⏸️  HOÃN'}")
+    
+    def publish_rolling(self, topic: str, payload: str):
+        """Publish rolling nowcast của 1 device (retained: subscriber mới nhận ngay bản mới nhất)"""
+        self.client.publish(topic, payload, qos=0, retain=True)
+        logger.debug(f"→ Published rolling nowcast to {topic}")
+    
+    def publish_schedule(self) -> Optional[Dict]:
+        """Generate lịch tưới 7 ngày và publish lên TOPIC_SCHEDULE"""
+        logger.info("\n📅 Generating 7-day irrigation schedule...")
+        schedule = self.generate_schedule()
+        if schedule:
+            schedule_payload = json.dumps(schedule, ensure_ascii=False)
+            self.client.publish(self.TOPIC_SCHEDULE, schedule_payload, qos=1)
+            logger.info(f"✓ Published schedule to {self.TOPIC_SCHEDULE}")
+            logger.info(f"   Total slots: {len(schedule.get('slots', []))}")
+        return schedule
+    
+    def housekeeping(self):
+        """Việc định kỳ (mỗi phút): dọn buffer device idle + log metrics ingest"""
+        # Dọn buffer của device không còn gửi dữ liệu
+        evicted = self.buffers.evict_idle()
+        for device_id in evicted:
+            self.features.remove(device_id)
+            if self.rolling is not None:
+                self.rolling.remove(device_id)
+        if evicted:
+            logger.info(f"Evicted {len(evicted)} idle device buffer(s)")
+        
+        self.log_ingest_stats()
+        self.log_cascade_stats()
+        self.log_decision_stats()
+        self.log_forecast_cache_stats()
+        self.log_rolling_stats()
+    
+    def log_rolling_stats(self):
+        """Log rolling nowcast: số lần dự báo / bị rate limit / chưa đủ dữ liệu"""
+        if self.rolling is None:
+            return
+        stats = self.rolling.stats()
+        logger.debug(
+            f"Rolling nowcast: {stats['runs']} runs for {stats['devices']} device(s) "
+            f"| rate limited {stats['rate_limited']} | not ready {stats['not_ready']} | errors {stats['errors']}"
+        )
+    
+    def log_forecast_cache_stats(self):
+        """Log hit/miss của forecast cache (slot check lặp lại với cùng input)"""
+        stats = get_forecast_cache().stats()
+        if stats["hits"] or stats["misses"]:
+            logger.debug(
+                f"Forecast cache: {stats['size']}/{stats['maxsize']} entries | hits {stats['hits']} "
+                f"| misses {stats['misses']} | hit rate {stats['hit_rate']:.1%} | expired {stats['expired']} "
+                f"| evictions {stats['evictions']} | invalidations {stats['invalidations']}"
+            )
+    
+    def log_decision_stats(self):
+        """Log tỉ lệ quyết định tưới bằng luật (không chạy features + models)"""
+        stats = DECISION_STATS.snapshot()
+        if stats["decisions"]:
+            logger.debug(
+                f"Decisions: {stats['short_circuit']}/{stats['decisions']} short-circuited by rules "
+                f"({stats['short_circuit_pct']:.1f}%) | paths {stats['paths']}"
+            )
+    
+    def log_cascade_stats(self):
+        """Log số lần gọi amount model đã bỏ qua nhờ cascade (xác suất < AMOUNT_GATE)"""
+        stats = CASCADE_STATS.snapshot()
+        if stats["rows"]:
+            logger.debug(
+                f"Amount cascade (gate {stats['gate']}): {stats['skipped_rows']}/{stats['rows']} rows skipped "
+                f"({stats['skipped_rows_pct']:.1f}%) | calls {stats['amount_calls']} | skipped calls {stats['skipped_calls']}"
+            )
+    
+    def warm_start_buffers(self) -> Dict:
+        """Nạp cửa sổ gần nhất của từng device từ sink đang ghi (store hoặc CSV)"""
+        if not WARM_START:
+            return {}
+        sink = self.sensor_writer.sink
+        store = sink if isinstance(sink, SensorStore) else None
+        csv_path = getattr(sink, "path", None) if store is None else None
+        try:
+            report = warm_start(
+                self.buffers, self.features, store=store, csv_path=csv_path,
+                max_age=WARM_START_MAX_AGE, owns=self.owns,
+            )
+        except Exception as e:
+            logger.error(f"Warm start failed: {e}", exc_info=True)
+            return {}
+        
+        if report["devices"]:
+            logger.info(
+                f"🔥 Warm start from {report['source']}: {report['devices']} device(s), "
+                f"{report['ready']} ready | {report['rows']} rows, {report['bytes'] / 1024:.0f} KB read "
+                f"| time-to-ready {report['elapsed_ms']:.0f} ms"
+            )
+        else:
+            logger.info(
+                f"Cold start: no recent data (< {WARM_START_MAX_AGE / 60:.0f} min) "
+                f"→ first nowcast after {self.buffers.min_ready} readings (~{self.buffers.min_ready * 5} min)"
+            )
+        waiting = {d: r["size"] for d, r in self.buffers.readiness().items() if not r["ready"]}
+        for device_id, size in waiting.items():
+            logger.info(
+                f"   [{device_id}] {size}/{self.buffers.min_ready} records "
+                f"→ ready in ~{(self.buffers.min_ready - size) * 5} min"
+            )
+        return report
+    
+    def warm_up(self) -> Dict[str, float]:
+        """
+        Import phần nặng (pre_irrigation_check → inference stack, scheduler) + load model.
+        
+        FAST_START: chạy nền sau khi đã kết nối MQTT; slot check đến trước khi xong
+        sẽ đợi registry.get(), rolling nowcast bỏ qua reading.
+        """
+        t0 = time.perf_counter()
+        try:
+            _pre_irrigation()
+            import scheduler  # noqa: F401
+            t1 = time.perf_counter()
+            bundle = MODEL_REGISTRY.get()
+            t2 = time.perf_counter()
+            self.startup.update({"imports_s": t1 - t0, "models_s": t2 - t1})
+            logger.info(
+                f"🔥 Warm-up: imports {(t1 - t0) * 1000:.0f} ms | models {bundle.version} "
+                f"({bundle.backend}) {(t2 - t1) * 1000:.0f} ms, incl. predict warm-up {bundle.warmup_ms:.0f} ms"
+            )
+        except Exception as e:
+            logger.error(f"Failed to load models: {e}", exc_info=True)
+        finally:
+            self.startup["ready_s"] = time.monotonic() - self._started_at
+            self.warmed_up.set()
+        return self.startup
+    
+    def start_warm_up(self) -> threading.Thread:
+        """warm_up() + publish_schedule() trên thread nền (FAST_START, sau khi kết nối MQTT)"""
+        def run():
+            self.warm_up()
+            self.publish_schedule()
+        
+        thread = threading.Thread(target=run, name="warm-up", daemon=True)
+        thread.start()
+        return thread
+    
+    def connect_mqtt(self):
+        self.client.connect(MQTT_BROKER, MQTT_PORT, keepalive=60)
+    
+    def register_metrics(self):
+        """Gauge cho /metrics từ stats() sẵn có (chỉ đọc khi scrape)"""
+        METRICS.add_source("ai_ingest", lambda: self.ingest.stats())
+        METRICS.add_source("ai_sensor_writer", lambda: self.sensor_writer.stats())
+        METRICS.add_source("ai_amount_cascade", CASCADE_STATS.snapshot)
+        METRICS.add_source("ai_decisions", DECISION_STATS.snapshot)
+        METRICS.add_source("ai_forecast_cache", lambda: get_forecast_cache().stats())
+        METRICS.add_source("ai_models", MODEL_REGISTRY.info)
+        if self.rolling is not None:
+            METRICS.add_source("ai_rolling_nowcast", self.rolling.stats)
+    
+    def log_banner(self, runtime: str = "threads"):
         logger.info("=" * 70)
         logger.info("🚀 STARTING AI SERVICE (PRODUCTION MODE)")
         logger.info("=" * 70)
+        logger.info(f"Runtime: {runtime}")
         logger.info(f"MQTT Broker: {MQTT_BROKER}:{MQTT_PORT}")
         logger.info(f"TLS/SSL: {'Enabled' if USE_TLS else 'Disabled'}")
         logger.info(f"Username: {MQTT_USERNAME}")
@@ -403,23 +742,62 @@ class AIService:
         logger.info(f"Publish:")
         logger.info(f"  - {self.TOPIC_FORECAST} (Dự báo mưa + lượng mưa + quyết định tưới)")
         logger.info(f"  - {self.TOPIC_SCHEDULE} (Lịch tưới 7 ngày)")
-        logger.info(f"Data will be saved to: {SENSOR_LIVE_CSV.name}")
+        if self.rolling is not None:
+            logger.info(f"  - {self.TOPIC_ROLLING}/<device_id> (Nowcast mỗi reading, retained)")
+        logger.info(f"Data will be saved to: {self.sensor_writer.name}")
+        info = MODEL_REGISTRY.info()
+        if info["version"] is None:
+            logger.info(f"Models: loading {'in background after connect' if self.fast_start else 'before connect'} "
+                        f"(backend {info['requested_backend']})")
+        else:
+            logger.info(f"Models: version {info['version']}, backend {info.get('backend')} (loaded {info['loaded_at']})")
         logger.info("-" * 70)
+    
+    def shutdown(self):
+        """Xử lý nốt message đã nhận, đóng writer, log thống kê"""
+        self.running = False
+        self.ingest.close(drain=True)
+        self.log_ingest_stats()
+        self.log_cascade_stats()
+        self.log_decision_stats()
+        self.log_forecast_cache_stats()
+        self.log_rolling_stats()
+        self.sensor_writer.close()
+        stats = self.sensor_writer.stats()
+        logger.info(
+            f"Sensor writer: {stats['rows_written']} rows, "
+            f"{stats['rows_per_sec']:.2f} rows/s, "
+            f"flush avg {stats['flush_latency_avg_ms']:.2f} ms / max {stats['flush_latency_max_ms']:.2f} ms"
+        )
+        logger.info("Service shutdown")
+    
+    def stop(self):
+        """Yêu cầu start() dừng (từ thread khác)"""
+        self._stop_event.set()
+    
+    def start(self):
+        """Khởi động service (runtime threads: paho loop_start + thread check mỗi phút)"""
+        self.log_banner("threads")
+        self.warm_start_buffers()
         
-        # 1. Tự động generate và push schedule khi start (theo scheduler.py)
-        logger.info("\n📅 Generating 7-day irrigation schedule...")
-        schedule = self.generate_schedule()
-        if schedule:
-            schedule_payload = json.dumps(schedule, ensure_ascii=False)
-            self.client.publish(self.TOPIC_SCHEDULE, schedule_payload, qos=1)
-            logger.info(f"✓ Published schedule to {self.TOPIC_SCHEDULE}")
-            logger.info(f"   Total slots: {len(schedule.get('slots', []))}")
+        # 1. Load model + generate và push schedule khi start (theo scheduler.py);
+        #    FAST_START: làm nền sau khi đã kết nối (bước 2)
+        if not self.fast_start:
+            self.warm_up()
+            self.publish_schedule()
         
-        # 2. Kết nối MQTT
+        # 2. Kết nối MQTT (worker ingest chạy trước khi nhận message)
         logger.info(f"\n🔌 Connecting to MQTT broker...")
+        self.ingest.start()
+        logger.info(
+            f"✓ Ingest queue: {INGEST_WORKERS} worker(s), capacity {INGEST_QUEUE_SIZE}, "
+            f"policy {INGEST_DROP_POLICY}"
+        )
         try:
-            self.client.connect(MQTT_BROKER, MQTT_PORT, keepalive=60)
+            self.connect_mqtt()
             self.client.loop_start()
+            if self.fast_start:
+                self.start_warm_up()
             time.sleep(2)  # Đợi kết nối
         except Exception as e:
             logger.error(f"Failed to connect to MQTT: {e}")
@@ -433,6 +811,7 @@ class AIService:
                 try:
                     time.sleep(60)  # Check mỗi phút
                     self.check_and_run_pre_irrigation()
+                    self.housekeeping()
                 except Exception as e:
                     logger.error(f"Error in pre-irrigation loop: {e}", exc_info=True)
         
@@ -448,22 +827,54 @@ class AIService:
         logger.info("-" * 70 + "\n")
         
         try:
-            # Chạy cho đến khi user dừng
-            while True:
-                time.sleep(1)
+            # Chạy cho đến khi user dừng (Ctrl+C hoặc stop())
+            while not self._stop_event.wait(1):
+                pass
         except KeyboardInterrupt:
             logger.info("\n⚠️  Service stopped by user")
         finally:
             self.running = False
             self.client.loop_stop()
             self.client.disconnect()
-            logger.info("Service shutdown")
+            # Xử lý nốt message đã nhận trước khi đóng writer
+            self.shutdown()
 
 
 if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="AI Service (MQTT rain nowcast + irrigation)")
+    parser.add_argument(
+        "--runtime",
+        choices=["threads", "asyncio"],
+        default=os.getenv("AI_RUNTIME", "threads"),
+        help="threads: paho loop_start + polling thread; asyncio: 1 event loop + executor",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=list(BACKENDS),
+        default=MODEL_REGISTRY.backend,
+        help="Inference backend cho nowcast + amount (mặc định: INFERENCE_BACKEND hoặc xgboost)",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=METRICS_PORT,
+        help="Port HTTP cho /metrics (Prometheus text, 0 = tắt)",
+    )
+    args = parser.parse_args()
+    
     try:
+        if args.backend != MODEL_REGISTRY.backend:
+            MODEL_REGISTRY.set_backend(args.backend, load=not FAST_START)
         service = AIService()
-        service.start()
+        service.register_metrics()
+        serve_metrics(args.metrics_port)
+        if args.runtime == "asyncio":
+            from async_runtime import run_async
+            run_async(service)
+        else:
+            service.start()
     except KeyboardInterrupt:
         print("\n\n⚠️  Interrupted by user.")
     except Exception as e:
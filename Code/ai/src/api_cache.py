@@ -0,0 +1,226 @@
+"""
+API Cache - Bảng dữ liệu thời tiết API (OWM) trong RAM cho load_api_row().
+
+Trước đây mỗi lần suy luận: pd.read_csv(owm_history.csv) → sort →
+(api_df["ts"] - ts_ref).abs().idxmin() trên toàn bảng. Ở đây:
+- Load file 1 lần, lưu dạng cột: ts int64 (epoch giây, đã sort + bỏ trùng)
+  + các cột API float32
+- Tra cứu bản ghi gần nhất bằng np.searchsorted (O(log n)), lệch quá
+  `max_gap` (1h) → giá trị mặc định (giống code cũ)
+- lookup_many(): tra cứu cả mảng timestamp 1 lần (vectorized)
+- Mỗi `check_interval` giây stat() file; mtime/size đổi → load lại bảng mới
+  rồi mới thay (1 phép gán), reader không thấy bảng nửa cũ nửa mới
+
+Nguồn (giống load_api_row cũ): owm_history.csv, không có thì
+external_weather_60d.csv (đổi tên cột), không có file nào → mặc định.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+DATA_DIR = ROOT / "data"
+
+OWM_CSV = DATA_DIR / "owm_history.csv"
+EXT_WEATHER_CSV = DATA_DIR / "external_weather_60d.csv"
+
+API_COLUMNS = ("api_pop", "api_rain_1h", "api_temp_c", "api_rh_pct", "api_uvi")
+# Không có dữ liệu API (hoặc lệch > max_gap) → dùng giá trị mặc định
+API_DEFAULTS = {
+    "api_pop": 0.2,
+    "api_rain_1h": 0.0,
+    "api_temp_c": 25.0,
+    "api_rh_pct": 70.0,
+    "api_uvi": 5.0,
+}
+# external_weather_60d.csv thiếu cột → giá trị thay thế
+EXT_WEATHER_FILL = {"api_temp_c": 25.0, "api_rh_pct": 70.0, "api_uvi": 5.0}
+
+API_MAX_GAP = 3600  # giây
+API_CACHE_CHECK_INTERVAL = float(os.getenv("API_CACHE_CHECK_INTERVAL", 5))
+
+
+def _to_epoch(values) -> np.ndarray:
+    """Timestamp / mảng timestamp (naive = UTC) → epoch giây int64."""
+    if np.ndim(values) == 0:
+        ts = pd.Timestamp(values)
+        if ts.tzinfo is not None:
+            ts = ts.tz_convert("UTC").tz_localize(None)
+        return np.array([(ts - pd.Timestamp(0)) // pd.Timedelta(seconds=1)], dtype=np.int64)
+    ts = pd.to_datetime(pd.Series(np.atleast_1d(values)), utc=True, format="mixed").dt.tz_localize(None)
+    return ts.to_numpy(dtype="datetime64[s]").astype(np.int64)
+
+
+@dataclass(frozen=True)
+class ApiTable:
+    """Snapshot bảng API (bất biến): ts tăng dần, không trùng; values (n_cols, n)."""
+
+    ts: np.ndarray
+    values: np.ndarray
+    source: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    @classmethod
+    def empty(cls) -> "ApiTable":
+        return cls(np.empty(0, dtype=np.int64), np.empty((len(API_COLUMNS), 0), dtype=np.float32))
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, source: Optional[str] = None) -> "ApiTable":
+        ts = pd.to_datetime(df["ts"], utc=True, format="mixed", errors="coerce").dt.tz_localize(None)
+        df = df.assign(ts=ts).dropna(subset=["ts"])
+        # Sort ổn định + giữ bản ghi đầu tiên của mỗi ts (idxmin cũ chọn bản ghi đầu)
+        df = df.sort_values("ts", kind="stable").drop_duplicates("ts", keep="first")
+        values = np.vstack([
+            pd.to_numeric(df[c], errors="coerce").fillna(API_DEFAULTS[c]).to_numpy(dtype=np.float32)
+            if c in df.columns else np.full(len(df), API_DEFAULTS[c], dtype=np.float32)
+            for c in API_COLUMNS
+        ])
+        return cls(df["ts"].to_numpy(dtype="datetime64[s]").astype(np.int64), values, source)
+
+    def nearest(self, ts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Bản ghi gần nhất cho từng ts (epoch giây).
+
+        Returns: (index, độ lệch giây); cách đều 2 bản ghi → chọn bản ghi trước.
+        """
+        ts = np.asarray(ts, dtype=np.int64)
+        n = len(self.ts)
+        right = np.clip(np.searchsorted(self.ts, ts, side="left"), 0, n - 1)
+        left = np.clip(right - 1, 0, n - 1)
+        gap_left = np.abs(ts - self.ts[left])
+        gap_right = np.abs(self.ts[right] - ts)
+        use_left = gap_left <= gap_right
+        return np.where(use_left, left, right), np.where(use_left, gap_left, gap_right)
+
+    def lookup_many(self, ts, max_gap: float = API_MAX_GAP) -> np.ndarray:
+        """
+        Giá trị API cho mảng timestamp: mảng (len(ts), len(API_COLUMNS)) float32.
+
+        Dòng không có bản ghi trong vòng max_gap giây → API_DEFAULTS.
+        """
+        epochs = _to_epoch(ts)
+        out = np.tile(np.array([API_DEFAULTS[c] for c in API_COLUMNS], dtype=np.float32), (len(epochs), 1))
+        if len(self.ts):
+            idx, gap = self.nearest(epochs)
+            ok = gap <= max_gap
+            out[ok] = self.values[:, idx[ok]].T
+        return out
+
+    def lookup(self, ts_ref, max_gap: float = API_MAX_GAP) -> Dict[str, float]:
+        """Giá trị API gần ts_ref nhất (dict; lệch > max_gap → API_DEFAULTS)."""
+        n = len(self.ts)
+        if not n:
+            return dict(API_DEFAULTS)
+        # 1 timestamp: searchsorted vô hướng, tránh tạo mảng tạm
+        t = int(_to_epoch(ts_ref)[0])
+        right = min(int(np.searchsorted(self.ts, t, side="left")), n - 1)
+        left = max(right - 1, 0)
+        gap_left, gap_right = abs(t - int(self.ts[left])), abs(int(self.ts[right]) - t)
+        idx, gap = (left, gap_left) if gap_left <= gap_right else (right, gap_right)
+        if gap > max_gap:
+            return dict(API_DEFAULTS)
+        return dict(zip(API_COLUMNS, self.values[:, idx].tolist()))
+
+
+def _read_api_frame(paths: Sequence[Path]) -> Tuple[Optional[pd.DataFrame], Optional[Path]]:
+    """DataFrame của file API đầu tiên tồn tại (đã map cột external_weather)."""
+    for path in paths:
+        if not path.exists():
+            continue
+        df = pd.read_csv(path)
+        if "api_rain_prob_60" in df.columns:
+            df = df.rename(columns={"api_rain_prob_60": "api_pop", "api_rain_mm_60": "api_rain_1h"})
+        if path.name == EXT_WEATHER_CSV.name:
+            for col, default in EXT_WEATHER_FILL.items():
+                if col not in df.columns:
+                    df[col] = default
+        return df, path
+    return None, None
+
+
+class ApiCache:
+    """ApiTable hiện tại của file API (thread-safe, tự load lại khi file đổi)."""
+
+    def __init__(self, paths: Sequence[Path] = (OWM_CSV, EXT_WEATHER_CSV),
+                 check_interval: float = API_CACHE_CHECK_INTERVAL, max_gap: float = API_MAX_GAP):
+        self.paths = [Path(p) for p in paths]
+        self.check_interval = check_interval
+        self.max_gap = max_gap
+        self._table: Optional[ApiTable] = None
+        self._signature = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self.reloads = 0
+
+    def table(self) -> ApiTable:
+        """Bảng hiện tại; load lần đầu, load lại nếu file đổi (tối đa 1 lần / check_interval)."""
+        if self._table is None or time.monotonic() - self._last_check >= self.check_interval:
+            self.refresh()
+        return self._table
+
+    def refresh(self, force: bool = False) -> bool:
+        """stat() file API; load lại nếu đổi. Returns True nếu đã thay bảng."""
+        with self._lock:
+            self._last_check = time.monotonic()
+            signature = self._stat()
+            if not force and self._table is not None and signature == self._signature:
+                return False
+            df, path = _read_api_frame(self.paths)
+            table = ApiTable.from_frame(df, source=path.name) if df is not None else ApiTable.empty()
+            if self._table is not None:
+                self.reloads += 1
+            self._table, self._signature = table, signature
+            return True
+
+    def row(self, ts_ref) -> pd.Series:
+        """Dữ liệu API gần ts_ref nhất (như load_api_row cũ)."""
+        return pd.Series(self.table().lookup(ts_ref, self.max_gap))
+
+    def rows(self, ts) -> pd.DataFrame:
+        """Tra cứu nhiều timestamp 1 lần → DataFrame (1 dòng / timestamp)."""
+        return pd.DataFrame(self.table().lookup_many(ts, self.max_gap), columns=list(API_COLUMNS))
+
+    def _stat(self):
+        # File đầu tiên tồn tại quyết định nguồn → chữ ký gồm cả file nào đang có
+        for path in self.paths:
+            try:
+                st = path.stat()
+                return (str(path), st.st_mtime_ns, st.st_size)
+            except FileNotFoundError:
+                continue
+        return None
+
+
+_API_CACHE: Optional[ApiCache] = None
+_API_CACHE_LOCK = threading.Lock()
+
+
+def get_api_cache() -> ApiCache:
+    """ApiCache dùng chung toàn process (data/ của project)."""
+    global _API_CACHE
+    if _API_CACHE is None:
+        with _API_CACHE_LOCK:
+            if _API_CACHE is None:
+                _API_CACHE = ApiCache()
+    return _API_CACHE
+
+
+__all__ = [
+    "API_COLUMNS",
+    "API_DEFAULTS",
+    "API_MAX_GAP",
+    "ApiTable",
+    "ApiCache",
+    "get_api_cache",
+]
@@ -0,0 +1,488 @@
+"""
+Asyncio Runtime cho AI Service - 1 event loop thay cho thread theo từng việc.
+
+Runtime threads (AIService.start): paho loop_start() + thread pre-irrigation
+sleep 60s + main loop sleep 1s. Runtime asyncio:
+- MQTT: paho client chạy trên event loop qua socket callbacks
+  (add_reader / add_writer + loop_misc định kỳ) → không có network thread
+- Ingest: AsyncIngestQueue (bounded, drop policy như IngestPipeline) + N consumer task
+- Lịch tưới: task refresh định kỳ (SCHEDULE_REFRESH_HOURS) + theo dõi file lịch
+- Slot trigger: mỗi slot 1 timer loop.call_at(forecast_trigger_ts) thay vì poll
+  mỗi phút → hàng nghìn slot / device chỉ là hàng nghìn timer handle; các timer
+  nổ trong cùng SLOT_BATCH_WINDOW giây được gom thành 1 batch inference
+- Predict (CPU-bound: feature + XGBoost) chạy trong ThreadPoolExecutor
+  (XGBoost nhả GIL khi predict), publish trên event loop; gồm cả rolling nowcast
+  theo reading (RollingNowcaster.submit) → consumer ingest không predict trên loop
+
+Chạy:
+    python src/ai_service.py --runtime asyncio
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import signal
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+import paho.mqtt.client as mqtt
+
+from ingest_pipeline import DROP_POLICIES
+
+logger = logging.getLogger(__name__)
+
+# ===== Runtime config =====
+PREDICT_EXECUTOR_WORKERS = int(os.getenv("PREDICT_EXECUTOR_WORKERS", 2))
+SCHEDULE_REFRESH_HOURS = float(os.getenv("SCHEDULE_REFRESH_HOURS", 24))
+HOUSEKEEPING_INTERVAL = 60.0          # giây (evict idle + metrics + reload lịch)
+SLOT_TRIGGER_GRACE_MINUTES = 5        # giống runtime threads: trễ ≤ 5 phút vẫn chạy
+SLOT_BATCH_WINDOW = float(os.getenv("SLOT_BATCH_WINDOW", 1.0))  # giây gom slot trigger cùng lúc
+RECONNECT_DELAY_MIN = 1.0
+RECONNECT_DELAY_MAX = 60.0
+
+
+class AsyncioMqttHelper:
+    """
+    Gắn paho client vào asyncio event loop (không dùng loop_start / loop_forever).
+
+    paho báo socket mở / cần ghi qua callback → add_reader / add_writer;
+    loop_misc() chạy mỗi giây cho keepalive + retry QoS.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, client: mqtt.Client):
+        self.loop = loop
+        self.client = client
+        self.client.on_socket_open = self.on_socket_open
+        self.client.on_socket_close = self.on_socket_close
+        self.client.on_socket_register_write = self.on_socket_register_write
+        self.client.on_socket_unregister_write = self.on_socket_unregister_write
+        self.misc_task: Optional[asyncio.Task] = None
+
+    def on_socket_open(self, client, userdata, sock):
+        self.loop.add_reader(sock, client.loop_read)
+        if self.misc_task is None or self.misc_task.done():
+            self.misc_task = self.loop.create_task(self._misc_loop())
+
+    def on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+        self.loop.remove_writer(sock)
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+
+    async def _misc_loop(self):
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                break
+
+
+class AsyncIngestQueue:
+    """
+    Bounded ingest queue trên event loop (cùng interface với IngestPipeline).
+
+    submit() được gọi từ on_message (đang ở event loop) → O(1), không await.
+    Không thể block callback trên event loop → policy "block" xử lý như drop_newest.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Any], None],
+        consumers: int = 2,
+        max_queue: int = 10_000,
+        drop_policy: str = "drop_oldest",
+    ):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"drop_policy must be one of {DROP_POLICIES}, got {drop_policy!r}")
+        if drop_policy == "block":
+            logger.warning("Ingest policy 'block' is not supported on the asyncio runtime, using drop_newest")
+        self.handler = handler
+        self.consumers = max(1, consumers)
+        self.max_queue = max_queue
+        self.drop_policy = drop_policy
+        self._queue: "deque[tuple[float, Any]]" = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._idle: Optional[asyncio.Event] = None
+        self._tasks: list = []
+        self._closed = False
+        self._in_flight = 0
+
+        # Metrics (cùng key với IngestPipeline.stats)
+        self._started_at = time.monotonic()
+        self._submitted = 0
+        self._processed = 0
+        self._failed = 0
+        self._dropped_newest = 0
+        self._dropped_oldest = 0
+        self._max_depth = 0
+        self._age_total = 0.0
+        self._age_max = 0.0
+        self._age_last = 0.0
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def start(self) -> "AsyncIngestQueue":
+        """Tạo consumer task (phải gọi trong event loop)."""
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks = [asyncio.ensure_future(self._consumer()) for _ in range(self.consumers)]
+        return self
+
+    def submit(self, item: Any) -> bool:
+        if self._closed:
+            self._dropped_newest += 1
+            return False
+        if len(self._queue) >= self.max_queue:
+            if self.drop_policy == "drop_oldest":
+                self._queue.popleft()
+                self._dropped_oldest += 1
+            else:
+                self._dropped_newest += 1
+                return False
+        self._queue.append((time.monotonic(), item))
+        self._submitted += 1
+        self._max_depth = max(self._max_depth, len(self._queue))
+        if self._wakeup is not None:
+            self._idle.clear()
+            self._wakeup.set()
+        return True
+
+    async def _consumer(self):
+        while True:
+            if not self._queue:
+                if not self._in_flight:
+                    self._idle.set()
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            enqueued_at, item = self._queue.popleft()
+            age = time.monotonic() - enqueued_at
+            self._in_flight += 1
+            try:
+                self.handler(item)
+            except Exception as e:
+                self._failed += 1
+                logger.error(f"[ingest] handler failed: {e}", exc_info=True)
+            finally:
+                self._in_flight -= 1
+            self._processed += 1
+            self._age_total += age
+            self._age_last = age
+            self._age_max = max(self._age_max, age)
+            # Nhường event loop cho MQTT I/O + timer giữa các message
+            await asyncio.sleep(0)
+
+    async def drain(self, timeout: Optional[float] = 10.0) -> bool:
+        """Đợi xử lý hết queue. Returns True nếu queue đã rỗng."""
+        if self._idle is None:
+            return not self._queue
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return not self._queue
+
+    def close(self, drain: bool = True, timeout: Optional[float] = None):
+        """Ngừng nhận item và huỷ consumer (drain bằng `await drain()` trước đó)."""
+        self._closed = True
+        if not drain:
+            self._dropped_oldest += len(self._queue)
+            self._queue.clear()
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        return {
+            "depth": len(self._queue),
+            "max_depth": self._max_depth,
+            "capacity": self.max_queue,
+            "in_flight": self._in_flight,
+            "submitted": self._submitted,
+            "processed": self._processed,
+            "failed": self._failed,
+            "dropped": self._dropped_newest + self._dropped_oldest,
+            "dropped_newest": self._dropped_newest,
+            "dropped_oldest": self._dropped_oldest,
+            "oldest_age_ms": (now - self._queue[0][0]) * 1000 if self._queue else 0.0,
+            "age_last_ms": self._age_last * 1000,
+            "age_avg_ms": (self._age_total / self._processed * 1000) if self._processed else 0.0,
+            "age_max_ms": self._age_max * 1000,
+            "processed_per_sec": self._processed / max(now - self._started_at, 1e-9),
+        }
+
+
+def _parse_utc(ts_str: str) -> datetime:
+    """ISO 'YYYY-MM-DDTHH:MM:SSZ' (lịch tưới) → datetime naive UTC."""
+    return datetime.fromisoformat(ts_str.replace("Z", ""))
+
+
+class AsyncAIRuntime:
+    """
+    Chạy AIService trên 1 asyncio event loop.
+
+    Dùng lại logic của AIService (handle_sensor_data, generate_schedule,
+    run_slot_checks, publish_*, housekeeping, shutdown); chỉ thay cách điều phối.
+    """
+
+    def __init__(
+        self,
+        service,
+        executor_workers: int = PREDICT_EXECUTOR_WORKERS,
+        schedule_refresh_hours: float = SCHEDULE_REFRESH_HOURS,
+        housekeeping_interval: float = HOUSEKEEPING_INTERVAL,
+    ):
+        self.service = service
+        self.executor = ThreadPoolExecutor(max_workers=executor_workers, thread_name_prefix="predict")
+        self.schedule_refresh_seconds = schedule_refresh_hours * 3600
+        self.housekeeping_interval = housekeeping_interval
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.mqtt: Optional[AsyncioMqttHelper] = None
+        self._stop: Optional[asyncio.Event] = None
+        self._tasks: list = []
+        self._slot_timers: Dict[str, asyncio.TimerHandle] = {}
+        self._slot_tasks: set = set()
+        self._due_slots: list = []
+        self._due_flush: Optional[asyncio.TimerHandle] = None
+        self._schedule_mtime: Optional[float] = None
+        self.slots_triggered = 0
+
+    # ----- Lifecycle -----
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                self.loop.add_signal_handler(sig, self._stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass  # Windows / không phải main thread
+
+        svc = self.service
+        svc.log_banner("asyncio")
+        await self.loop.run_in_executor(self.executor, svc.warm_start_buffers)
+        if not svc.fast_start:
+            await self.loop.run_in_executor(self.executor, svc.warm_up)
+
+        # Ingest trên event loop thay cho IngestPipeline (thread)
+        pipeline = svc.ingest
+        svc.ingest = AsyncIngestQueue(
+            svc.process_sensor_message,
+            consumers=pipeline.workers,
+            max_queue=pipeline.max_queue,
+            drop_policy=pipeline.drop_policy,
+        ).start()
+        # Rolling nowcast: predict trong executor, publish quay về event loop
+        if svc.rolling is not None:
+            svc.rolling.submit = self._submit_predict
+            svc.rolling.publish = self._publish_rolling
+
+        # 1. Lịch tưới (pandas, CPU-bound) trong executor, publish trên loop
+        #    (fast start: sau khi kết nối, xem _warm_up)
+        if not svc.fast_start:
+            await self._refresh_schedule()
+
+        # 2. MQTT trên event loop
+        self.mqtt = AsyncioMqttHelper(self.loop, svc.client)
+        logger.info("\n🔌 Connecting to MQTT broker...")
+        try:
+            svc.connect_mqtt()
+        except Exception as e:
+            logger.error(f"Failed to connect to MQTT: {e}")
+            svc.ingest.close(drain=False)
+            svc.shutdown()
+            self.executor.shutdown(wait=False)
+            return
+        svc.running = True
+
+        self._tasks = [
+            asyncio.ensure_future(self._reconnect_loop()),
+            asyncio.ensure_future(self._schedule_refresh_loop()),
+            asyncio.ensure_future(self._housekeeping_loop()),
+        ]
+        if svc.fast_start:
+            self._tasks.append(asyncio.ensure_future(self._warm_up()))
+        logger.info("\n" + "-" * 70)
+        logger.info("✅ AI Service is running (asyncio).")
+        logger.info(f"   - Ingest: {svc.ingest.consumers} consumer task(s), capacity {svc.ingest.max_queue}")
+        logger.info(f"   - Predict executor: {self.executor._max_workers} thread(s)")
+        logger.info(f"   - Slot timers armed: {len(self._slot_timers)}")
+        logger.info("   Press Ctrl+C to stop.")
+        logger.info("-" * 70 + "\n")
+
+        try:
+            await self._stop.wait()
+            logger.info("\n⚠️  Service stopped by user")
+        finally:
+            await self._shutdown()
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+
+    def _submit_predict(self, fn: Callable, *args) -> None:
+        try:
+            self.executor.submit(fn, *args)
+        except RuntimeError:
+            logger.debug("Predict executor shut down, skipping task")
+
+    def _publish_rolling(self, topic: str, payload: str) -> None:
+        """Gọi từ thread executor → publish trên event loop (paho gắn vào loop)."""
+        self.loop.call_soon_threadsafe(self.service.publish_rolling, topic, payload)
+
+    async def _shutdown(self):
+        svc = self.service
+        svc.running = False
+        for handle in self._slot_timers.values():
+            handle.cancel()
+        self._slot_timers.clear()
+        if self._due_flush is not None:
+            self._due_flush.cancel()
+            self._due_flush = None
+        for task in self._tasks:
+            task.cancel()
+        # Slot check đang chạy: đợi publish xong
+        if self._slot_tasks:
+            await asyncio.wait(self._slot_tasks, timeout=30)
+        await svc.ingest.drain(timeout=10)
+        svc.client.disconnect()
+        if self.mqtt is not None and self.mqtt.misc_task is not None:
+            self.mqtt.misc_task.cancel()
+        svc.ingest.close(drain=True)
+        await self.loop.run_in_executor(self.executor, svc.shutdown)
+        self.executor.shutdown(wait=True)
+        logger.info(f"Slot checks triggered: {self.slots_triggered}")
+
+    # ----- MQTT reconnect -----
+    async def _reconnect_loop(self):
+        """Thay cho auto-reconnect của loop_start(): backoff 1s → 60s."""
+        delay = RECONNECT_DELAY_MIN
+        while self.service.running:
+            await asyncio.sleep(delay)
+            if self.service.client.is_connected():
+                delay = RECONNECT_DELAY_MIN
+                continue
+            if self.mqtt.misc_task is not None and not self.mqtt.misc_task.done():
+                continue  # đang kết nối (chờ CONNACK)
+            try:
+                logger.info("Attempting to reconnect...")
+                self.service.client.reconnect()
+            except OSError as e:
+                logger.warning(f"Reconnect failed: {e}")
+                delay = min(delay * 2, RECONNECT_DELAY_MAX)
+
+    async def _warm_up(self):
+        """Fast start: import nặng + load model (executor) rồi mới sinh lịch tưới."""
+        await self.loop.run_in_executor(self.executor, self.service.warm_up)
+        try:
+            await self._refresh_schedule()
+        except Exception as e:
+            logger.error(f"Error refreshing schedule: {e}", exc_info=True)
+
+    # ----- Lịch tưới -----
+    async def _refresh_schedule(self):
+        schedule = await self.loop.run_in_executor(self.executor, self.service.generate_schedule)
+        if schedule:
+            self.service.client.publish(
+                self.service.TOPIC_SCHEDULE, json.dumps(schedule, ensure_ascii=False), qos=1
+            )
+            logger.info(f"✓ Published schedule to {self.service.TOPIC_SCHEDULE}")
+            logger.info(f"   Total slots: {len(schedule.get('slots', []))}")
+        await self._arm_slot_timers()
+
+    async def _schedule_refresh_loop(self):
+        if self.schedule_refresh_seconds <= 0:
+            return
+        while True:
+            await asyncio.sleep(self.schedule_refresh_seconds)
+            try:
+                await self._refresh_schedule()
+            except Exception as e:
+                logger.error(f"Error refreshing schedule: {e}", exc_info=True)
+
+    async def _arm_slot_timers(self):
+        """(Re)load file lịch khi đổi mtime → 1 timer call_at cho mỗi slot chưa check."""
+        mtime = self.service.schedule_mtime()
+        if mtime is None or mtime == self._schedule_mtime:
+            return
+        self._schedule_mtime = mtime
+        slots = await self.loop.run_in_executor(self.executor, self.service.pending_slots)
+
+        now_utc = datetime.utcnow()
+        now_loop = self.loop.time()
+        armed = 0
+        for slot in slots:
+            slot_id = slot.get("start_ts", "")
+            trigger_ts_str = slot.get("forecast_trigger_ts", "")
+            if not slot_id or not trigger_ts_str or slot.get("forecast_checked_at"):
+                continue
+            if slot_id in self._slot_timers:
+                continue
+            delay = (_parse_utc(trigger_ts_str) - now_utc).total_seconds()
+            if delay < -SLOT_TRIGGER_GRACE_MINUTES * 60:
+                continue  # đã quá thời điểm trigger
+            self._slot_timers[slot_id] = self.loop.call_at(
+                now_loop + max(0.0, delay), self._on_slot_timer, slot
+            )
+            armed += 1
+        if armed:
+            logger.info(f"⏲️  Armed {armed} slot trigger(s) ({len(self._slot_timers)} pending)")
+
+    def _on_slot_timer(self, slot: Dict):
+        self._slot_timers.pop(slot.get("start_ts", ""), None)
+        # Gom các slot trigger gần nhau → 1 lần run_slot_checks (batch inference)
+        self._due_slots.append(slot)
+        if self._due_flush is None:
+            self._due_flush = self.loop.call_later(SLOT_BATCH_WINDOW, self._flush_due_slots)
+
+    def _flush_due_slots(self):
+        slots, self._due_slots, self._due_flush = self._due_slots, [], None
+        task = self.loop.create_task(self._run_slots(slots))
+        self._slot_tasks.add(task)
+        task.add_done_callback(self._slot_tasks.discard)
+
+    async def _run_slots(self, slots: list):
+        try:
+            self.slots_triggered += len(slots)
+            # Feature + predict + ghi lịch: executor; publish: event loop
+            outputs = await self.loop.run_in_executor(self.executor, self.service.run_slot_checks, slots)
+            for forecast_payload, forecast_result in outputs:
+                self.service.publish_forecast(forecast_payload, forecast_result)
+        except Exception as e:
+            logger.error(f"Error in pre-irrigation check: {e}", exc_info=True)
+
+    # ----- Định kỳ -----
+    async def _housekeeping_loop(self):
+        while True:
+            await asyncio.sleep(self.housekeeping_interval)
+            try:
+                self.service.housekeeping()
+                await self._arm_slot_timers()
+            except Exception as e:
+                logger.error(f"Error in housekeeping: {e}", exc_info=True)
+
+
+def run_async(service) -> None:
+    """Entry point: chạy service trên asyncio cho đến Ctrl+C / SIGTERM."""
+    asyncio.run(AsyncAIRuntime(service).run())
+
+
+__all__ = [
+    "AsyncioMqttHelper",
+    "AsyncIngestQueue",
+    "AsyncAIRuntime",
+    "run_async",
+]
@@ -0,0 +1,189 @@
+"""
+Batch Inference - Chạy nowcast + amount cho nhiều dòng feature trong 1 lần gọi model.
+
+Khi nhiều slot / device cùng trigger trong 1 phút, mỗi slot trước đây tạo
+1 DMatrix 1×13 và gọi model riêng (overhead cố định của xgboost lặp lại N lần).
+Ở đây gom các feature vector thành 1 ma trận (N, 13) → 1 lần predict_proba
+cho nowcast + 1 lần predict cho amount, rồi trả kết quả theo đúng thứ tự dòng.
+
+Models lấy từ model_registry (1 bundle cho cả batch → cùng phiên bản).
+
+Cascade (hurdle): amount chỉ chạy cho các dòng có xác suất mưa >= AMOUNT_GATE;
+dòng dưới gate nhận AMOUNT_GATE_FILL mm (mặc định 0 - gần như chắc chắn không
+mưa). CASCADE_STATS đếm số dòng / lần gọi amount đã bỏ qua;
+bench_amount_cascade.py đo ảnh hưởng lên MAE theo từng gate.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from feature_engineering import FeatureVector
+from model_registry import ModelBundle, get_registry
+
+logger = logging.getLogger(__name__)
+
+# Xác suất mưa tối thiểu để chạy amount model (0 = luôn chạy)
+AMOUNT_GATE = float(os.getenv("AMOUNT_GATE", 0.2))
+# Lượng mưa (mm) trả về cho dòng dưới gate
+AMOUNT_GATE_FILL = float(os.getenv("AMOUNT_GATE_FILL", 0.0))
+
+
+@dataclass
+class BatchPrediction:
+    """Kết quả 1 batch: mảng theo thứ tự dòng của X."""
+
+    probability: np.ndarray
+    label: np.ndarray
+    amount_mm: Optional[np.ndarray]
+    threshold: float
+    model_version: str
+    # True = amount từ model, False = AMOUNT_GATE_FILL (dưới gate); None nếu không có amount
+    amount_from_model: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.probability)
+
+
+def stack_features(vectors: Sequence[FeatureVector]) -> np.ndarray:
+    """Danh sách FeatureVector → ma trận (N, 13) float32 (thứ tự FEATURE_NAMES)."""
+    if not vectors:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.array([fv.to_list() for fv in vectors], dtype=np.float32)
+
+
+def predict_amount(amount_model, X: np.ndarray) -> Optional[np.ndarray]:
+    """Lượng mưa 60 phút (mm) cho từng dòng; None nếu không có model / lỗi."""
+    if amount_model is None:
+        return None
+    try:
+        import xgboost as xgb
+
+        if isinstance(amount_model, xgb.Booster):
+            # Booster trần (không qua model_registry) → predict trên NumPy, không DMatrix
+            from wrappers import XGBAmountRegressor
+            amount_model = XGBAmountRegressor(amount_model)
+        return np.asarray(amount_model.predict(X), dtype=float).reshape(-1)
+    except Exception as e:
+        logger.warning(f"Amount model failed on batch of {len(X)}: {e}")
+        return None
+
+
+class CascadeStats:
+    """Bộ đếm cascade amount (thread-safe, dùng chung toàn process)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.rows = 0            # dòng đi qua cascade
+        self.amount_rows = 0     # dòng chạy amount model
+        self.batches = 0
+        self.amount_calls = 0    # lần gọi amount model
+        self.skipped_calls = 0   # batch không dòng nào qua gate → không gọi model
+
+    def record(self, rows: int, amount_rows: int) -> None:
+        with self._lock:
+            self.rows += rows
+            self.amount_rows += amount_rows
+            self.batches += 1
+            if amount_rows:
+                self.amount_calls += 1
+            else:
+                self.skipped_calls += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            rows, amount_rows = self.rows, self.amount_rows
+            return {
+                "gate": AMOUNT_GATE,
+                "rows": rows,
+                "amount_rows": amount_rows,
+                "skipped_rows": rows - amount_rows,
+                "skipped_rows_pct": (rows - amount_rows) / rows * 100 if rows else 0.0,
+                "batches": self.batches,
+                "amount_calls": self.amount_calls,
+                "skipped_calls": self.skipped_calls,
+            }
+
+
+CASCADE_STATS = CascadeStats()
+
+
+def cascade_amount(
+    amount_model,
+    X: np.ndarray,
+    probability: np.ndarray,
+    gate: float = AMOUNT_GATE,
+    fill: float = AMOUNT_GATE_FILL,
+) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+    """
+    Amount (mm) chỉ cho các dòng probability >= gate, còn lại = fill.
+
+    Returns: (amount_mm, from_model) - (None, None) nếu không có model / lỗi.
+    """
+    if amount_model is None:
+        return None, None
+    from_model = np.asarray(probability) >= gate
+    amount_rows = int(from_model.sum())
+    CASCADE_STATS.record(len(from_model), amount_rows)
+    amount_mm = np.full(len(from_model), fill, dtype=float)
+    if amount_rows:
+        values = predict_amount(amount_model, X if amount_rows == len(X) else X[from_model])
+        if values is None:
+            return None, None
+        amount_mm[from_model] = values
+    return amount_mm, from_model
+
+
+def predict_batch(
+    X: np.ndarray,
+    models: Optional[ModelBundle] = None,
+    amount_gate: float = AMOUNT_GATE,
+) -> BatchPrediction:
+    """
+    Nowcast (xác suất mưa 60 phút) + amount cho ma trận X (N, 13).
+
+    Args:
+        X: feature matrix (thứ tự FEATURE_NAMES)
+        models: ModelBundle (mặc định: get_registry().get())
+        amount_gate: xác suất tối thiểu để chạy amount model (0 = mọi dòng)
+    """
+    models = models or get_registry().get()
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    if X.ndim == 1:
+        X = X.reshape(1, -1)
+    threshold = models.threshold
+    if not len(X):
+        empty = np.empty(0)
+        return BatchPrediction(empty, empty.astype(int), None, threshold, models.version)
+
+    probability = np.asarray(models.nowcast.predict_proba(X), dtype=float)[:, 1]
+    amount_mm, from_model = cascade_amount(models.amount, X, probability, gate=amount_gate)
+    return BatchPrediction(
+        probability=probability,
+        label=(probability >= threshold).astype(int),
+        amount_mm=amount_mm,
+        threshold=threshold,
+        model_version=models.version,
+        amount_from_model=from_model,
+    )
+
+
+__all__ = [
+    "AMOUNT_GATE",
+    "AMOUNT_GATE_FILL",
+    "BatchPrediction",
+    "CASCADE_STATS",
+    "cascade_amount",
+    "stack_features",
+    "predict_amount",
+    "predict_batch",
+]
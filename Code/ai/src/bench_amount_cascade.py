@@ -0,0 +1,109 @@
+"""
+Benchmark: cascade amount (batch_inference.cascade_amount) theo từng gate xác suất.
+
+Với mỗi gate:
+- skipped %  : tỉ lệ dòng không chạy amount model (xác suất < gate)
+- amount ms  : thời gian amount cho cả tập (chỉ các dòng qua gate)
+- Δ vs full  : MAE / max |Δ| giữa amount có cascade và amount chạy mọi dòng
+- MAE        : so với nhãn rain_amount_next_60_mm nếu có --labels
+               (file nhãn của train_xgb.ipynb: ts, device_id, rain_amount_next_60_mm)
+
+Feature: cửa sổ 12 bản ghi từ sensor_raw_60d*.csv + API cache (như khi serving).
+
+Chạy:
+    python src/bench_amount_cascade.py [--gates 0,0.05,0.1,0.2,0.3,0.5,0.675] [--labels data/labels_rain_60d_fixed.csv]
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from api_cache import API_COLUMNS, get_api_cache
+from batch_inference import AMOUNT_GATE, AMOUNT_GATE_FILL, cascade_amount, predict_amount, stack_features
+from feature_engineering import compute_feature_from_window
+from model_registry import get_registry
+from sensor_history import get_history, to_epoch_seconds
+from window_provider import SENSOR_REAL, SENSOR_SYNTH
+
+ROOT = Path(__file__).resolve().parents[1]
+LABEL_COLUMN = "rain_amount_next_60_mm"
+
+
+def _features(sensor_path: Path, ends: np.ndarray, devices) -> np.ndarray:
+    """Feature cho từng (thời điểm, device): cửa sổ as-of + dòng API gần nhất."""
+    history = get_history(sensor_path)
+    api = get_api_cache().table().lookup_many(ends)
+    vectors = [
+        compute_feature_from_window(
+            history.asof(int(ts), device_id=device, n=12),
+            dict(zip(API_COLUMNS, api[k].tolist())),
+            interval_seconds=300,
+        )
+        for k, (ts, device) in enumerate(zip(ends, devices))
+    ]
+    return stack_features(vectors)
+
+
+def _load_rows(sensor_path: Path, labels: Path, n: int, rng: np.random.Generator):
+    """(X, y) - y = None nếu không có file nhãn."""
+    if labels and labels.exists():
+        df = pd.read_csv(labels, parse_dates=["ts"])
+        if n and len(df) > n:
+            df = df.sample(n, random_state=0).sort_values("ts")
+        ends = to_epoch_seconds(df["ts"])
+        X = _features(sensor_path, ends, df["device_id"].tolist())
+        return X, df[LABEL_COLUMN].to_numpy(dtype=float)
+    history = get_history(sensor_path).get(None)
+    idx = np.sort(rng.integers(12, len(history.ts), size=n))
+    return _features(sensor_path, history.ts[idx], [None] * n), None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Amount cascade: skipped calls vs MAE per probability gate")
+    parser.add_argument("--gates", type=str, default="0,0.05,0.1,0.2,0.3,0.5,0.675")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--labels", type=str, default=str(ROOT / "data" / "labels_rain_60d_fixed.csv"))
+    args = parser.parse_args()
+
+    sensor_path = SENSOR_REAL if SENSOR_REAL.exists() else SENSOR_SYNTH
+    if not sensor_path.exists():
+        print("❌ No sensor CSV (sensor_raw_60d*.csv) in data/")
+        return
+
+    models = get_registry().get()
+    X, y = _load_rows(sensor_path, Path(args.labels), args.rows, np.random.default_rng(0))
+    probability = models.nowcast.predict_proba(X)[:, 1]
+    predict_amount(models.amount, X[:8])  # warm-up
+    t0 = time.perf_counter()
+    full = predict_amount(models.amount, X)
+    full_ms = (time.perf_counter() - t0) * 1000
+
+    print("=" * 86)
+    print(f"🌧️  AMOUNT CASCADE ({len(X)} rows from {sensor_path.name}, model {models.version}, "
+          f"fill {AMOUNT_GATE_FILL} mm, current gate {AMOUNT_GATE})")
+    print("=" * 86)
+    if y is None:
+        print("   (no labels file → MAE vs truth not available, showing deviation from ungated amount)")
+    else:
+        print(f"   labels: {Path(args.labels).name} | MAE ungated = {np.mean(np.abs(full - y)):.4f} mm")
+    print(f"   {'gate':>6} | {'skipped %':>9} | {'amount ms':>9} | {'MAE vs full':>11} {'max |Δ|':>8} | "
+          f"{'MAE vs y':>8} {'ΔMAE':>8}")
+    for gate in [float(g) for g in args.gates.split(",") if g]:
+        t0 = time.perf_counter()
+        gated, from_model = cascade_amount(models.amount, X, probability, gate=gate)
+        gated_ms = (time.perf_counter() - t0) * 1000
+        skipped = 100 * (1 - from_model.mean())
+        dev = np.abs(gated - full)
+        line = (f"   {gate:>6.3f} | {skipped:>8.1f}% | {gated_ms:>9.1f} | {dev.mean():>11.4f} {dev.max():>8.3f} |")
+        if y is not None:
+            mae = np.mean(np.abs(gated - y))
+            line += f" {mae:>8.4f} {mae - np.mean(np.abs(full - y)):>+8.4f}"
+        print(line)
+    print(f"   (ungated amount: {full_ms:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
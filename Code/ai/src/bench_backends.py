@@ -0,0 +1,129 @@
+"""
+Benchmark: các inference backend (predictors.py) trên models/xgb_nowcast.pkl.
+
+Mỗi backend chạy trong 1 process riêng (RSS / thời gian load không lẫn nhau):
+- load ms   : joblib.load + dựng predictor (treelite: lần đầu gồm cả biên dịch .so)
+- RSS MB    : peak RSS của process sau load + predict (và phần tăng so với lúc import xong)
+- 1 row     : p50 / p99 µs / lần gọi predict_proba 1×13
+- batch     : rows/s cho 1 lần gọi --batch dòng
+- max |Δp|  : so với backend xgboost trên cùng dữ liệu
+
+Chạy:
+    python src/bench_backends.py [--backends xgboost,numpy,onnx,treelite] [--model nowcast|amount]
+"""
+
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from predictors import BACKENDS
+
+ROOT = Path(__file__).resolve().parents[1]
+N_FEATURES = 13
+
+
+def _rss_mb() -> float:
+    """Peak RSS của process (Linux: ru_maxrss tính bằng KB)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _data(rows: int) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    X = rng.normal(0, 2, size=(rows, N_FEATURES)).astype(np.float32)
+    X[rng.random(X.shape) < 0.02] = np.nan
+    return X
+
+
+def _latencies(fn, iterations: int) -> np.ndarray:
+    for _ in range(50):
+        fn()
+    out = np.empty(iterations)
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        out[i] = (time.perf_counter() - t0) * 1e6
+    return out
+
+
+def worker(backend: str, model_name: str, iterations: int, batch: int) -> dict:
+    """Chạy trong process con: load 1 model với 1 backend, đo, trả dict."""
+    import joblib
+    import xgboost  # noqa: F401  (import chung cho mọi backend: pickle chứa xgb.Booster)
+
+    import model_registry
+    from predictors import backend_of, make_amount_predictor, make_nowcast_predictor
+
+    rss_import = _rss_mb()
+    t0 = time.perf_counter()
+    if model_name == "nowcast":
+        model = model_registry._load_nowcast(model_registry.MODEL_DIR / model_registry.NOWCAST_FILE)
+        model = make_nowcast_predictor(model, backend)
+        predict = lambda X: model.predict_proba(X)[:, 1]  # noqa: E731
+    else:
+        model = model_registry._load_amount(model_registry.MODEL_DIR / model_registry.AMOUNT_FILE)
+        model = make_amount_predictor(model, backend)
+        predict = model.predict
+    load_ms = (time.perf_counter() - t0) * 1000
+
+    X = _data(batch)
+    one = X[:1].copy()
+    lat = _latencies(lambda: predict(one), iterations)
+    batch_us = _latencies(lambda: predict(X), max(20, iterations // 50))
+    return {
+        "backend": backend_of(model),
+        "load_ms": load_ms,
+        "rss_mb": _rss_mb(),
+        "rss_delta_mb": _rss_mb() - rss_import,
+        "p50_us": float(np.percentile(lat, 50)),
+        "p99_us": float(np.percentile(lat, 99)),
+        "batch_rows_per_s": batch / float(np.median(batch_us)) * 1e6,
+        "pred": predict(X[:2000]).tolist(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inference backend benchmark (xgboost / numpy / onnx / treelite)")
+    parser.add_argument("--backends", type=str, default=",".join(BACKENDS))
+    parser.add_argument("--model", choices=["nowcast", "amount"], default="nowcast")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=10_000)
+    parser.add_argument("--worker", type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(worker(args.worker, args.model, args.iterations, args.batch)))
+        return
+
+    print("=" * 86)
+    print(f"⏱️  INFERENCE BACKENDS (models/xgb_{args.model}.pkl, 1-row × {args.iterations}, batch {args.batch})")
+    print("=" * 86)
+    print(f"   {'backend':<9} | {'load ms':>8} | {'RSS MB':>7} {'(+load)':>8} | "
+          f"{'1-row p50':>9} {'p99 µs':>8} | {'batch rows/s':>12} | max |Δ| vs xgboost")
+    reference = None
+    for backend in [b for b in args.backends.split(",") if b]:
+        proc = subprocess.run(
+            [sys.executable, __file__, "--worker", backend, "--model", args.model,
+             "--iterations", str(args.iterations), "--batch", str(args.batch)],
+            capture_output=True, text=True, cwd=ROOT,
+        )
+        if proc.returncode != 0:
+            print(f"   {backend:<9} | ❌ failed: {proc.stderr.strip().splitlines()[-1:]}")
+            continue
+        r = json.loads(proc.stdout.strip().splitlines()[-1])
+        pred = np.asarray(r["pred"])
+        if reference is None and r["backend"] == "xgboost":
+            reference = pred
+        diff = f"{float(np.max(np.abs(pred - reference))):.1e}" if reference is not None else "-"
+        name = backend if r["backend"] == backend else f"{backend}→{r['backend']}"
+        print(f"   {name:<9} | {r['load_ms']:>8.0f} | {r['rss_mb']:>7.0f} {r['rss_delta_mb']:>+8.1f} | "
+              f"{r['p50_us']:>9.1f} {r['p99_us']:>8.1f} | {r['batch_rows_per_s']:>12,.0f} | {diff}")
+
+
+if __name__ == "__main__":
+    main()
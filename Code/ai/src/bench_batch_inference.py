@@ -0,0 +1,143 @@
+"""
+Benchmark: nowcast + amount theo từng dòng (1×13 mỗi lần gọi) vs batch (N×13, 1 lần gọi).
+
+- Model: models/ (qua model_registry)
+- Feature: 13 features tính từ các cửa sổ ngẫu nhiên của sensor_raw_60d*.csv
+  (không có file → feature ngẫu nhiên trong khoảng hợp lý)
+- Mỗi batch size N: rows/sec khi gọi từng dòng (đo tối đa --max-single dòng)
+  và khi gọi 1 lần cho N dòng; kiểm tra 2 cách cho cùng kết quả
+- --slots K: so sánh run_forecast_for_slot lặp K lần vs run_forecasts_for_slots (1 batch)
+
+Chạy:
+    python src/bench_batch_inference.py [--sizes 1,10,100,1000,10000] [--slots 32]
+"""
+
+import argparse
+import contextlib
+import io
+import time
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from api_cache import API_DEFAULTS
+from batch_inference import predict_amount, predict_batch, stack_features
+from feature_engineering import FEATURE_NAMES, compute_feature_from_window
+from forecast_cache import get_forecast_cache
+from model_registry import get_registry
+from sensor_history import get_history
+from window_provider import SENSOR_REAL, SENSOR_SYNTH
+
+
+def _feature_matrix(n: int, rng: np.random.Generator) -> np.ndarray:
+    """n dòng feature từ cửa sổ sensor thật (lặp lại nếu n lớn)."""
+    path = SENSOR_REAL if SENSOR_REAL.exists() else SENSOR_SYNTH
+    if not path.exists():
+        X = rng.normal(0, 1, size=(n, len(FEATURE_NAMES))).astype(np.float32)
+        X[:, 7] = rng.uniform(20, 60, n)  # soil_moist_smooth
+        return X
+
+    history = get_history(path).get(None)
+    ts = history.ts
+    base = min(n, 2000)
+    ends = rng.integers(12, len(ts), size=base)
+    vectors = [compute_feature_from_window(history.asof(int(ts[e - 1]), 12), API_DEFAULTS) for e in ends]
+    X = stack_features(vectors)
+    return np.resize(X, (n, X.shape[1]))
+
+
+def _time(fn, repeat: int = 3) -> float:
+    """Thời gian nhỏ nhất (giây) trong `repeat` lần chạy."""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def _single_rows(models, X: np.ndarray):
+    probs = np.empty(len(X))
+    for i in range(len(X)):
+        x = X[i:i + 1]
+        probs[i] = float(models.nowcast.predict_proba(x)[0, 1])
+        predict_amount(models.amount, x)
+    return probs
+
+
+def bench_model_calls(sizes, max_single: int) -> None:
+    models = get_registry().get()
+    rng = np.random.default_rng(0)
+    X_all = _feature_matrix(max(sizes), rng)
+
+    # Warm-up (lần gọi đầu cấp phát thread pool / bộ nhớ)
+    predict_batch(X_all[:8], models)
+    _single_rows(models, X_all[:8])
+
+    print(f"\n▶ Model calls (nowcast + amount), model version {models.version}")
+    print(f"   {'batch':>7} | {'per-row rows/s':>15} | {'batched rows/s':>15} | {'speedup':>8} | max |Δp|")
+    for n in sizes:
+        X = X_all[:n]
+        m = min(n, max_single)
+        single_s = _time(lambda: _single_rows(models, X[:m]), repeat=1 if m > 100 else 3) * n / m
+        batch_s = _time(lambda: predict_batch(X, models))
+        diff = float(np.max(np.abs(_single_rows(models, X[:m]) - predict_batch(X[:m], models).probability)))
+        print(f"   {n:>7} | {n / single_s:>15,.0f} | {n / batch_s:>15,.0f} | {single_s / batch_s:>7.1f}x | {diff:.1e}")
+
+
+def bench_slots(k: int) -> None:
+    from pre_irrigation_check import run_forecast_for_slot, run_forecasts_for_slots
+
+    path = SENSOR_REAL if SENSOR_REAL.exists() else SENSOR_SYNTH
+    if not path.exists():
+        print("\n⚠️  No sensor CSV → skip slot benchmark")
+        return
+    history = get_history(path)
+    first, last = history.time_range()
+    devices = history.devices()
+    start = pd.Timestamp(first, unit="s") + timedelta(hours=2)
+    span = (last - first) // 3600 - 3
+    slots = [
+        {
+            "start_ts": (start + timedelta(hours=int(i * span / k))).isoformat() + "Z",
+            "device_id": devices[i % len(devices)],
+        }
+        for i in range(k)
+    ]
+
+    # Đo đường predict thật, không phải forecast cache (slot lặp lại → trúng cache)
+    get_forecast_cache().ttl = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        run_forecasts_for_slots(slots[:2])  # warm-up (load history / API cache)
+        loop_s = _time(lambda: [run_forecast_for_slot(s) for s in slots])
+        batch_s = _time(lambda: run_forecasts_for_slots(slots))
+        single = [run_forecast_for_slot(s) for s in slots]
+        batched = run_forecasts_for_slots(slots)
+    same = all(a.get("predictions") == b.get("predictions") for a, b in zip(single, batched))
+
+    print(f"\n▶ Slot forecasts end-to-end ({k} slots, {len(devices)} device(s), {path.name})")
+    print(f"   run_forecast_for_slot × {k}: {loop_s * 1000:8.1f} ms ({loop_s / k * 1000:.2f} ms/slot)")
+    print(f"   run_forecasts_for_slots    : {batch_s * 1000:8.1f} ms ({batch_s / k * 1000:.2f} ms/slot)")
+    print(f"   speedup {loop_s / batch_s:.1f}x | same predictions: {'✓' if same else '❌'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batched nowcast/amount inference benchmark")
+    parser.add_argument("--sizes", type=str, default="1,10,100,1000,10000")
+    parser.add_argument("--max-single", type=int, default=1000,
+                        help="Số dòng tối đa đo khi gọi từng dòng (ngoại suy cho batch lớn hơn)")
+    parser.add_argument("--slots", type=int, default=32)
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    print("=" * 70)
+    print("⏱️  BATCH INFERENCE BENCHMARK")
+    print("=" * 70)
+    bench_model_calls(sizes, args.max_single)
+    if args.slots > 0:
+        bench_slots(args.slots)
+
+
+if __name__ == "__main__":
+    main()
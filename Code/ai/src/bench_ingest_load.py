@@ -0,0 +1,388 @@
+"""
+Load generator + benchmark ingest: N ESP32 ảo → LocalBroker → service cần đo.
+
+Mỗi ESP32 ảo sinh trace giống thật (theo virtual time, 5 phút / reading):
+- nhiệt độ theo chu kỳ ngày + nhiễu, độ ẩm ngược chiều nhiệt độ
+- áp suất random walk chậm, giảm trước các đợt mưa
+- độ ẩm đất giảm dần, tăng vọt khi mưa / tưới
+
+Kiểu tải (--pattern):
+- steady  : các device lệch pha đều nhau trong 1 interval
+- aligned : mọi device gửi cùng lúc mỗi interval (ESP32 deep-sleep đồng bộ NTP)
+- storm   : steady + định kỳ 1 nhóm device mất kết nối rồi gửi dồn backlog
+
+Target (--target):
+- ai_service : AIService (client inject = LocalClient, ingest queue + worker)
+- collector  : on_message của collect_data_mqtt.py (xử lý ngay trên network thread)
+
+Báo cáo: tốc độ ingest end-to-end, latency publish → xử lý xong (p50/p99/max),
+số message bị bỏ, CPU (getrusage, đã trừ CPU của thread generator) và RSS (/proc).
+Sensor store ghi vào thư mục tạm.
+
+Chạy:
+    python src/bench_ingest_load.py --devices 1000 --interval 1 --duration 20 --pattern aligned
+    python src/bench_ingest_load.py --target collector --devices 200
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import math
+import re
+import resource
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+from local_broker import LocalBroker, LocalClient
+from sensor_store import PYARROW_AVAILABLE, SensorStore
+from sensor_writer import GroupCommitWriter, SensorCsvWriter, SENSOR_LIVE_FIELDNAMES
+
+ROOT = Path(__file__).resolve().parents[1]
+TOPIC_SENSOR = "sensor/data/push"
+READING_MINUTES = 5  # virtual time giữa 2 reading của 1 device
+SEQ_RE = re.compile(rb'"seq": (\d+)')
+
+
+# ===================== ESP32 ảo =====================
+
+class VirtualESP32:
+    """Trace temp / RH / pressure / soil của 1 node, bước 5 phút virtual time."""
+
+    def __init__(self, device_id: str, seed: int, t0: datetime):
+        self.device_id = device_id
+        self.rng = np.random.default_rng(seed)
+        self.t = t0
+        self.base_temp = 27.0 + self.rng.normal(0, 1.5)
+        self.temp_amp = 3.5 + self.rng.uniform(0, 1.5)
+        self.pressure = 1008.0 + self.rng.normal(0, 2)
+        self.soil = 45.0 + self.rng.uniform(-10, 10)
+        self.rain_left = 0  # số bước còn mưa
+
+    def step(self) -> dict:
+        hour = self.t.hour + self.t.minute / 60
+        # Nóng nhất ~14h, lạnh nhất ~2h
+        diurnal = math.sin((hour - 8) / 24 * 2 * math.pi)
+
+        if self.rain_left == 0 and self.rng.random() < 0.004:
+            self.rain_left = int(self.rng.integers(6, 30))
+        raining = self.rain_left > 0
+        if raining:
+            self.rain_left -= 1
+
+        temp = self.base_temp + self.temp_amp * diurnal - (2.0 if raining else 0.0) + self.rng.normal(0, 0.2)
+        rh = 72.0 - 2.8 * (temp - self.base_temp) + (15.0 if raining else 0.0) + self.rng.normal(0, 1.0)
+        self.pressure += self.rng.normal(0, 0.05) - (0.15 if raining else 0.0) + 0.01 * (1008.0 - self.pressure)
+        self.soil += 1.2 if raining else -0.04 * max(diurnal, 0.1)
+        if self.soil < 25 and self.rng.random() < 0.05:
+            self.soil += 20.0  # tưới
+        self.soil = min(max(self.soil, 5.0), 95.0)
+
+        reading = {
+            "device_id": self.device_id,
+            "timestamp": self.t.isoformat() + "Z",
+            "temperature": round(temp, 2),
+            "humidity": round(min(max(rh, 20.0), 100.0), 2),
+            "pressure": round(self.pressure, 2),
+            "soilMoisture": round(self.soil, 1),
+        }
+        self.t += timedelta(minutes=READING_MINUTES)
+        return reading
+
+
+class FleetGenerator:
+    """Publish reading của N ESP32 ảo theo pattern; ghi thời điểm gửi theo seq."""
+
+    def __init__(self, client, devices: int, interval: float, duration: float, pattern: str,
+                 burst_every: float, burst_fraction: float, burst_backlog: int, seed: int = 0):
+        self.client = client
+        self.interval = interval
+        self.duration = duration
+        self.pattern = pattern
+        self.burst_every = burst_every
+        self.burst_fraction = burst_fraction
+        self.burst_backlog = burst_backlog
+        t0 = datetime(2024, 11, 20, 0, 0, 0)
+        self.nodes = [VirtualESP32(f"esp32-{i:05d}", seed + i, t0) for i in range(devices)]
+        max_msgs = int(devices * (duration / interval + 2) * 2) + devices * burst_backlog
+        self.sent_at = np.zeros(max_msgs, dtype=np.float64)
+        self.sent = 0
+        self.cpu_seconds = 0.0
+        self.started_at = 0.0
+        self.finished_at = 0.0
+
+    def _publish(self, node: VirtualESP32):
+        if self.sent >= len(self.sent_at):
+            return
+        reading = node.step()
+        reading["seq"] = self.sent
+        payload = json.dumps(reading)
+        self.sent_at[self.sent] = time.perf_counter()
+        self.sent += 1
+        self.client.publish(TOPIC_SENSOR, payload, qos=1)
+
+    def run(self):
+        cpu0 = time.thread_time()
+        n = len(self.nodes)
+        rng = np.random.default_rng(1)
+        # Lệch pha: steady/storm rải đều trong interval, aligned cùng lúc
+        if self.pattern == "aligned":
+            offsets = np.zeros(n)
+        else:
+            offsets = np.arange(n) / n * self.interval
+        next_due = offsets.copy()
+        offline_until = np.zeros(n)
+        backlog = np.zeros(n, dtype=np.int64)
+        next_burst = self.burst_every
+
+        self.started_at = time.perf_counter()
+        while True:
+            now = time.perf_counter() - self.started_at
+            if now >= self.duration:
+                break
+
+            if self.pattern == "storm" and now >= next_burst:
+                # 1 nhóm device mất kết nối burst_backlog interval rồi gửi dồn
+                k = max(1, int(n * self.burst_fraction))
+                for i in rng.choice(n, size=k, replace=False):
+                    offline_until[i] = now + self.burst_backlog * self.interval
+                next_burst += self.burst_every
+
+            due = np.nonzero(next_due <= now)[0]
+            for i in due:
+                next_due[i] += self.interval
+                if offline_until[i] > now:
+                    backlog[i] += 1
+                    continue
+                for _ in range(int(backlog[i]) + 1):
+                    self._publish(self.nodes[i])
+                backlog[i] = 0
+
+            sleep = float(next_due.min()) - (time.perf_counter() - self.started_at)
+            if sleep > 0:
+                time.sleep(min(sleep, 0.05))
+        self.finished_at = time.perf_counter()
+        self.cpu_seconds = time.thread_time() - cpu0
+
+
+# ===================== Service under test =====================
+
+class LatencyRecorder:
+    def __init__(self, size: int):
+        self.done_at = np.full(size, np.nan)
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def record(self, payload):
+        m = SEQ_RE.search(payload if isinstance(payload, (bytes, bytearray)) else payload.encode())
+        if m is None:
+            return
+        seq = int(m.group(1))
+        now = time.perf_counter()
+        with self._lock:
+            if seq < len(self.done_at):
+                self.done_at[seq] = now
+            self.count += 1
+
+
+class AIServiceTarget:
+    name = "ai_service"
+
+    def __init__(self, broker: LocalBroker, store_dir: Path, recorder: LatencyRecorder, sink: str):
+        from ai_service import AIService
+
+        class BenchAIService(AIService):
+            def _open_sensor_writer(self):
+                return _open_writer(store_dir, sink)
+
+            def process_sensor_message(self, payload):
+                super().process_sensor_message(payload)
+                recorder.record(payload)
+
+        self.service = BenchAIService(client=LocalClient("ai_service", broker=broker))
+
+    def start(self):
+        self.service.ingest.start()
+        self.service.connect_mqtt()
+        self.service.client.loop_start()
+
+    def stop(self):
+        self.service.client.loop_stop()
+        self.service.client.disconnect()
+        self.service.shutdown()
+
+    def dropped(self) -> int:
+        return self.service.ingest.stats()["dropped"]
+
+
+class CollectorTarget:
+    name = "collector"
+
+    def __init__(self, broker: LocalBroker, store_dir: Path, recorder: LatencyRecorder, sink: str):
+        sys.path.insert(0, str(ROOT))
+        import collect_data_mqtt as collector
+
+        self.collector = collector
+        collector.writer = _open_writer(store_dir, sink)
+        self.client = LocalClient("collector", broker=broker)
+
+        def on_message(client, userdata, msg):
+            # Collector in mỗi message ra stdout → bỏ output, vẫn tính chi phí
+            with contextlib.redirect_stdout(io.StringIO()):
+                collector.on_message(client, userdata, msg)
+            recorder.record(msg.payload)
+
+        def on_connect(client, userdata, flags, rc, properties=None):
+            client.subscribe(TOPIC_SENSOR, qos=1)
+
+        self.client.on_connect = on_connect
+        self.client.on_message = on_message
+
+    def start(self):
+        self.client.connect()
+        self.client.loop_start()
+
+    def stop(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+        self.collector.writer.close()
+
+    def dropped(self) -> int:
+        return 0  # collector không có queue: không drop, latency tăng thay vào đó
+
+
+def _open_writer(store_dir: Path, sink: str) -> GroupCommitWriter:
+    if sink == "parquet" and PYARROW_AVAILABLE:
+        return GroupCommitWriter(SensorStore(store_dir / "sensor_store"), batch_size=1024, flush_interval=30.0)
+    return SensorCsvWriter(store_dir / "sensor_live.csv", fieldnames=SENSOR_LIVE_FIELDNAMES)
+
+
+# ===================== CPU / RSS =====================
+
+def _rss_mb(field: str = "VmRSS") -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # Không có /proc (macOS, Windows): peak RSS từ getrusage
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _cpu_seconds() -> float:
+    ru = resource.getrusage(resource.RUSAGE_SELF)
+    return ru.ru_utime + ru.ru_stime
+
+
+class RssSampler(threading.Thread):
+    def __init__(self, period: float = 0.2):
+        super().__init__(daemon=True)
+        self.period = period
+        self.peak = 0.0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.peak = max(self.peak, _rss_mb())
+            self._stop_event.wait(self.period)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self.peak = max(self.peak, _rss_mb())
+
+
+# ===================== Main =====================
+
+def main():
+    parser = argparse.ArgumentParser(description="ESP32 fleet load generator + ingest benchmark")
+    parser.add_argument("--target", choices=["ai_service", "collector"], default="ai_service")
+    parser.add_argument("--devices", type=int, default=500)
+    parser.add_argument("--interval", type=float, default=1.0,
+                        help="Giây (thật) giữa 2 reading của 1 device (production: 300)")
+    parser.add_argument("--duration", type=float, default=15.0, help="Thời gian phát tải (giây)")
+    parser.add_argument("--pattern", choices=["steady", "aligned", "storm"], default="steady")
+    parser.add_argument("--burst-every", type=float, default=5.0, help="storm: chu kỳ mất kết nối (giây)")
+    parser.add_argument("--burst-fraction", type=float, default=0.2, help="storm: tỉ lệ device mất kết nối")
+    parser.add_argument("--burst-backlog", type=int, default=3, help="storm: số interval offline")
+    parser.add_argument("--sink", choices=["parquet", "csv"], default="parquet")
+    parser.add_argument("--drain-timeout", type=float, default=30.0)
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level)
+    broker = LocalBroker()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        publisher = LocalClient("fleet", broker=broker)
+        publisher.connect()
+        generator = FleetGenerator(
+            publisher, args.devices, args.interval, args.duration, args.pattern,
+            args.burst_every, args.burst_fraction, args.burst_backlog,
+        )
+        recorder = LatencyRecorder(len(generator.sent_at))
+        target_cls = AIServiceTarget if args.target == "ai_service" else CollectorTarget
+        target = target_cls(broker, Path(tmp), recorder, args.sink)
+
+        rss_before = _rss_mb()
+        target.start()
+        time.sleep(0.2)  # đợi connect + subscribe
+
+        sampler = RssSampler()
+        sampler.start()
+        cpu0 = _cpu_seconds()
+        wall0 = time.perf_counter()
+
+        gen_thread = threading.Thread(target=generator.run, name="fleet-generator")
+        gen_thread.start()
+        gen_thread.join()
+
+        # Đợi service xử lý nốt
+        deadline = time.perf_counter() + args.drain_timeout
+        while recorder.count + target.dropped() < generator.sent and time.perf_counter() < deadline:
+            time.sleep(0.05)
+        wall = time.perf_counter() - wall0
+        cpu = _cpu_seconds() - cpu0 - generator.cpu_seconds
+        sampler.stop()
+        dropped = target.dropped()
+        target.stop()
+
+    sent = generator.sent
+    done = ~np.isnan(recorder.done_at[:sent])
+    latency_ms = (recorder.done_at[:sent][done] - generator.sent_at[:sent][done]) * 1000
+    handled = int(done.sum())
+    if handled:
+        last_done = float(np.nanmax(recorder.done_at[:sent]))
+        ingest_rate = handled / max(last_done - generator.started_at, 1e-9)
+    else:
+        ingest_rate = 0.0
+    offered = sent / max(generator.finished_at - generator.started_at, 1e-9)
+
+    print("=" * 70)
+    print(f"📈 INGEST LOAD BENCHMARK: {args.target} ({args.sink})")
+    print("=" * 70)
+    print(f"   Fleet: {args.devices} devices | interval {args.interval}s | pattern {args.pattern} "
+          f"| {args.duration:.0f}s")
+    print(f"   Sent: {sent} | handled: {handled} | dropped: {dropped} | lost: {sent - handled - dropped}")
+    print(f"   Offered rate : {offered:10.1f} msg/s")
+    print(f"   Ingest rate  : {ingest_rate:10.1f} msg/s (end-to-end)")
+    if handled:
+        p50, p99 = np.percentile(latency_ms, [50, 99])
+        print(f"   Latency      : p50 {p50:.2f} ms | p99 {p99:.2f} ms | max {latency_ms.max():.2f} ms")
+    print(f"   CPU (service): {cpu:.2f} s = {cpu / wall * 100:.1f}% of 1 core over {wall:.1f}s "
+          f"(generator {generator.cpu_seconds:.2f} s excluded)")
+    print(f"   RSS          : {rss_before:.1f} MB before → peak {sampler.peak:.1f} MB "
+          f"(+{sampler.peak - rss_before:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark: độ trễ predict của nowcast + amount - DMatrix (cũ) vs inplace_predict (NumPy).
+
+Mỗi cấu hình đo p50 / p99 (µs / lần gọi) cho:
+- 1 dòng (1×13, trường hợp slot check / rolling nowcast)
+- batch --batch dòng (nhiều slot / device cùng lúc)
+với nthread mặc định của xgboost và nthread=1 (cùng budget cho 1 dòng và batch;
+budget riêng PREDICT_NTHREAD_SINGLE + first call: xem bench_warmup.py).
+
+Chạy:
+    python src/bench_predict_latency.py [--iterations 2000] [--batch 256]
+"""
+
+import argparse
+import time
+
+import numpy as np
+import xgboost as xgb
+
+from feature_engineering import FEATURE_NAMES
+from model_registry import get_registry
+from wrappers import _iteration_range
+
+
+def _latencies(fn, iterations: int) -> np.ndarray:
+    """µs / lần gọi (bỏ 50 lần đầu: warm-up)."""
+    for _ in range(50):
+        fn()
+    out = np.empty(iterations)
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        out[i] = (time.perf_counter() - t0) * 1e6
+    return out
+
+
+def _dmatrix_predict(booster: xgb.Booster, X: np.ndarray, use_best_iteration: bool):
+    """Đường cũ: tạo DMatrix mỗi lần gọi."""
+    return booster.predict(xgb.DMatrix(X), iteration_range=_iteration_range(booster, use_best_iteration))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Nowcast/amount predict latency (DMatrix vs inplace)")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=256)
+    args = parser.parse_args()
+
+    models = get_registry().get()
+    rng = np.random.default_rng(0)
+    X_batch = rng.normal(0, 1, size=(args.batch, len(FEATURE_NAMES))).astype(np.float32)
+    X_one = X_batch[:1].copy()
+
+    targets = [("nowcast", models.nowcast, True)]
+    if models.amount is not None:
+        targets.append(("amount", models.amount, models.amount.use_best_iteration))
+
+    print("=" * 78)
+    print(f"⏱️  PREDICT LATENCY (model {models.version}, {args.iterations} iterations, batch {args.batch})")
+    print("=" * 78)
+    print(f"   {'model':<8} {'rows':>5} {'path':<9} {'nthread':>7} | {'p50 µs':>9} {'p99 µs':>9} | {'rows/s':>10}")
+    for name, model, use_best in targets:
+        booster = model.get_booster()
+        default_nthread, default_single = model.nthread, model.single_nthread
+        for nthread in (0, 1):
+            model.set_nthread(nthread, nthread)
+            predict = model.predict_proba if name == "nowcast" else model.predict
+            for X in (X_one, X_batch):
+                for path, fn in (
+                    ("dmatrix", lambda: _dmatrix_predict(booster, X, use_best)),
+                    ("inplace", lambda: predict(X)),
+                ):
+                    iterations = args.iterations if len(X) == 1 else max(50, args.iterations // 10)
+                    lat = _latencies(fn, iterations)
+                    p50, p99 = np.percentile(lat, [50, 99])
+                    print(f"   {name:<8} {len(X):>5} {path:<9} {nthread or 'auto':>7} | "
+                          f"{p50:>9.1f} {p99:>9.1f} | {len(X) / p50 * 1e6:>10,.0f}")
+        model.set_nthread(default_nthread, default_single)
+
+        a = np.asarray(_dmatrix_predict(booster, X_batch, use_best)).reshape(-1)
+        b = model.predict_proba(X_batch)[:, 1] if name == "nowcast" else model.predict(X_batch)
+        print(f"   {name}: max |dmatrix - inplace| = {float(np.max(np.abs(a - b))):.2e}")
+        print("-" * 78)
+
+
+if __name__ == "__main__":
+    main()
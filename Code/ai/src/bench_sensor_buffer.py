@@ -0,0 +1,108 @@
+"""
+Micro-benchmark: chi phí tạo cửa sổ + tính 13 features cho 1 device.
+
+So sánh:
+- before: deque(dict) → DataFrame → parse timestamp → map cột → compute_feature_from_window
+- after : SensorBuffer (ring buffer NumPy) → window() (view) → compute_feature_from_window
+
+Chạy:
+    python src/bench_sensor_buffer.py [--iterations 2000] [--size 24]
+"""
+
+import argparse
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from feature_engineering import compute_feature_from_window
+from sensor_buffer import SensorBuffer
+
+API_ROW = pd.Series({
+    "api_pop": 0.3,
+    "api_rain_1h": 0.0,
+    "api_temp_c": 27.0,
+    "api_rh_pct": 75.0,
+    "api_uvi": 4.0,
+})
+
+
+def _payloads(n: int):
+    t0 = datetime(2024, 11, 20, 8, 0, 0)
+    rng = np.random.default_rng(0)
+    for i in range(n):
+        yield {
+            "device_id": "esp32-01",
+            "timestamp": (t0 + timedelta(minutes=5 * i)).isoformat() + "Z",
+            "temperature": float(28 + rng.normal(0, 0.5)),
+            "humidity": float(70 + rng.normal(0, 2)),
+            "pressure": float(1008 + rng.normal(0, 0.3)),
+            "soilMoisture": float(40 + rng.normal(0, 1)),
+        }
+
+
+def _legacy_to_dataframe(buffer: deque) -> pd.DataFrame:
+    """SensorBuffer.to_dataframe() cũ (deque of dicts)."""
+    df = pd.DataFrame(list(buffer))
+    df['ts'] = pd.to_datetime(df['timestamp'])
+    df['temp_c'] = df.get('temperature', 0)
+    df['rh_pct'] = df.get('humidity', 0)
+    df['pressure_hpa'] = df.get('pressure', 0)
+    df['soil_moist_pct'] = df.get('soilMoisture', 0)
+    return df.sort_values('ts')
+
+
+def _bench(fn, iterations: int) -> float:
+    """Trung bình µs / lần gọi."""
+    for _ in range(min(50, iterations)):
+        fn()
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - t0) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SensorBuffer window micro-benchmark")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--size", type=int, default=24, help="Số bản ghi trong buffer (default: 24)")
+    args = parser.parse_args()
+
+    payloads = list(_payloads(args.size))
+
+    legacy = deque(maxlen=args.size)
+    ring = SensorBuffer(max_size=args.size)
+    for p in payloads:
+        legacy.append(p)
+        ring.add(p)
+
+    results = {
+        "before: deque → DataFrame": _bench(lambda: _legacy_to_dataframe(legacy), args.iterations),
+        "before: deque → DataFrame → features": _bench(
+            lambda: compute_feature_from_window(_legacy_to_dataframe(legacy), API_ROW), args.iterations
+        ),
+        "after : ring → window()": _bench(lambda: ring.window(), args.iterations),
+        "after : ring → window() → features": _bench(
+            lambda: compute_feature_from_window(ring.window(), API_ROW), args.iterations
+        ),
+    }
+
+    before = compute_feature_from_window(_legacy_to_dataframe(legacy), API_ROW).to_list()
+    after = compute_feature_from_window(ring.window(), API_ROW).to_list()
+    max_diff = float(np.max(np.abs(np.array(before) - np.array(after))))
+
+    print("=" * 70)
+    print(f"⏱️  SensorBuffer window benchmark ({args.size} records, {args.iterations} iterations)")
+    print("=" * 70)
+    for name, us in results.items():
+        print(f"   {name:<42} {us:10.1f} µs/window")
+    speedup = results["before: deque → DataFrame → features"] / results["after : ring → window() → features"]
+    print("-" * 70)
+    print(f"   Speedup (window + features): {speedup:.1f}x")
+    print(f"   Max |feature diff| before vs after (float32 storage): {max_diff:.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Benchmark: thời gian khởi động ai_service (import → kết nối MQTT → buffer → model sẵn sàng).
+
+1. Import breakdown (`python -X importtime -c "import ai_service"`): tổng thời gian,
+   các module con trực tiếp tốn nhất (cumulative), module nặng nào đã bị hoãn
+   (xgboost / sklearn / scipy / joblib / scheduler / pre_irrigation_check)
+2. Timeline mỗi chế độ FAST_START (process riêng, LocalBroker, sink CSV tạm, không warm start):
+   - import   : import ai_service
+   - init     : AIService() (buffer, writer, ingest queue)
+   - connect  : on_connect (subscribe xong, từ lúc process bắt đầu import)
+   - buffered : reading đầu tiên đã vào buffer
+   - ready    : warm_up() xong (import nặng + load model)
+   - RSS MB   : peak RSS lúc connect / lúc ready
+
+Chạy:
+    python src/bench_startup.py [--runs 3] [--top 12]
+"""
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parent
+DEFERRED = ("xgboost", "sklearn", "scipy", "joblib", "scheduler", "pre_irrigation_check")
+STEPS = ("import", "init", "connect", "buffered", "ready")
+
+
+def _rss_mb() -> float:
+    """Peak RSS của process (Linux: ru_maxrss tính bằng KB)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _wait(predicate, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.001)
+    return True
+
+
+def worker() -> dict:
+    """1 lần khởi động (FAST_START theo env) → mốc thời gian giây tính từ trước import."""
+    t0 = time.perf_counter()
+    import ai_service
+    from local_broker import LocalBroker, LocalClient
+
+    marks = {"import": time.perf_counter() - t0}
+    tmp = Path(tempfile.mkdtemp(prefix="bench_startup_"))
+    ai_service.SENSOR_LIVE_CSV = tmp / "sensor_live.csv"
+    ai_service.SCHEDULE_FILE = tmp / "lich_tuoi.json"
+    broker = LocalBroker()
+    service = ai_service.AIService(client=LocalClient("ai_service", broker=broker))
+    marks["init"] = time.perf_counter() - t0
+
+    thread = threading.Thread(target=service.start, name="service", daemon=True)
+    thread.start()
+    try:
+        if not service.connected.wait(300):
+            raise RuntimeError("service did not connect")
+        marks["connect"] = time.perf_counter() - t0
+        rss_connect = _rss_mb()
+
+        sensor = LocalClient("esp32", broker=broker)
+        sensor.connect()
+        sensor.publish(service.TOPIC_SENSOR, json.dumps({
+            "device_id": "bench", "timestamp": datetime.utcnow().isoformat(),
+            "temperature": 28.0, "humidity": 80.0, "pressure": 1008.0, "soilMoisture": 45.0,
+        }))
+        if not _wait(lambda: service.buffers.get("bench") is not None, 60):
+            raise RuntimeError("reading was not buffered")
+        marks["buffered"] = time.perf_counter() - t0
+
+        if not service.warmed_up.wait(300):
+            raise RuntimeError("warm-up did not finish")
+        marks["ready"] = time.perf_counter() - t0
+        return {"marks": marks, "rss_connect_mb": rss_connect, "rss_ready_mb": _rss_mb(),
+                "models_loaded": ai_service.MODEL_REGISTRY.version is not None}
+    finally:
+        service.stop()
+        thread.join(30)
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def import_breakdown(module: str = "ai_service"):
+    """[(depth, self_us, cumulative_us, name)] của `python -X importtime -c "import <module>"`."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=SRC,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((depth, int(self_us), int(cumulative_us), name.strip()))
+    return rows
+
+
+def _direct_children(rows, module: str):
+    """Module import trực tiếp bởi `module` (importtime in con trước cha, con sâu hơn 1 mức)."""
+    idx = next(i for i, r in enumerate(rows) if r[0] == 0 and r[3] == module)
+    children = []
+    for depth, self_us, cumulative_us, name in reversed(rows[:idx]):
+        if depth == 0:
+            break
+        if depth == 1:
+            children.append((cumulative_us, self_us, name))
+    return sorted(children, reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ai_service startup: import breakdown + time-to-connect / ready")
+    parser.add_argument("--runs", type=int, default=3, help="Số lần khởi động mỗi chế độ (lấy median)")
+    parser.add_argument("--top", type=int, default=12, help="Số module con hiển thị trong import breakdown")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(worker()))
+        return
+
+    rows = import_breakdown()
+    total = next(r for r in rows if r[0] == 0 and r[3] == "ai_service")
+    loaded = {r[3] for r in rows}
+    print("=" * 78)
+    print(f"📦 IMPORT ai_service: {total[2] / 1000:.0f} ms (-X importtime, cumulative)")
+    print("=" * 78)
+    print(f"   {'module':<28} | {'cumulative ms':>13} | {'self ms':>8}")
+    for cumulative_us, self_us, name in _direct_children(rows, "ai_service")[:args.top]:
+        print(f"   {name:<28} | {cumulative_us / 1000:>13.1f} | {self_us / 1000:>8.1f}")
+    print("   deferred: " + ", ".join(f"{m} {'❌ imported' if m in loaded else '✓'}" for m in DEFERRED))
+
+    print()
+    print("=" * 78)
+    print(f"🚀 STARTUP TIMELINE (seconds from import, median of {args.runs}; LocalBroker, cold buffers)")
+    print("=" * 78)
+    print(f"   {'FAST_START':<10} | " + " | ".join(f"{s:>8}" for s in STEPS) + f" | {'RSS MB connect/ready':>20}")
+    for fast_start in ("1", "0"):
+        env = dict(os.environ, FAST_START=fast_start, SENSOR_SINK="csv", WARM_START="0", METRICS_PORT="0")
+        results = []
+        for _ in range(args.runs):
+            proc = subprocess.run(
+                [sys.executable, __file__, "--worker"], capture_output=True, text=True, cwd=SRC, env=env,
+            )
+            lines = [line for line in proc.stdout.splitlines() if line.startswith("{")]
+            if proc.returncode != 0 or not lines:
+                print(f"   {fast_start:<10} | ❌ failed: {proc.stderr.strip().splitlines()[-1:]}")
+                break
+            results.append(json.loads(lines[-1]))
+        if not results:
+            continue
+        marks = {s: statistics.median(r["marks"][s] for r in results) for s in STEPS}
+        rss = (statistics.median(r["rss_connect_mb"] for r in results),
+               statistics.median(r["rss_ready_mb"] for r in results))
+        note = "" if all(r["models_loaded"] for r in results) else "  ⚠️  models not loaded"
+        print(f"   {fast_start:<10} | " + " | ".join(f"{marks[s]:>8.2f}" for s in STEPS)
+              + f" | {rss[0]:>9.0f} / {rss[1]:>8.0f}{note}")
+
+
+if __name__ == "__main__":
+    main()
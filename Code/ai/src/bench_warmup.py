@@ -0,0 +1,122 @@
+"""
+Benchmark: lần predict đầu tiên vs steady state, theo warm-up + thread budget.
+
+Lần gọi đầu tiên sau khi load model trả chi phí 1 lần (cấp phát, dựng thread pool
+OpenMP / session) → chỉ đo được ở process mới. Mỗi cấu hình chạy --runs process:
+- load ms      : registry.get() (unpickle + dựng predictor + warm-up nếu bật)
+- first        : p50 / p99 (qua các process) của lần gọi đầu tiên sau load
+- steady       : p50 / p99 của --iterations lần gọi sau đó (gộp mọi process)
+cho nowcast 1 dòng (1×13: rolling nowcast / slot check), amount 1 dòng và
+nowcast batch --batch dòng. Dữ liệu đo khác dữ liệu warm-up (seed khác).
+
+Cấu hình mặc định (env của model_registry.py / wrappers.py):
+- cold      : MODEL_WARMUP=0, PREDICT_NTHREAD_SINGLE=0 (1 dòng dùng chung budget batch)
+- warm      : MODEL_WARMUP=1, PREDICT_NTHREAD_SINGLE=0
+- warm+1t   : MODEL_WARMUP=1, PREDICT_NTHREAD_SINGLE=1 (mặc định khi serving)
+
+Chạy:
+    python src/bench_warmup.py [--runs 10] [--iterations 1000] [--batch 256] [--backend xgboost]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+SRC = Path(__file__).resolve().parent
+CONFIGS = {
+    "cold": {"MODEL_WARMUP": "0", "PREDICT_NTHREAD_SINGLE": "0"},
+    "warm": {"MODEL_WARMUP": "1", "PREDICT_NTHREAD_SINGLE": "0"},
+    "warm+1t": {"MODEL_WARMUP": "1", "PREDICT_NTHREAD_SINGLE": "1"},
+}
+
+
+def _timed_us(fn) -> float:
+    t0 = time.perf_counter()
+    fn()
+    return (time.perf_counter() - t0) * 1e6
+
+
+def worker(iterations: int, batch: int) -> dict:
+    """1 process: load → lần gọi đầu của từng loại → steady state (µs)."""
+    from model_registry import get_registry
+
+    t0 = time.perf_counter()
+    models = get_registry().get()
+    load_ms = (time.perf_counter() - t0) * 1000
+
+    rng = np.random.default_rng(1)
+    X = rng.normal(0.0, 1.0, size=(batch, models.nowcast.get_booster().num_features())).astype(np.float32)
+    one = X[:1].copy()
+    calls = {"nowcast_1": lambda: models.nowcast.predict_proba(one),
+             "nowcast_batch": lambda: models.nowcast.predict_proba(X)}
+    if models.amount is not None:
+        calls["amount_1"] = lambda: models.amount.predict(one)
+
+    first = {name: _timed_us(fn) for name, fn in calls.items()}
+    steady = {}
+    for name, fn in calls.items():
+        n = iterations if name.endswith("_1") else max(20, iterations // 10)
+        steady[name] = [_timed_us(fn) for _ in range(n)]
+    return {"load_ms": load_ms, "backend": models.backend, "nthread": models.nowcast.nthread,
+            "single_nthread": getattr(models.nowcast, "single_nthread", 0), "first": first, "steady": steady}
+
+
+def _p(values, q) -> float:
+    return float(np.percentile(values, q)) if len(values) else float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="First-call vs steady-state predict latency (warm-up, thread budget)")
+    parser.add_argument("--configs", type=str, default=",".join(CONFIGS))
+    parser.add_argument("--runs", type=int, default=10, help="Số process mỗi cấu hình (mẫu cho first call)")
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--batch", type=int, default=256)
+    parser.add_argument("--backend", type=str, default=os.getenv("INFERENCE_BACKEND", "xgboost"))
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(worker(args.iterations, args.batch)))
+        return
+
+    print("=" * 100)
+    print(f"🔥 FIRST CALL vs STEADY STATE (backend {args.backend}, {args.runs} processes / config, "
+          f"batch {args.batch}, {os.cpu_count()} CPU)")
+    print("=" * 100)
+    print(f"   {'config':<8} {'load ms':>8} | {'call':<13} | {'first p50':>10} {'p99':>10} | "
+          f"{'steady p50':>10} {'p99':>10}  (µs)")
+    for label in [c for c in args.configs.split(",") if c]:
+        env = dict(os.environ, INFERENCE_BACKEND=args.backend, **CONFIGS[label])
+        results = []
+        for _ in range(args.runs):
+            proc = subprocess.run(
+                [sys.executable, __file__, "--worker", "--iterations", str(args.iterations), "--batch", str(args.batch)],
+                capture_output=True, text=True, cwd=SRC, env=env,
+            )
+            lines = [line for line in proc.stdout.splitlines() if line.startswith("{")]
+            if proc.returncode != 0 or not lines:
+                print(f"   {label:<8} ❌ failed: {proc.stderr.strip().splitlines()[-1:]}")
+                break
+            results.append(json.loads(lines[-1]))
+        if not results:
+            continue
+        load_ms = float(np.median([r["load_ms"] for r in results]))
+        for k, name in enumerate(results[0]["first"]):
+            first = [r["first"][name] for r in results]
+            steady = np.concatenate([r["steady"][name] for r in results])
+            head = f"{label:<8} {load_ms:>8.0f}" if k == 0 else " " * 17
+            print(f"   {head} | {name:<13} | {_p(first, 50):>10.1f} {_p(first, 99):>10.1f} | "
+                  f"{_p(steady, 50):>10.1f} {_p(steady, 99):>10.1f}")
+        r = results[0]
+        print(f"   {'':<17}   (backend {r['backend']}, nthread {r['nthread'] or 'auto'}, "
+              f"single-row nthread {r['single_nthread'] or 'shared'})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Check: LiveWindowProvider không trả cửa sổ rách khi ingest ghi song song.
+
+- 1 thread ingest ghi reading liên tục vào DeviceBufferPool (ring đầy → mỗi
+  reading ghi đè phần tử cũ nhất) dưới lock của device, giống
+  AIService.handle_sensor_data
+- N thread slot check gọi provider.window() với target = reading mới nhất
+- Kiểm tra mỗi cửa sổ: ts tăng đúng bước 300 giây, giá trị khớp ts (temp_c mã
+  hoá chỉ số reading), và cửa sổ vẫn đúng sau khi ingest ghi thêm (đã copy)
+
+Chạy cả 2 cấu hình: có lock (phải 0 cửa sổ rách → exit 0 / 1) và không lock
+(chỉ in số cửa sổ rách để so sánh).
+
+Chạy:
+    python src/check_live_window.py [--readers 4] [--seconds 3]
+"""
+
+import argparse
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from sensor_buffer import DeviceBufferPool
+from window_provider import LiveWindowProvider
+
+DEVICE_ID = "esp32-01"
+STEP = 300
+T0 = 1_732_089_600  # 2024-11-20 08:00 UTC
+
+
+def _reading(k: int) -> dict:
+    return {
+        "device_id": DEVICE_ID,
+        "timestamp": datetime.fromtimestamp(T0 + k * STEP, tz=timezone.utc).isoformat(),
+        "temperature": float(k % 1000),
+        "humidity": 70.0,
+        "pressure": 1008.0,
+        "soilMoisture": 40.0,
+    }
+
+
+def _torn(w) -> bool:
+    ts = np.asarray(w.ts)
+    k = (ts - T0) // STEP
+    return bool(np.any(np.diff(ts) != STEP) or np.any(np.asarray(w.temp_c) != (k % 1000)))
+
+
+def run(readers: int, seconds: float, locked: bool) -> dict:
+    pool = DeviceBufferPool(max_size=24, min_ready=12)
+    lock = threading.Lock()
+    provider = LiveWindowProvider(pool, lock_for=(lambda device_id: lock) if locked else None)
+    latest = [0]
+    stop = threading.Event()
+    counts = {"windows": 0, "torn": 0, "torn_after_write": 0, "misses": 0}
+    counts_lock = threading.Lock()
+
+    with lock:
+        for k in range(24):
+            pool.add(_reading(k))
+    latest[0] = 23
+
+    def ingest():
+        k = latest[0]
+        while not stop.is_set():
+            k += 1
+            with lock:
+                pool.add(_reading(k))
+            latest[0] = k
+
+    def slot_check():
+        local = dict.fromkeys(counts, 0)
+        while not stop.is_set():
+            target = datetime.fromtimestamp(T0 + latest[0] * STEP, tz=timezone.utc).replace(tzinfo=None)
+            try:
+                w, _ = provider.window(target, DEVICE_ID)
+            except ValueError:
+                local["misses"] += 1
+                continue
+            local["windows"] += 1
+            if _torn(w):
+                local["torn"] += 1
+            elif locked:
+                time.sleep(0)  # nhường ingest ghi thêm → cửa sổ đã copy phải giữ nguyên
+                local["torn_after_write"] += _torn(w)
+        with counts_lock:
+            for key, value in local.items():
+                counts[key] += value
+
+    threads = [threading.Thread(target=ingest)] + [threading.Thread(target=slot_check) for _ in range(readers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    counts["readings"] = latest[0] + 1
+    return counts
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="LiveWindowProvider vs concurrent ingest (torn window check)")
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    # Thread switch thường xuyên → tăng khả năng ingest chen giữa lúc đọc cửa sổ
+    sys.setswitchinterval(1e-5)
+
+    print("=" * 70)
+    print(f"🪟 LIVE WINDOW vs INGEST ({args.readers} readers, {args.seconds:.0f}s / config)")
+    print("=" * 70)
+    ok = True
+    for locked in (True, False):
+        c = run(args.readers, args.seconds, locked)
+        label = "lock" if locked else "no lock"
+        print(f"   {label:<8} | readings {c['readings']:>8} | windows {c['windows']:>8} | "
+              f"torn {c['torn']:>6} | torn after write {c['torn_after_write']:>4} | misses {c['misses']:>5}")
+        if locked:
+            ok = c["torn"] == 0 and c["torn_after_write"] == 0 and c["windows"] > 0
+    print("-" * 70)
+    print("✅ ALL CHECKS PASSED" if ok else "❌ CHECK FAILED")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""
+Check: SensorHistory.asof() trả về đúng cửa sổ như pandas (read_csv → lọc ts <= target → tail)
+và đo thời gian 1 lần tra cứu.
+
+- N mốc thời gian ngẫu nhiên trong dữ liệu (mỗi device + không lọc device)
+- So sánh ts + 4 kênh với cách cũ (load_sensor_buffer_at_timestamp trước đây)
+- Append vào bản sao CSV → get_history() chỉ đọc phần mới, kết quả vẫn khớp
+
+Exit code 1 nếu có check fail.
+
+Chạy:
+    python src/check_sensor_history.py [--csv data/sensor_raw_60d_synth.csv] [--lookups 500]
+"""
+
+import argparse
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from sensor_history import CsvHistory, get_history
+from window_provider import SENSOR_REAL, SENSOR_SYNTH
+
+CHANNELS = ["temp_c", "rh_pct", "pressure_hpa", "soil_moist_pct"]
+
+
+def _pandas_asof(path: Path, target: pd.Timestamp, device_id, n: int = 12) -> pd.DataFrame:
+    """Cách cũ: đọc toàn bộ CSV cho mỗi lần tra cứu."""
+    df = pd.read_csv(path, parse_dates=["ts"]).sort_values("ts", kind="stable")
+    if device_id is not None:
+        df = df[df["device_id"] == device_id]
+    return df[df["ts"] <= target].tail(n)
+
+
+def _same(window, df: pd.DataFrame) -> bool:
+    if len(window) != len(df):
+        return False
+    ts = ((df["ts"] - pd.Timestamp(0)) // pd.Timedelta(seconds=1)).to_numpy()
+    if not np.array_equal(window.ts, ts):
+        return False
+    return all(np.allclose(getattr(window, c), df[c].to_numpy(dtype=float)) for c in CHANNELS)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="SensorHistory as-of lookup check")
+    parser.add_argument("--csv", type=str, default=None)
+    parser.add_argument("--lookups", type=int, default=500)
+    args = parser.parse_args()
+
+    path = Path(args.csv) if args.csv else (SENSOR_REAL if SENSOR_REAL.exists() else SENSOR_SYNTH)
+    if not path.exists():
+        print(f"❌ Sensor CSV not found: {path}")
+        return 1
+
+    print("=" * 70)
+    print(f"🗂️  SENSOR HISTORY CHECK ({path.name})")
+    print("=" * 70)
+
+    t0 = time.perf_counter()
+    history = get_history(path)
+    load_ms = (time.perf_counter() - t0) * 1000
+    print(f"   Loaded {len(history)} rows, {len(history.devices())} device(s) in {load_ms:.0f} ms")
+
+    raw = pd.read_csv(path, parse_dates=["ts"])
+    rng = np.random.default_rng(0)
+    targets = pd.to_datetime(rng.integers(
+        raw["ts"].min().value // 10**9, raw["ts"].max().value // 10**9, size=args.lookups,
+    ), unit="s")
+    device_ids = [None] + history.devices()
+
+    # Đúng: so với pandas trên 1 tập nhỏ (pandas đọc lại file mỗi lần)
+    checks = {}
+    mismatches = 0
+    for i, target in enumerate(targets[:40]):
+        device_id = device_ids[i % len(device_ids)]
+        if not _same(history.asof(target, device_id), _pandas_asof(path, target, device_id)):
+            mismatches += 1
+    checks[f"asof == pandas filter+tail (mismatches: {mismatches}/40)"] = mismatches == 0
+
+    # Tốc độ
+    t0 = time.perf_counter()
+    for i, target in enumerate(targets):
+        history.asof(target, device_ids[i % len(device_ids)])
+    index_us = (time.perf_counter() - t0) / len(targets) * 1e6
+    t0 = time.perf_counter()
+    for target in targets[:10]:
+        _pandas_asof(path, target, None)
+    pandas_ms = (time.perf_counter() - t0) / 10 * 1000
+    print(f"   asof lookup: {index_us:.1f} µs | pandas read_csv+filter: {pandas_ms:.1f} ms "
+          f"(×{pandas_ms * 1000 / max(index_us, 1e-9):.0f})")
+
+    # Append: chỉ đọc phần mới của file
+    with tempfile.TemporaryDirectory() as tmp:
+        copy = Path(tmp) / path.name
+        shutil.copy(path, copy)
+        source = CsvHistory(copy)
+        before = len(source.get())
+        last = raw.sort_values("ts").tail(3).copy()
+        last["ts"] = last["ts"] + pd.Timedelta(days=1)
+        time.sleep(0.01)
+        with open(copy, "a") as f:
+            last.to_csv(f, header=False, index=False, date_format="%Y-%m-%d %H:%M:%S")
+        after = source.get()
+        device_id = str(last["device_id"].iloc[-1]) if "device_id" in last.columns else None
+        target = last["ts"].max()
+        checks[f"append read incrementally (+{len(after) - before} rows)"] = (
+            len(after) == before + len(last) and source.full_loads == 1 and source.incremental_loads == 1
+        )
+        checks["asof after append == pandas"] = _same(
+            after.asof(target, device_id), _pandas_asof(copy, target, device_id)
+        )
+
+    ok = True
+    for name, passed in checks.items():
+        ok &= passed
+        print(f"   {'✓' if passed else '❌'} {name}")
+    print("-" * 70)
+    print("✅ ALL CHECKS PASSED" if ok else "❌ CHECK FAILED")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""
+Parity check: StreamingFeatureEngine vs compute_feature_from_window trên dữ liệu đã ghi.
+
+Với mỗi device, phát lại các reading theo thứ tự thời gian:
+- streaming : engine.update(...) → FeatureVector (O(1) / reading)
+- reference : compute_feature_from_window(cửa sổ 24 bản ghi gần nhất, api_row)
+So sánh từng feature ở MỖI bước, báo max |diff| theo feature.
+
+Nguồn dữ liệu (ưu tiên): data/sensor_store → sensor_raw_60d.csv → sensor_raw_60d_synth.csv.
+Exit code 1 nếu có feature lệch quá --tolerance.
+
+Chạy:
+    python src/check_streaming_features.py [--max-rows 2000] [--tolerance 1e-6]
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from feature_engineering import FEATURE_NAMES, compute_feature_from_window
+from sensor_store import open_default_store
+from streaming_features import StreamingFeatureEngine
+
+ROOT = Path(__file__).resolve().parents[1]
+DATA_DIR = ROOT / "data"
+SENSOR_REAL = DATA_DIR / "sensor_raw_60d.csv"
+SENSOR_SYNTH = DATA_DIR / "sensor_raw_60d_synth.csv"
+
+WINDOW_ROWS = 24  # giống SensorBuffer (120 phút)
+
+API_ROW = pd.Series({
+    "api_pop": 0.35,
+    "api_rain_1h": 0.2,
+    "api_temp_c": 27.5,
+    "api_rh_pct": 78.0,
+    "api_uvi": 3.0,
+})
+
+
+def load_recorded_sensor() -> tuple[pd.DataFrame, str]:
+    store = open_default_store()
+    if store is not None:
+        return store.read(), store.root.name
+    for path in (SENSOR_REAL, SENSOR_SYNTH):
+        if path.exists():
+            return pd.read_csv(path, parse_dates=["ts"]), path.name
+    raise FileNotFoundError("No recorded sensor data (sensor_store / sensor_raw_60d*.csv)")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Streaming feature parity check")
+    parser.add_argument("--max-rows", type=int, default=2000, help="Số reading tối đa / device")
+    parser.add_argument("--tolerance", type=float, default=1e-6)
+    args = parser.parse_args()
+
+    df, source = load_recorded_sensor()
+    if "device_id" not in df.columns:
+        df["device_id"] = "esp32-01"
+    df["ts"] = pd.to_datetime(df["ts"], utc=True).dt.tz_localize(None)
+    df = df.sort_values(["device_id", "ts"]).drop_duplicates(subset=["device_id", "ts"])
+
+    print("=" * 70)
+    print("🔁 STREAMING FEATURE PARITY CHECK")
+    print("=" * 70)
+    print(f"Source: {source} ({len(df)} rows, {df['device_id'].nunique()} device(s))")
+
+    engine = StreamingFeatureEngine(interval_seconds=300, api_row=API_ROW)
+    max_diff = np.zeros(len(FEATURE_NAMES))
+    checked = 0
+
+    for device_id, dev_df in df.groupby("device_id"):
+        dev_df = dev_df.head(args.max_rows).reset_index(drop=True)
+        epochs = ((dev_df["ts"] - pd.Timestamp(0)) // pd.Timedelta(seconds=1)).to_numpy()
+        for i in range(len(dev_df)):
+            row = dev_df.iloc[i]
+            fv = engine.update(
+                str(device_id), int(epochs[i]),
+                row["temp_c"], row["rh_pct"], row["pressure_hpa"], row["soil_moist_pct"],
+            )
+            window = dev_df.iloc[max(0, i + 1 - WINDOW_ROWS): i + 1]
+            ref = compute_feature_from_window(window, API_ROW, interval_seconds=300)
+            diff = np.abs(np.array(fv.to_list()) - np.array(ref.to_list()))
+            max_diff = np.maximum(max_diff, diff)
+            checked += 1
+
+    print(f"Checked: {checked} readings")
+    print("-" * 70)
+    failed = False
+    for name, d in zip(FEATURE_NAMES, max_diff):
+        status = "✓" if d <= args.tolerance else "❌"
+        failed |= d > args.tolerance
+        print(f"   {status} {name:<20} max |diff| = {d:.3e}")
+    print("-" * 70)
+    print("✅ PARITY OK" if not failed else f"❌ PARITY FAILED (tolerance {args.tolerance:g})")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
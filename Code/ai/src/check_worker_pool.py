@@ -0,0 +1,124 @@
+"""
+Check: WorkerPool giữ device affinity (dispatch + shared subscription) với LocalBroker.
+
+Với mỗi mode:
+- N worker (thread backend) + LocalBroker trong process
+- M virtual device publish K reading lên sensor/data/push
+- Kiểm tra: mỗi device chỉ có buffer ở đúng 1 worker = partition_for(device_id),
+  tổng message đã xử lý = số message đã publish, không message nào bị drop
+
+Sensor store ghi vào thư mục tạm. Exit code 1 nếu có check fail.
+
+Chạy:
+    python src/check_worker_pool.py [--workers 4] [--devices 40] [--readings 12]
+"""
+
+import argparse
+import json
+import logging
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from local_broker import LocalBroker, LocalClient
+from worker_pool import WorkerPool, partition_for
+
+
+def _publish_fleet(broker: LocalBroker, devices: int, readings: int) -> int:
+    client = LocalClient("fleet", broker=broker)
+    client.connect()
+    t0 = datetime(2024, 11, 20, 8, 0, 0)
+    sent = 0
+    for i in range(readings):
+        ts = (t0 + timedelta(minutes=5 * i)).isoformat() + "Z"
+        for d in range(devices):
+            payload = {
+                "device_id": f"esp32-{d:03d}",
+                "timestamp": ts,
+                "temperature": 28.0 + d * 0.01,
+                "humidity": 70.0,
+                "pressure": 1008.0,
+                "soilMoisture": 40.0,
+            }
+            client.publish("sensor/data/push", json.dumps(payload), qos=1)
+            sent += 1
+    return sent
+
+
+def run_mode(mode: str, workers: int, devices: int, readings: int) -> bool:
+    broker = LocalBroker()
+    with tempfile.TemporaryDirectory() as store_dir:
+        pool = WorkerPool(
+            workers=workers,
+            mode=mode,
+            backend="thread",
+            client_factory=lambda index: LocalClient(f"worker-{index}", broker=broker),
+            dispatcher_client=LocalClient("dispatcher", broker=broker),
+            store_dir=store_dir,
+            schedule=False,
+        ).start()
+
+        # Đợi các worker connect + subscribe (AIService.start đợi 2s sau connect)
+        time.sleep(2.5)
+        t0 = time.perf_counter()
+        sent = _publish_fleet(broker, devices, readings)
+        time.sleep(0.5)
+        pool.stop()
+        elapsed = time.perf_counter() - t0
+
+    results = pool.results
+    processed = sum(r["ingest"]["processed"] for r in results.values())
+    dropped = sum(r["ingest"]["dropped"] for r in results.values()) + sum(pool.dropped)
+    forwarded = sum(r["forwarded"] for r in results.values())
+
+    owners = {}
+    misplaced = 0
+    for index, r in results.items():
+        for device_id in r["devices"]:
+            owners.setdefault(device_id, []).append(index)
+            if partition_for(device_id, workers) != index:
+                misplaced += 1
+    split = sum(1 for idx in owners.values() if len(idx) > 1)
+
+    checks = {
+        "all workers stopped": len(results) == workers,
+        f"processed == published ({processed}/{sent})": processed == sent,
+        f"no drops ({dropped})": dropped == 0,
+        f"every device seen ({len(owners)}/{devices})": len(owners) == devices,
+        f"device on exactly 1 worker (split: {split})": split == 0,
+        f"device on its crc32 owner (misplaced: {misplaced})": misplaced == 0,
+    }
+
+    print(f"\n▶ mode={mode} workers={workers} devices={devices} readings={readings}")
+    print(f"   {sent} messages in {elapsed:.2f}s | forwarded between workers: {forwarded}")
+    per_worker = {i: len(r["devices"]) for i, r in sorted(results.items())}
+    print(f"   devices / worker: {per_worker}")
+    ok = True
+    for name, passed in checks.items():
+        ok &= passed
+        print(f"   {'✓' if passed else '❌'} {name}")
+    return ok
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Worker pool device-affinity check (LocalBroker)")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--devices", type=int, default=40)
+    parser.add_argument("--readings", type=int, default=12)
+    args = parser.parse_args()
+
+    # Log từng message của worker quá nhiều cho 1 lần check
+    logging.getLogger().setLevel(logging.WARNING)
+
+    print("=" * 70)
+    print("🧩 WORKER POOL AFFINITY CHECK (LocalBroker, thread backend)")
+    print("=" * 70)
+    ok = all([run_mode(mode, args.workers, args.devices, args.readings) for mode in ("dispatch", "shared")])
+    print("-" * 70)
+    print("✅ ALL CHECKS PASSED" if ok else "❌ CHECK FAILED")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
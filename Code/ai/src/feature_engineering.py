@@ -12,7 +12,8 @@ Feature engineering theo báo cáo IoT - Virtual Rain Sensor.
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import List, Dict
+from datetime import datetime, timezone
+from typing import List, Dict, NamedTuple, Union
 import numpy as np
 import pandas as pd
 
@@ -64,6 +65,24 @@ class FeatureVector:
         ]
 
 
+class SensorWindow(NamedTuple):
+    """
+    Cửa sổ sensor dạng cột (không cần DataFrame), sắp xếp theo thời gian tăng dần.
+
+    ts: epoch giây (UTC, int64); các kênh còn lại: float32 (thường là view
+    zero-copy của ring buffer trong sensor_buffer.SensorBuffer).
+    """
+
+    ts: np.ndarray
+    temp_c: np.ndarray
+    rh_pct: np.ndarray
+    pressure_hpa: np.ndarray
+    soil_moist_pct: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+
 FEATURE_NAMES: List[str] = [
     "api_pop",
     "api_rain_1h",
@@ -117,8 +136,94 @@ def compute_dew_point(temp_c: float, rh_pct: float) -> float:
     return (b * gamma) / (a - gamma)
 
 
+def window_sizes(interval_seconds: int) -> tuple[int, int, int]:
+    """(window_1h, window_15m, window_soil) theo interval giữa các bản ghi."""
+    if interval_seconds == 15:
+        return WINDOW_1H, WINDOW_15M, WINDOW_SOIL_SMOOTH
+    # 5 phút (300s)
+    return WINDOW_1H_5MIN, WINDOW_15M_5MIN, WINDOW_SOIL_SMOOTH_5MIN
+
+
+def _compute_feature_from_arrays(
+    window: SensorWindow,
+    api_row: pd.Series,
+    interval_seconds: int = 300,
+) -> FeatureVector:
+    """Giống compute_feature_from_window nhưng đọc trực tiếp từ mảng (SensorWindow)."""
+    n = len(window)
+    if n > 0:
+        last_ts = datetime.fromtimestamp(int(window.ts[-1]), tz=timezone.utc)
+    else:
+        last_ts = pd.Timestamp.now()
+    month_enc = cyclical_encode_month(last_ts.month)
+    hour_enc = cyclical_encode_hour(last_ts.hour)
+
+    if n < 2:
+        # Nếu thiếu dữ liệu, trả về vector zero
+        return FeatureVector(
+            api_pop=0.0,
+            api_rain_1h=0.0,
+            pressure_slope_1h=0.0,
+            temp_drop_15m=0.0,
+            rh_rise_15m=0.0,
+            dew_point_diff=0.0,
+            temp_bias=0.0,
+            soil_moist_smooth=float(window.soil_moist_pct[-1]) if n > 0 else 0.0,
+            month_sin=month_enc["month_sin"],
+            month_cos=month_enc["month_cos"],
+            hour_sin=hour_enc["hour_sin"],
+            hour_cos=hour_enc["hour_cos"],
+            uvi_index=0.0,
+        )
+
+    window_1h, window_15m, window_soil = window_sizes(interval_seconds)
+    temp = window.temp_c
+    rh = window.rh_pct
+    pressure = window.pressure_hpa
+    soil = window.soil_moist_pct
+    last_temp = float(temp[-1])
+    last_rh = float(rh[-1])
+
+    # 1. pressure_slope_1h (điểm t-1h nếu đủ dữ liệu, ngược lại điểm đầu tiên)
+    i_1h = -window_1h if n >= window_1h else 0
+    pressure_slope_1h = float(pressure[-1]) - float(pressure[i_1h])
+
+    # 2. temp_drop_15m / rh_rise_15m
+    i_15m = -window_15m if n >= window_15m else 0
+    temp_drop_15m = float(temp[i_15m]) - last_temp
+    rh_rise_15m = last_rh - float(rh[i_15m])
+
+    # 3. soil_moist_smooth
+    if n >= window_soil:
+        soil_moist_smooth = float(soil[-window_soil:].mean(dtype=np.float64))
+    else:
+        soil_moist_smooth = float(soil[-1])
+
+    # 4-5. Dew point diff + temp_bias (sensor vs api)
+    api_temp = float(api_row.get("api_temp_c", last_temp))
+    api_rh = float(api_row.get("api_rh_pct", last_rh))
+    dew_point_diff = float(compute_dew_point(last_temp, last_rh) - compute_dew_point(api_temp, api_rh))
+    temp_bias = float(api_temp - last_temp)
+
+    return FeatureVector(
+        api_pop=float(api_row.get("api_pop", 0.0)),
+        api_rain_1h=float(api_row.get("api_rain_1h", 0.0)),
+        pressure_slope_1h=pressure_slope_1h,
+        temp_drop_15m=temp_drop_15m,
+        rh_rise_15m=rh_rise_15m,
+        dew_point_diff=dew_point_diff,
+        temp_bias=temp_bias,
+        soil_moist_smooth=soil_moist_smooth,
+        month_sin=month_enc["month_sin"],
+        month_cos=month_enc["month_cos"],
+        hour_sin=hour_enc["hour_sin"],
+        hour_cos=hour_enc["hour_cos"],
+        uvi_index=float(api_row.get("api_uvi", 0.0)),
+    )
+
+
 def compute_feature_from_window(
-    sensor_df: pd.DataFrame,
+    sensor_df: Union[pd.DataFrame, SensorWindow],
     api_row: pd.Series,
     interval_seconds: int = 300,  # 5 phút (300s) hoặc 15s
 ) -> FeatureVector:
@@ -128,6 +233,7 @@ def compute_feature_from_window(
     Args:
         sensor_df: DataFrame chứa sensor data, có các cột:
             ['ts', 'temp_c', 'rh_pct', 'soil_moist_pct', 'pressure_hpa']
+            hoặc SensorWindow (mảng cột, không tạo DataFrame)
         api_row: Series chứa API data, có các field:
             ['api_pop', 'api_rain_1h', 'api_temp_c', 'api_rh_pct', 'api_uvi']
         interval_seconds: Khoảng thời gian giữa các bản ghi (300s = 5 phút, 15s = 15 giây)
@@ -135,6 +241,9 @@ def compute_feature_from_window(
     Returns:
         FeatureVector với 13 features
     """
+    if isinstance(sensor_df, SensorWindow):
+        return _compute_feature_from_arrays(sensor_df, api_row, interval_seconds)
+
     if len(sensor_df) < 2:
         # Nếu thiếu dữ liệu, trả về vector zero
         last_ts = pd.to_datetime(sensor_df.iloc[-1]["ts"]) if len(sensor_df) > 0 else pd.Timestamp.now()
@@ -163,14 +272,7 @@ def compute_feature_from_window(
     last_ts = pd.to_datetime(last["ts"])
     
     # Xác định window size dựa trên interval
-    if interval_seconds == 15:
-        window_1h = WINDOW_1H
-        window_15m = WINDOW_15M
-        window_soil = WINDOW_SOIL_SMOOTH
-    else:  # 5 phút (300s)
-        window_1h = WINDOW_1H_5MIN
-        window_15m = WINDOW_15M_5MIN
-        window_soil = WINDOW_SOIL_SMOOTH_5MIN
+    window_1h, window_15m, window_soil = window_sizes(interval_seconds)
     
     # 1. pressure_slope_1h = P_t - P_(t-1h)
     # Nếu có đủ 1h dữ liệu, dùng điểm đầu; nếu không, dùng điểm xa nhất có
@@ -241,9 +343,11 @@ def compute_feature_from_window(
 
 __all__ = [
     "FeatureVector",
+    "SensorWindow",
     "FEATURE_NAMES",
     "compute_feature_from_window",
     "compute_dew_point",
+    "window_sizes",
     "cyclical_encode_month",
     "cyclical_encode_hour",
 ]
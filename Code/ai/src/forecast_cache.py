@@ -0,0 +1,201 @@
+"""
+Forecast Cache - Cache kết quả nowcast + amount (TTL + LRU) trước batch_inference.
+
+pre_irrigation_loop chạy mỗi 60 giây và find_upcoming_slots(find_next=True) có
+thể chọn lại cùng slot → cùng device, cùng cửa sổ sensor, cùng dòng API → cùng
+feature vector, predict lại y hệt. Cache giữ kết quả theo:
+
+    key = (device_id, model_version, amount_gate, feature vector đã lượng tử hoá)
+
+- Lượng tử hoá: round(x / FORECAST_CACHE_QUANTUM) → int64 (NaN → sentinel);
+  sai khác nhỏ hơn quantum (nhiễu float) vẫn trúng cache
+- TTL: entry quá FORECAST_CACHE_TTL giây bị coi là miss (dữ liệu API/sensor
+  có thể đã đổi ý nghĩa dù feature giống)
+- LRU: tối đa FORECAST_CACHE_SIZE entry, bỏ entry ít dùng nhất
+- Model hot reload (model_registry listener) → xoá toàn bộ cache
+- stats(): hits / misses / expired / evictions / invalidations / hit_rate
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from batch_inference import AMOUNT_GATE, BatchPrediction, predict_batch
+from model_registry import ModelBundle, get_registry
+
+# Giây một kết quả còn hiệu lực (0 = tắt cache)
+FORECAST_CACHE_TTL = float(os.getenv("FORECAST_CACHE_TTL", 300))
+FORECAST_CACHE_SIZE = int(os.getenv("FORECAST_CACHE_SIZE", 1024))
+# Bước lượng tử hoá feature khi tạo key
+FORECAST_CACHE_QUANTUM = float(os.getenv("FORECAST_CACHE_QUANTUM", 1e-4))
+
+_NAN_SENTINEL = np.iinfo(np.int64).min
+
+
+class CachedForecast(NamedTuple):
+    """Kết quả 1 dòng (không gồm label: tính lại từ threshold của bundle)."""
+
+    probability: float
+    amount_mm: Optional[float]
+    amount_from_model: Optional[bool]
+
+
+class ForecastCache:
+    """Cache TTL + LRU (thread-safe)."""
+
+    def __init__(self, ttl: float = FORECAST_CACHE_TTL, maxsize: int = FORECAST_CACHE_SIZE,
+                 quantum: float = FORECAST_CACHE_QUANTUM, clock=time.monotonic):
+        self.ttl = float(ttl)
+        self.maxsize = int(maxsize)
+        self.quantum = float(quantum)
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key → (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.maxsize > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def key(self, device_id: Optional[str], x: np.ndarray, model_version: str, amount_gate: float) -> Hashable:
+        q = np.asarray(x, dtype=np.float64) / self.quantum
+        q = np.where(np.isnan(q), _NAN_SENTINEL, np.round(q)).astype(np.int64)
+        return device_id, model_version, float(amount_gate), q.tobytes()
+
+    def get(self, key: Hashable):
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if now >= expires_at:
+                del self._entries[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value) -> None:
+        if not self.enabled:
+            return
+        expires_at = self._clock() + self.ttl
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+def predict_batch_cached(
+    X: np.ndarray,
+    device_ids: Sequence[Optional[str]],
+    models: Optional[ModelBundle] = None,
+    cache: Optional[ForecastCache] = None,
+    amount_gate: float = AMOUNT_GATE,
+) -> BatchPrediction:
+    """
+    predict_batch cho các dòng chưa có trong cache; dòng trúng cache dùng kết quả cũ.
+
+    Args:
+        X: feature matrix (N, 13)
+        device_ids: device của từng dòng (phần của key)
+    """
+    models = models or get_registry().get()
+    cache = get_forecast_cache() if cache is None else cache
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    if X.ndim == 1:
+        X = X.reshape(1, -1)
+    if not cache.enabled or not len(X):
+        return predict_batch(X, models, amount_gate=amount_gate)
+
+    keys = [cache.key(device_ids[k], X[k], models.version, amount_gate) for k in range(len(X))]
+    rows = [cache.get(key) for key in keys]
+    missing = [k for k, row in enumerate(rows) if row is None]
+    if missing:
+        batch = predict_batch(X[missing], models, amount_gate=amount_gate)
+        # Amount lỗi (model có nhưng không trả kết quả) → không cache, lần sau thử lại
+        cacheable = batch.amount_mm is not None or models.amount is None
+        for j, k in enumerate(missing):
+            rows[k] = CachedForecast(
+                probability=float(batch.probability[j]),
+                amount_mm=float(batch.amount_mm[j]) if batch.amount_mm is not None else None,
+                amount_from_model=bool(batch.amount_from_model[j]) if batch.amount_from_model is not None else None,
+            )
+            if cacheable:
+                cache.put(keys[k], rows[k])
+
+    probability = np.array([row.probability for row in rows], dtype=float)
+    has_amount = all(row.amount_mm is not None for row in rows)
+    return BatchPrediction(
+        probability=probability,
+        label=(probability >= models.threshold).astype(int),
+        amount_mm=np.array([row.amount_mm for row in rows], dtype=float) if has_amount else None,
+        threshold=models.threshold,
+        model_version=models.version,
+        amount_from_model=np.array([row.amount_from_model for row in rows], dtype=bool) if has_amount else None,
+    )
+
+
+_CACHE: Optional[ForecastCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_forecast_cache() -> ForecastCache:
+    """Cache dùng chung toàn process; tự xoá khi model registry load/reload model."""
+    global _CACHE
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                cache = ForecastCache()
+                get_registry().add_listener(lambda bundle: cache.clear())
+                _CACHE = cache
+    return _CACHE
+
+
+__all__ = [
+    "FORECAST_CACHE_TTL",
+    "FORECAST_CACHE_SIZE",
+    "CachedForecast",
+    "ForecastCache",
+    "predict_batch_cached",
+    "get_forecast_cache",
+]
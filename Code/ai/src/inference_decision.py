@@ -2,22 +2,33 @@
 Chạy suy luận offline: dự báo mưa (prob + nhãn) + lượng mưa 60 phút tới và ra quyết định tưới.
 
 Nguồn dữ liệu:
-- Sensor: data/sensor_raw_60d.csv (hoặc sensor_raw_60d_synth.csv)
+- Sensor: data/sensor_store (Parquet) hoặc data/sensor_raw_60d.csv (sensor_raw_60d_synth.csv)
 - API:    data/owm_history.csv (hoặc external_weather_60d.csv)
 
+Quyết định tưới đi theo 2 bước (decision_path trong output):
+- rule:* : luật theo độ ẩm đất cho cùng kết quả với MỌI xác suất mưa
+  (đất < 30% → tưới, đất >= 40% → không tưới) → bỏ qua API, features, models
+- model  : 30% <= đất < 40% → cần nowcast (+ amount) rồi mới quyết định
+
 Run:
   python src/inference_decision.py
 """
 
 import json
+import os
+import threading
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional, Tuple
 
-import joblib
 import numpy as np
 import pandas as pd
 
+from api_cache import get_api_cache
+from batch_inference import cascade_amount
 from feature_engineering import FEATURE_NAMES, compute_feature_from_window
+from model_registry import get_registry
+from sensor_history import frame_from_window, get_history
+from sensor_store import open_default_store
 
 ROOT = Path(__file__).resolve().parents[1]
 DATA_DIR = ROOT / "data"
@@ -29,6 +40,16 @@ SENSOR_SYNTH = DATA_DIR / "sensor_raw_60d_synth.csv"
 OWM_CSV = DATA_DIR / "owm_history.csv"
 EXT_WEATHER_CSV = DATA_DIR / "external_weather_60d.csv"
 
+# Ngưỡng quyết định tưới
+SOIL_VERY_DRY_PCT = 30.0
+SOIL_DRY_PCT = 40.0
+RAIN_PROB_LOW = 0.4
+RAIN_PROB_HIGH = 0.6
+# 0 = luôn chạy models (decision_path luôn là "model")
+DECISION_SHORT_CIRCUIT = os.getenv("DECISION_SHORT_CIRCUIT", "1") == "1"
+
+DECISION_PATH_MODEL = "model"
+
 
 def _choose_sensor_path() -> Path:
     if SENSOR_REAL.exists():
@@ -39,10 +60,13 @@ def _choose_sensor_path() -> Path:
 
 
 def load_sensor_buffer() -> pd.DataFrame:
-    path = _choose_sensor_path()
-    df = pd.read_csv(path, parse_dates=["ts"]).sort_values("ts")
-    # Lấy 12 bản ghi gần nhất (tương đương 60 phút với dữ liệu 5 phút)
-    df = df.tail(12).copy()
+    store = open_default_store()
+    if store is not None:
+        # Sensor store: chỉ đọc partition/hot segment gần nhất
+        df = store.tail(12)
+    else:
+        # Lấy 12 bản ghi gần nhất (tương đương 60 phút với dữ liệu 5 phút)
+        df = frame_from_window(get_history(_choose_sensor_path()).tail(12))
     df = df.rename(
         columns={
             "ts": "ts",
@@ -58,81 +82,110 @@ def load_sensor_buffer() -> pd.DataFrame:
 
 
 def load_api_row(ts_ref: pd.Timestamp) -> pd.Series:
-    api_df = None
-    if OWM_CSV.exists():
-        api_df = pd.read_csv(OWM_CSV, parse_dates=["ts"])
-    elif EXT_WEATHER_CSV.exists():
-        api_df = pd.read_csv(EXT_WEATHER_CSV, parse_dates=["ts"])
-        if "api_rain_prob_60" in api_df.columns:
-            api_df = api_df.rename(
-                columns={
-                    "api_rain_prob_60": "api_pop",
-                    "api_rain_mm_60": "api_rain_1h",
-                }
-            )
-        for col, default in [
-            ("api_temp_c", 25.0),
-            ("api_rh_pct", 70.0),
-            ("api_uvi", 5.0),
-        ]:
-            if col not in api_df.columns:
-                api_df[col] = default
-    else:
-        return pd.Series(
-            {
-                "api_pop": 0.2,
-                "api_rain_1h": 0.0,
-                "api_temp_c": 25.0,
-                "api_rh_pct": 70.0,
-                "api_uvi": 5.0,
-            }
-        )
-
-    api_df = api_df.sort_values("ts")
-    diff = (api_df["ts"] - ts_ref).abs()
-    idx = diff.idxmin()
-    row = api_df.loc[idx]
-    # Giới hạn tối đa lệch 1h, nếu xa hơn dùng default
-    if diff.loc[idx] > pd.Timedelta(hours=1):
-        return pd.Series(
-            {
-                "api_pop": 0.2,
-                "api_rain_1h": 0.0,
-                "api_temp_c": 25.0,
-                "api_rh_pct": 70.0,
-                "api_uvi": 5.0,
-            }
-        )
-    return row
+    """
+    Dữ liệu API gần ts_ref nhất (lệch tối đa 1h, xa hơn → giá trị mặc định).
+
+    Bảng API load 1 lần vào RAM và tra cứu bằng binary search (xem api_cache.py).
+    """
+    return get_api_cache().row(ts_ref)
 
 
 def load_models():
-    nowcast = joblib.load(MODEL_DIR / "xgb_nowcast.pkl")
-    meta = {}
-    try:
-        with open(MODEL_DIR / "metadata.json", "r") as f:
-            meta = json.load(f)
-    except Exception:
-        pass
-    amount = None
-    if (MODEL_DIR / "xgb_amount.pkl").exists():
-        amount = joblib.load(MODEL_DIR / "xgb_amount.pkl")
-    return nowcast, amount, meta
+    """(nowcast, amount, meta) từ model registry (load 1 lần, tự reload khi file đổi)."""
+    bundle = get_registry().get()
+    return bundle.nowcast, bundle.amount, bundle.meta
 
 
 def decide_irrigation(soil_moist: float, rain_prob: float) -> tuple[bool, str]:
     # đơn giản: ưu tiên an toàn tưới khi đất rất khô và mưa thấp
-    if soil_moist < 30:
+    if soil_moist < SOIL_VERY_DRY_PCT:
         return True, "Đất rất khô (<30%)"
-    if soil_moist < 40 and rain_prob < 0.4:
+    if soil_moist < SOIL_DRY_PCT and rain_prob < RAIN_PROB_LOW:
         return True, "Đất khô (<40%) và khả năng mưa thấp"
-    if rain_prob > 0.6:
+    if rain_prob > RAIN_PROB_HIGH:
         return False, "Khả năng mưa cao (>60%)"
     return False, "Đất đủ ẩm hoặc mưa trung bình"
 
 
+def decide_by_rules(soil_moist: float) -> Optional[Tuple[bool, str, str]]:
+    """
+    Quyết định chỉ từ độ ẩm đất, khi decide_irrigation cho cùng kết quả với mọi xác suất mưa.
+
+    Returns: (should_irrigate, reason, decision_path) hoặc None nếu cần nowcast.
+    """
+    if not DECISION_SHORT_CIRCUIT:
+        return None
+    if soil_moist < SOIL_VERY_DRY_PCT:
+        return True, "Đất rất khô (<30%)", "rule:soil_very_dry"
+    if soil_moist >= SOIL_DRY_PCT:
+        # Đất đủ ẩm: decide_irrigation luôn trả False (chỉ khác lý do)
+        return False, "Đất đủ ẩm (>=40%)", "rule:soil_moist"
+    return None
+
+
+class DecisionStats:
+    """Đếm quyết định theo decision_path (thread-safe, dùng chung toàn process)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.paths: Dict[str, int] = {}
+
+    def record(self, path: str) -> None:
+        with self._lock:
+            self.paths[path] = self.paths.get(path, 0) + 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            paths = dict(self.paths)
+        total = sum(paths.values())
+        short_circuit = sum(n for p, n in paths.items() if p.startswith("rule:"))
+        return {
+            "decisions": total,
+            "short_circuit": short_circuit,
+            "short_circuit_pct": short_circuit / total * 100 if total else 0.0,
+            "paths": paths,
+        }
+
+
+DECISION_STATS = DecisionStats()
+
+
+def _rule_output(sensor_df: pd.DataFrame, rule: Tuple[bool, str, str]) -> Dict:
+    """Output khi luật đã quyết định: không có dự báo (probability / amount = null)."""
+    should_irrigate, reason, path = rule
+    last = sensor_df.iloc[-1]
+    return {
+        "timestamp": last["ts"].isoformat(),
+        "decision_path": path,
+        "predictions": {
+            "rain_60min": {"probability": None, "label": None},
+            "rain_amount_60min_mm": None,
+            "rain_amount_source": None,
+        },
+        "sensor_ref": {
+            "temp_c": round(float(last["temp_c"]), 2),
+            "rh_pct": round(float(last["rh_pct"]), 2),
+            "pressure_hpa": round(float(last["pressure_hpa"]), 2),
+            "soil_moist_pct": round(float(last["soil_moist_pct"]), 2),
+        },
+        "recommendation": {
+            "should_irrigate": should_irrigate,
+            "reason": reason,
+            "threshold_used": None,
+        },
+    }
+
+
 def main():
     sensor_df = load_sensor_buffer()
+
+    # Luật rẻ trước: đất quá khô / đủ ẩm → không cần API, features, models
+    rule = decide_by_rules(float(sensor_df.iloc[-1]["soil_moist_pct"]))
+    if rule is not None:
+        DECISION_STATS.record(rule[2])
+        print(json.dumps(_rule_output(sensor_df, rule), ensure_ascii=False, indent=2))
+        return
+
     api_row = load_api_row(sensor_df["ts"].iloc[-1])
 
     fv = compute_feature_from_window(sensor_df, api_row, interval_seconds=300)
@@ -144,27 +197,22 @@ def main():
     prob = float(nowcast_model.predict_proba(x)[0, 1])
     label = int(prob >= threshold)
 
-    amount_mm = None
-    if amount_model is not None:
-        try:
-            import xgboost as xgb
-
-            if isinstance(amount_model, xgb.Booster):
-                amount_mm = float(amount_model.predict(xgb.DMatrix(x))[0])
-            else:
-                amount_mm = float(amount_model.predict(x)[0])
-        except Exception:
-            amount_mm = None
+    # Cascade: amount model chỉ chạy khi xác suất mưa >= AMOUNT_GATE
+    amounts, from_model = cascade_amount(amount_model, x, np.array([prob]))
+    amount_mm = float(amounts[0]) if amounts is not None else None
 
     soil_m = float(sensor_df.iloc[-1]["soil_moist_pct"])
     should_irrigate, reason = decide_irrigation(soil_m, prob)
+    DECISION_STATS.record(DECISION_PATH_MODEL)
 
     output = {
         "timestamp": sensor_df.iloc[-1]["ts"].isoformat(),
+        "decision_path": DECISION_PATH_MODEL,
         "features_used": FEATURE_NAMES,
         "predictions": {
             "rain_60min": {"probability": round(prob, 4), "label": label},
             "rain_amount_60min_mm": round(amount_mm, 2) if amount_mm is not None else None,
+            "rain_amount_source": None if from_model is None else ("model" if from_model[0] else "gate"),
         },
         "sensor_ref": {
             "temp_c": round(float(sensor_df.iloc[-1]["temp_c"]), 2),
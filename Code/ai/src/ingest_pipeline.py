@@ -0,0 +1,223 @@
+"""
+Ingest Pipeline - Tách MQTT callback khỏi parse / ghi đĩa / cập nhật buffer.
+
+    paho network thread ──submit()──► bounded queue ──► worker pool ──► handler(item)
+
+- on_message chỉ đẩy payload vào queue (O(1), không I/O) → PUBACK QoS 1 không bị
+  chậm vì đĩa hay model
+- Queue có giới hạn + drop policy rõ ràng khi đầy (burst):
+    + drop_newest : bỏ message mới đến (giữ dữ liệu đang chờ)
+    + drop_oldest : bỏ message cũ nhất trong queue (ưu tiên dữ liệu mới)
+    + block       : chặn callback tối đa block_timeout giây (backpressure lên
+                    broker: PUBACK chậm lại) rồi mới bỏ message mới
+- Metrics: độ sâu queue, tuổi message (lúc được xử lý + message cũ nhất đang chờ),
+  số message bị bỏ / lỗi
+
+Thứ tự: workers=1 xử lý đúng thứ tự nhận. Với workers > 1, queue KHÔNG gán device
+cố định cho worker → 2 reading của cùng device có thể chạy song song / lệch thứ tự;
+handler phải tự tuần tự hoá theo device (AIService: lock theo crc32(device_id),
+reading lệch thứ tự → StreamingFeatureEngine.rebuild() từ buffer đã sắp xếp).
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DROP_POLICIES = ("drop_newest", "drop_oldest", "block")
+
+
+class IngestPipeline:
+    """
+    Bounded work queue + worker pool (thread-safe).
+
+    Dùng:
+        pipeline = IngestPipeline(handler, workers=1, max_queue=10_000)
+        pipeline.start()
+        pipeline.submit(payload)      # từ on_message
+        pipeline.close()              # xử lý nốt queue rồi dừng
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Any], None],
+        workers: int = 1,
+        max_queue: int = 10_000,
+        drop_policy: str = "drop_oldest",
+        block_timeout: float = 1.0,
+        name: str = "ingest",
+    ):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"drop_policy must be one of {DROP_POLICIES}, got {drop_policy!r}")
+        if workers < 1 or max_queue < 1:
+            raise ValueError("workers and max_queue must be >= 1")
+
+        self.handler = handler
+        self.workers = workers
+        self.max_queue = max_queue
+        self.drop_policy = drop_policy
+        self.block_timeout = block_timeout
+        self.name = name
+
+        self._queue: "deque[tuple[float, Any]]" = deque()
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._running = False
+        self._closed = False
+
+        # Metrics
+        self._started_at = time.monotonic()
+        self._submitted = 0
+        self._processed = 0
+        self._failed = 0
+        self._dropped_newest = 0
+        self._dropped_oldest = 0
+        self._in_flight = 0
+        self._max_depth = 0
+        self._age_total = 0.0
+        self._age_max = 0.0
+        self._age_last = 0.0
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def start(self) -> "IngestPipeline":
+        with self._cond:
+            if self._running:
+                return self
+            self._running = True
+            self._closed = False
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"{self.name}-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def submit(self, item: Any) -> bool:
+        """
+        Đưa 1 item vào queue (gọi từ MQTT callback).
+
+        Returns False nếu item bị bỏ (queue đầy với drop_newest / hết block_timeout,
+        hoặc pipeline đã đóng).
+        """
+        now = time.monotonic()
+        with self._cond:
+            if self._closed:
+                self._dropped_newest += 1
+                return False
+
+            if len(self._queue) >= self.max_queue:
+                if self.drop_policy == "drop_oldest":
+                    self._queue.popleft()
+                    self._dropped_oldest += 1
+                elif self.drop_policy == "block":
+                    deadline = now + self.block_timeout
+                    while len(self._queue) >= self.max_queue and not self._closed:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0 or not self._cond.wait(remaining):
+                            break
+                    if len(self._queue) >= self.max_queue or self._closed:
+                        self._dropped_newest += 1
+                        return False
+                else:
+                    self._dropped_newest += 1
+                    return False
+
+            self._queue.append((now, item))
+            self._submitted += 1
+            if len(self._queue) > self._max_depth:
+                self._max_depth = len(self._queue)
+            self._cond.notify_all()
+        return True
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._queue and self._running:
+                    self._cond.wait()
+                if not self._queue:
+                    return  # đã dừng và queue rỗng
+                enqueued_at, item = self._queue.popleft()
+                self._in_flight += 1
+                # Báo cho submit() đang block (queue vừa có chỗ trống)
+                self._cond.notify_all()
+
+            age = time.monotonic() - enqueued_at
+            ok = True
+            try:
+                self.handler(item)
+            except Exception as e:
+                ok = False
+                logger.error(f"[{self.name}] handler failed: {e}", exc_info=True)
+
+            with self._cond:
+                self._in_flight -= 1
+                self._processed += 1
+                if not ok:
+                    self._failed += 1
+                self._age_total += age
+                self._age_last = age
+                if age > self._age_max:
+                    self._age_max = age
+                if not self._queue and not self._in_flight:
+                    self._cond.notify_all()
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Đợi queue rỗng và không còn item đang xử lý. Returns True nếu đã rỗng."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._queue or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, drain: bool = True, timeout: Optional[float] = 10.0):
+        """Ngừng nhận item; drain=True → xử lý nốt queue trước khi dừng worker."""
+        with self._cond:
+            self._closed = True
+            if not drain:
+                self._dropped_oldest += len(self._queue)
+                self._queue.clear()
+            self._running = False
+            self._cond.notify_all()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for t in self._threads:
+            t.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        self._threads = [t for t in self._threads if t.is_alive()]
+
+    def stats(self) -> Dict:
+        """Snapshot metrics (depth, tuổi message, drop, throughput)."""
+        now = time.monotonic()
+        with self._cond:
+            oldest_age = now - self._queue[0][0] if self._queue else 0.0
+            elapsed = max(now - self._started_at, 1e-9)
+            return {
+                "depth": len(self._queue),
+                "max_depth": self._max_depth,
+                "capacity": self.max_queue,
+                "in_flight": self._in_flight,
+                "submitted": self._submitted,
+                "processed": self._processed,
+                "failed": self._failed,
+                "dropped": self._dropped_newest + self._dropped_oldest,
+                "dropped_newest": self._dropped_newest,
+                "dropped_oldest": self._dropped_oldest,
+                "oldest_age_ms": oldest_age * 1000,
+                "age_last_ms": self._age_last * 1000,
+                "age_avg_ms": (self._age_total / self._processed * 1000) if self._processed else 0.0,
+                "age_max_ms": self._age_max * 1000,
+                "processed_per_sec": self._processed / elapsed,
+            }
+
+
+__all__ = [
+    "DROP_POLICIES",
+    "IngestPipeline",
+]
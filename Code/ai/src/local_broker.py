@@ -0,0 +1,279 @@
+"""
+Local Broker - MQTT broker stand-in trong process (test / benchmark, không cần mạng).
+
+- LocalBroker: route message theo topic filter (+, #), retained message,
+  shared subscription MQTT 5 ($share/<group>/<filter>, round-robin trong group)
+- LocalClient: API con của paho.mqtt.client.Client mà AIService / collector dùng
+  (connect, loop_start/stop, subscribe, publish, disconnect, on_connect /
+  on_message / on_disconnect) → inject thay cho paho client
+
+QoS chỉ được ghi lại (không retransmit); mỗi client có 1 thread giao message
+(giống network thread của paho sau loop_start()).
+
+Dùng:
+    broker = LocalBroker()
+    svc = AIService(client=LocalClient("ai", broker=broker))
+    LocalClient("esp32", broker=broker).publish("sensor/data/push", payload)
+"""
+
+from __future__ import annotations
+
+import itertools
+import queue
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from paho.mqtt.client import topic_matches_sub
+
+SHARE_PREFIX = "$share/"
+
+
+class LocalMessage:
+    """Giống paho MQTTMessage (các thuộc tính AIService dùng)."""
+
+    __slots__ = ("topic", "payload", "qos", "retain", "mid", "timestamp")
+
+    def __init__(self, topic: str, payload: bytes, qos: int = 0, retain: bool = False, mid: int = 0):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self.mid = mid
+        self.timestamp = time.monotonic()
+
+
+class LocalMessageInfo:
+    """Giống paho MQTTMessageInfo: publish đã "hoàn tất" ngay khi broker nhận."""
+
+    def __init__(self, mid: int, rc: int = 0):
+        self.mid = mid
+        self.rc = rc
+
+    def is_published(self) -> bool:
+        return self.rc == 0
+
+    def wait_for_publish(self, timeout: Optional[float] = None) -> None:
+        return None
+
+
+def _to_bytes(payload: Any) -> bytes:
+    if payload is None:
+        return b""
+    if isinstance(payload, (bytes, bytearray)):
+        return bytes(payload)
+    if isinstance(payload, str):
+        return payload.encode("utf-8")
+    return str(payload).encode("utf-8")
+
+
+class LocalBroker:
+    """Broker trong process, thread-safe."""
+
+    _default: Optional["LocalBroker"] = None
+    _default_lock = threading.Lock()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subs: Dict["LocalClient", List[str]] = defaultdict(list)
+        self._shared: Dict[Tuple[str, str], List["LocalClient"]] = {}
+        self._shared_rr: Dict[Tuple[str, str], itertools.count] = {}
+        self._retained: Dict[str, LocalMessage] = {}
+        self._mid = itertools.count(1)
+        self.published = 0
+        self.delivered = 0
+
+    @classmethod
+    def default(cls) -> "LocalBroker":
+        """Broker dùng chung trong process (LocalClient không truyền broker)."""
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = cls()
+            return cls._default
+
+    # ----- Client API (gọi từ LocalClient) -----
+    def subscribe(self, client: "LocalClient", topic: str) -> None:
+        with self._lock:
+            if topic.startswith(SHARE_PREFIX):
+                group, flt = topic[len(SHARE_PREFIX):].split("/", 1)
+                members = self._shared.setdefault((group, flt), [])
+                if client not in members:
+                    members.append(client)
+                self._shared_rr.setdefault((group, flt), itertools.count())
+                return  # shared subscription không nhận retained
+            if topic not in self._subs[client]:
+                self._subs[client].append(topic)
+            retained = [m for t, m in self._retained.items() if topic_matches_sub(topic, t)]
+        for msg in retained:
+            client._deliver(msg)
+
+    def unsubscribe(self, client: "LocalClient", topic: str) -> None:
+        with self._lock:
+            if topic.startswith(SHARE_PREFIX):
+                group, flt = topic[len(SHARE_PREFIX):].split("/", 1)
+                members = self._shared.get((group, flt), [])
+                if client in members:
+                    members.remove(client)
+            elif topic in self._subs.get(client, []):
+                self._subs[client].remove(topic)
+
+    def detach(self, client: "LocalClient") -> None:
+        with self._lock:
+            self._subs.pop(client, None)
+            for members in self._shared.values():
+                if client in members:
+                    members.remove(client)
+
+    def publish(self, topic: str, payload: Any, qos: int = 0, retain: bool = False) -> int:
+        mid = next(self._mid)
+        msg = LocalMessage(topic, _to_bytes(payload), qos=qos, retain=False, mid=mid)
+        targets: List["LocalClient"] = []
+        with self._lock:
+            self.published += 1
+            if retain:
+                if msg.payload:
+                    self._retained[topic] = LocalMessage(topic, msg.payload, qos=qos, retain=True, mid=mid)
+                else:
+                    self._retained.pop(topic, None)
+            for client, filters in self._subs.items():
+                if any(topic_matches_sub(f, topic) for f in filters):
+                    targets.append(client)
+            for key, members in self._shared.items():
+                if members and topic_matches_sub(key[1], topic):
+                    targets.append(members[next(self._shared_rr[key]) % len(members)])
+            self.delivered += len(targets)
+        for client in targets:
+            client._deliver(msg)
+        return mid
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "published": self.published,
+                "delivered": self.delivered,
+                "clients": len(self._subs),
+                "shared_groups": sum(1 for m in self._shared.values() if m),
+                "retained": len(self._retained),
+            }
+
+
+class LocalClient:
+    """Client giống paho (subset) nói chuyện với LocalBroker."""
+
+    def __init__(self, client_id: str = "", broker: Optional[LocalBroker] = None, userdata: Any = None, **kwargs):
+        self._client_id = client_id
+        self.broker = broker if broker is not None else LocalBroker.default()
+        self._userdata = userdata
+        self._inbox: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._connected = False
+        self.on_connect = None
+        self.on_message = None
+        self.on_disconnect = None
+
+    # ----- Cấu hình (no-op, cho tương thích paho) -----
+    def username_pw_set(self, username, password=None) -> None:
+        pass
+
+    def tls_set(self, *args, **kwargs) -> None:
+        pass
+
+    def user_data_set(self, userdata) -> None:
+        self._userdata = userdata
+
+    # ----- Kết nối -----
+    def connect(self, host: str = "localhost", port: int = 1883, keepalive: int = 60, **kwargs) -> int:
+        self._connected = True
+        # CONNACK được giao trên thread của client (như paho)
+        self._inbox.put(("connect", None))
+        return 0
+
+    def reconnect(self) -> int:
+        return self.connect()
+
+    def disconnect(self, *args, **kwargs) -> int:
+        if self._connected:
+            self._connected = False
+            self.broker.detach(self)
+            if self.on_disconnect is not None:
+                self.on_disconnect(self, self._userdata, 0)
+        return 0
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    # ----- Network loop -----
+    def loop_start(self) -> int:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop_forever, name=f"local-mqtt-{self._client_id}", daemon=True)
+            self._thread.start()
+        return 0
+
+    def loop_stop(self) -> int:
+        if self._thread is not None:
+            self._inbox.put(None)
+            self._thread.join(timeout=5)
+            self._thread = None
+        return 0
+
+    def loop(self, timeout: float = 1.0) -> int:
+        """Xử lý các event đang chờ (không dùng thread)."""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                event = self._inbox.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                return 0
+            if event is None:
+                return 0
+            self._dispatch(event)
+            if self._inbox.empty():
+                return 0
+
+    def loop_forever(self) -> int:
+        self._loop_forever()
+        return 0
+
+    def _loop_forever(self) -> None:
+        while True:
+            event = self._inbox.get()
+            if event is None:
+                return
+            self._dispatch(event)
+
+    def _dispatch(self, event: tuple) -> None:
+        kind, msg = event
+        if kind == "connect":
+            if self.on_connect is not None:
+                self.on_connect(self, self._userdata, {"session present": 0}, 0)
+        elif kind == "message" and self._connected and self.on_message is not None:
+            self.on_message(self, self._userdata, msg)
+
+    def _deliver(self, msg: LocalMessage) -> None:
+        self._inbox.put(("message", msg))
+
+    # ----- Pub / sub -----
+    def subscribe(self, topic: str, qos: int = 0, **kwargs) -> Tuple[int, int]:
+        self.broker.subscribe(self, topic)
+        return 0, 0
+
+    def unsubscribe(self, topic: str, **kwargs) -> Tuple[int, int]:
+        self.broker.unsubscribe(self, topic)
+        return 0, 0
+
+    def publish(self, topic: str, payload: Any = None, qos: int = 0, retain: bool = False, **kwargs) -> LocalMessageInfo:
+        if not self._connected:
+            return LocalMessageInfo(0, rc=4)  # MQTT_ERR_NO_CONN
+        return LocalMessageInfo(self.broker.publish(topic, payload, qos=qos, retain=retain))
+
+    def pending(self) -> int:
+        """Số event chưa giao (độ trễ phía client)."""
+        return self._inbox.qsize()
+
+
+__all__ = [
+    "LocalBroker",
+    "LocalClient",
+    "LocalMessage",
+]
@@ -0,0 +1,214 @@
+"""
+Metrics - Histogram độ trễ theo stage + endpoint HTTP định dạng Prometheus text.
+
+Hot path của ai_service / pre_irrigation_check đo từng stage:
+    with stage_timer("json_decode"):
+        data = json.loads(payload)
+
+- Histogram bucket cố định (50 µs → 10 s), mỗi observe = perf_counter + bisect
+  + cộng dưới 1 lock (~1 µs) → để bật cả production (METRICS_ENABLED=0 để tắt)
+- Gauge lấy từ stats() có sẵn (ingest queue, cascade, forecast cache ...) qua
+  add_source(): chỉ đọc khi Prometheus scrape, không tốn gì trên hot path
+- serve_metrics(): http.server (thread daemon) trả GET /metrics
+
+Stage chuẩn:
+    mqtt_receive, json_decode, persist, window_build, api_lookup, features,
+    predict, rolling_predict, schedule_save, publish
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+# Endpoint /metrics (port 0 = không mở server)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9108))
+
+STAGE_METRIC = "ai_stage_latency_seconds"
+DEFAULT_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+class Histogram:
+    """Histogram tích luỹ kiểu Prometheus (thread-safe)."""
+
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # bucket cuối = +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self) -> Tuple[List[int], float, int]:
+        """(số mẫu tích luỹ theo bucket, gồm +Inf; sum; count)."""
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative, running = [], 0
+        for c in counts:
+            running += c
+            cumulative.append(running)
+        return cumulative, total, count
+
+    def quantile(self, q: float) -> float:
+        """Ước lượng quantile theo bucket (cận trên của bucket chứa quantile)."""
+        cumulative, _, count = self.snapshot()
+        if not count:
+            return 0.0
+        rank = q * count
+        for bound, c in zip(self.buckets + (float("inf"),), cumulative):
+            if c >= rank:
+                return bound
+        return float("inf")
+
+
+class _StageTimer:
+    __slots__ = ("_hist", "_t0")
+
+    def __init__(self, hist: Optional[Histogram]):
+        self._hist = hist
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self._hist is not None:
+            self._hist.observe(time.perf_counter() - self._t0)
+        return False
+
+
+class MetricsRegistry:
+    """Histogram theo stage + nguồn gauge (dict số) cho 1 process."""
+
+    def __init__(self, enabled: bool = METRICS_ENABLED, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self._stages: Dict[str, Histogram] = {}
+        self._sources: Dict[str, Callable[[], Mapping]] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, stage: str) -> Histogram:
+        hist = self._stages.get(stage)
+        if hist is None:
+            with self._lock:
+                hist = self._stages.setdefault(stage, Histogram(self.buckets))
+        return hist
+
+    def timer(self, stage: str) -> _StageTimer:
+        return _StageTimer(self.histogram(stage) if self.enabled else None)
+
+    def observe(self, stage: str, seconds: float) -> None:
+        if self.enabled:
+            self.histogram(stage).observe(seconds)
+
+    def add_source(self, prefix: str, fn: Callable[[], Mapping]) -> None:
+        """Gauge `<prefix>_<key>` cho mỗi giá trị số trong fn() (ghi đè nếu trùng prefix)."""
+        with self._lock:
+            self._sources[prefix] = fn
+
+    def stages(self) -> Dict[str, Histogram]:
+        with self._lock:
+            return dict(self._stages)
+
+    def render(self) -> str:
+        """Prometheus text exposition format 0.0.4."""
+        lines = [
+            f"# HELP {STAGE_METRIC} Latency of AI service hot-path stages",
+            f"# TYPE {STAGE_METRIC} histogram",
+        ]
+        for stage, hist in sorted(self.stages().items()):
+            cumulative, total, count = hist.snapshot()
+            for bound, c in zip(hist.buckets, cumulative):
+                lines.append(f'{STAGE_METRIC}_bucket{{stage="{stage}",le="{bound:g}"}} {c}')
+            lines.append(f'{STAGE_METRIC}_bucket{{stage="{stage}",le="+Inf"}} {cumulative[-1]}')
+            lines.append(f'{STAGE_METRIC}_sum{{stage="{stage}"}} {total:.9f}')
+            lines.append(f'{STAGE_METRIC}_count{{stage="{stage}"}} {count}')
+
+        with self._lock:
+            sources = list(self._sources.items())
+        for prefix, fn in sorted(sources):
+            try:
+                values = fn() or {}
+            except Exception as e:
+                logger.debug(f"Metrics source {prefix} failed: {e}")
+                continue
+            for key, value in sorted(values.items()):
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f"{prefix}_{key}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+
+
+def stage_timer(stage: str) -> _StageTimer:
+    """Context manager đo 1 stage vào registry dùng chung."""
+    return METRICS.timer(stage)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry: MetricsRegistry = METRICS
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Không log mỗi lần scrape
+
+
+def serve_metrics(port: int = METRICS_PORT, host: str = METRICS_HOST,
+                  registry: MetricsRegistry = METRICS) -> Optional[ThreadingHTTPServer]:
+    """Mở GET /metrics trên thread daemon; port 0 hoặc lỗi bind → None."""
+    if not port:
+        return None
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+    try:
+        server = ThreadingHTTPServer((host, port), handler)
+    except OSError as e:
+        logger.warning(f"⚠️  Metrics endpoint disabled ({host}:{port}: {e})")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"📈 Metrics: http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+__all__ = [
+    "METRICS",
+    "METRICS_PORT",
+    "Histogram",
+    "MetricsRegistry",
+    "stage_timer",
+    "serve_metrics",
+]
@@ -0,0 +1,393 @@
+"""
+Model Registry - Load model 1 lần / process, hot reload khi file model thay đổi.
+
+- get_registry(): registry dùng chung toàn process (ai_service, pre_irrigation_check,
+  inference_decision, demo ...)
+- registry.get() trả về ModelBundle (nowcast + amount + metadata + version) bất biến;
+  caller lấy bundle 1 lần cho mỗi lần dự báo → 3 thành phần luôn cùng phiên bản
+- get() chỉ trả tham chiếu bundle hiện tại (chỉ load ở lần gọi đầu tiên). Thread
+  nền (model-watch) mỗi `check_interval` giây stat() các file model; nếu mtime/size
+  đổi (và file đã ghi xong > `settle` giây) thì load bản mới (unpickle, warm-up,
+  compile backend) vào biến tạm rồi mới thay bundle (1 phép gán) → không request
+  nào phải chờ reload, reader không bao giờ thấy model nửa cũ nửa mới.
+  Load lỗi (file đang ghi dở, pickle hỏng) → giữ bundle cũ, thử lại lần check sau.
+- version = hash nội dung các file (12 ký tự hex), loaded_at = thời điểm load (UTC)
+- backend = backend predict (predictors.py: xgboost | numpy | onnx | treelite),
+  chọn qua INFERENCE_BACKEND hoặc set_backend() lúc khởi động
+- Backend numpy: nếu models/*.npz (python src/tree_ensemble.py) mới hơn .pkl tương
+  ứng thì load thẳng TreeEnsemble từ .npz (không unpickle, không cần xgboost);
+  .npz cũ hơn .pkl (model vừa train lại) → bỏ qua, export lại từ booster
+- Bundle mới được warm-up trên dòng tổng hợp trước khi thay bundle cũ (MODEL_WARMUP)
+  → request đầu tiên sau load / reload không trả chi phí cấp phát + dựng thread pool
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from predictors import (
+    BACKENDS,
+    INFERENCE_BACKEND,
+    backend_of,
+    load_numpy_amount,
+    load_numpy_nowcast,
+    make_amount_predictor,
+    make_nowcast_predictor,
+    num_features,
+)
+from tree_ensemble import AMOUNT_NPZ, NOWCAST_NPZ
+
+logger = logging.getLogger(__name__)
+
+ROOT = Path(__file__).resolve().parents[1]
+MODEL_DIR = ROOT / "models"
+
+NOWCAST_FILE = "xgb_nowcast.pkl"
+AMOUNT_FILE = "xgb_amount.pkl"
+META_FILE = "metadata.json"
+
+# Giây giữa 2 lần stat() file model của thread nền (0 = tắt, chỉ reload qua refresh())
+MODEL_RELOAD_INTERVAL = float(os.getenv("MODEL_RELOAD_INTERVAL", 30))
+# File vừa sửa < settle giây → có thể đang được ghi, đợi lần check sau
+MODEL_RELOAD_SETTLE = 2.0
+# Số thread cho predict của nowcast + amount (0 = mặc định xgboost), xem wrappers.py
+PREDICT_NTHREAD = int(os.getenv("PREDICT_NTHREAD", 0))
+# Budget riêng cho lần gọi ≤ PREDICT_SMALL_BATCH dòng (0 = dùng chung PREDICT_NTHREAD)
+PREDICT_NTHREAD_SINGLE = int(os.getenv("PREDICT_NTHREAD_SINGLE", 1))
+# Warm-up: vài lần predict 1 dòng + 1 batch MODEL_WARMUP_ROWS dòng tổng hợp mỗi model
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "1") == "1"
+MODEL_WARMUP_ROWS = int(os.getenv("MODEL_WARMUP_ROWS", 256))
+
+Signature = Dict[str, Tuple[int, int]]
+
+
+@dataclass(frozen=True)
+class ModelBundle:
+    """Bộ model đã load (bất biến)."""
+
+    nowcast: Any
+    amount: Any
+    meta: Dict
+    version: str
+    loaded_at: datetime
+    signature: Signature = field(repr=False)
+    backend: str = "xgboost"
+    warmup_ms: float = 0.0
+
+    @property
+    def threshold(self) -> float:
+        return float(self.meta.get("threshold_default", 0.5)) if self.meta else 0.5
+
+    def info(self) -> Dict:
+        return {
+            "version": self.version,
+            "loaded_at": self.loaded_at.isoformat().replace("+00:00", "Z"),
+            "has_amount": self.amount is not None,
+            "backend": self.backend,
+            "threshold": self.threshold,
+            "nthread": getattr(self.nowcast, "nthread", 0),
+            "single_nthread": getattr(self.nowcast, "single_nthread", 0),
+            "warmup_ms": self.warmup_ms,
+        }
+
+
+def _load_nowcast(path: Path):
+    """xgb_nowcast.pkl: wrapper XGBBoosterWithThreshold hoặc payload raw (train save_mode='raw')."""
+    import joblib
+
+    obj = joblib.load(path)
+    if isinstance(obj, dict) and "booster_bytes" in obj:
+        import xgboost as xgb
+        from wrappers import XGBBoosterWithThreshold
+
+        booster = xgb.Booster()
+        booster.load_model(bytearray(obj["booster_bytes"]))
+        best_iteration = int(obj.get("best_iteration", -1))
+        if best_iteration >= 0:
+            booster.set_attr(best_iteration=str(best_iteration))
+        obj = XGBBoosterWithThreshold(booster, threshold=float(obj.get("threshold", 0.5)))
+    return obj
+
+
+def _load_amount(path: Path):
+    """xgb_amount.pkl: xgb.Booster trần → XGBAmountRegressor (predict trên NumPy, không DMatrix)."""
+    import joblib
+
+    obj = joblib.load(path)
+    import xgboost as xgb
+    from wrappers import XGBAmountRegressor
+
+    if isinstance(obj, xgb.Booster):
+        obj = XGBAmountRegressor(obj, nthread=PREDICT_NTHREAD, single_nthread=PREDICT_NTHREAD_SINGLE)
+    return obj
+
+
+def warm_up_models(nowcast, amount=None, rows: int = MODEL_WARMUP_ROWS) -> float:
+    """
+    Predict trên dòng tổng hợp: 3 lần × 1 dòng (budget single-row) + 1 batch `rows` dòng
+    (budget batch) cho mỗi model. Returns ms.
+    """
+    t0 = time.perf_counter()
+    rng = np.random.default_rng(0)
+    X = rng.normal(0.0, 1.0, size=(max(int(rows), 3), num_features(nowcast))).astype(np.float32)
+    X[rng.random(X.shape) < 0.05] = np.nan  # nhánh default (thiếu dữ liệu)
+    for predict in (nowcast.predict_proba, amount.predict if amount is not None else None):
+        if predict is None:
+            continue
+        for k in range(3):
+            predict(X[k:k + 1])
+        predict(X)
+    return (time.perf_counter() - t0) * 1000
+
+
+class ModelRegistry:
+    """Giữ ModelBundle hiện tại của 1 thư mục model (thread-safe)."""
+
+    def __init__(self, model_dir: Path = MODEL_DIR, check_interval: float = MODEL_RELOAD_INTERVAL,
+                 settle: float = MODEL_RELOAD_SETTLE, backend: str = INFERENCE_BACKEND):
+        self.model_dir = Path(model_dir)
+        self.backend = backend
+        self.check_interval = check_interval
+        self.settle = settle
+        self._bundle: Optional[ModelBundle] = None
+        self._lock = threading.Lock()
+        self._last_check = 0.0
+        self._watcher: Optional[threading.Thread] = None
+        self._stop_watch = threading.Event()
+        self._watch_lock = threading.Lock()
+        self._listeners: List[Callable[[ModelBundle], None]] = []
+        self.reloads = 0
+        self.reload_errors = 0
+
+    # ----- Public -----
+    def get(self) -> ModelBundle:
+        """Bundle hiện tại (load lần đầu; reload do thread nền model-watch đảm nhận)."""
+        if self._bundle is None:
+            loaded = None
+            with self._lock:
+                if self._bundle is None:
+                    loaded = self._bundle = self._load()
+                    self._last_check = time.monotonic()
+            if loaded is not None:
+                self._start_watcher()
+                self._notify(loaded)
+        return self._bundle
+
+    def refresh(self, force: bool = False) -> bool:
+        """Kiểm tra file model, reload nếu thay đổi. Returns True nếu đã swap bundle."""
+        with self._lock:
+            self._last_check = time.monotonic()
+            current = self._bundle
+            signature = self._signature()
+            if not force and current is not None and signature == current.signature:
+                return False
+            if not force and self._recently_modified(signature):
+                return False
+            try:
+                new_bundle = self._load()
+            except Exception as e:
+                self.reload_errors += 1
+                if current is None:
+                    raise
+                logger.error(f"Model reload failed, keeping version {current.version}: {e}")
+                return False
+            if current is not None and (new_bundle.version, new_bundle.backend) == (current.version, current.backend):
+                # Chỉ mtime đổi (touch / copy lại cùng nội dung)
+                self._bundle = replace(current, signature=new_bundle.signature)
+                return False
+            self._bundle = new_bundle
+            if current is not None:
+                self.reloads += 1
+                logger.info(f"🔄 Models reloaded: {current.version} → {new_bundle.version}")
+        self._start_watcher()
+        self._notify(new_bundle)
+        return True
+
+    def stop_watcher(self, timeout: float = 5.0) -> None:
+        """Dừng thread nền kiểm tra file model (vd. khi tắt process / trong test)."""
+        self._stop_watch.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout)
+
+    def set_backend(self, backend: str, load: bool = True) -> Optional[ModelBundle]:
+        """
+        Đổi backend predict (vd. cờ --backend lúc khởi động) và load lại ngay.
+
+        load=False khi chưa load model: chỉ ghi nhận backend, lần get() đầu tiên
+        (vd. warm-up nền của ai_service) mới load.
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown inference backend '{backend}' (choices: {', '.join(BACKENDS)})")
+        previous, self.backend = self.backend, backend
+        if not load and self._bundle is None:
+            return None
+        try:
+            if self._bundle is not None:
+                self.refresh(force=True)
+            return self.get()
+        except Exception:
+            self.backend = previous
+            raise
+
+    def add_listener(self, callback: Callable[[ModelBundle], None]) -> None:
+        """callback(bundle) sau mỗi lần load / reload (vd. xoá cache dự báo)."""
+        self._listeners.append(callback)
+
+    @property
+    def version(self) -> Optional[str]:
+        return self._bundle.version if self._bundle is not None else None
+
+    @property
+    def loaded_at(self) -> Optional[datetime]:
+        return self._bundle.loaded_at if self._bundle is not None else None
+
+    def info(self) -> Dict:
+        bundle = self._bundle
+        info = bundle.info() if bundle is not None else {"version": None, "loaded_at": None}
+        info.update({"model_dir": str(self.model_dir), "requested_backend": self.backend, "reloads": self.reloads, "reload_errors": self.reload_errors})
+        return info
+
+    # ----- Internal -----
+    def _start_watcher(self) -> None:
+        if self.check_interval <= 0 or self._stop_watch.is_set():
+            return
+        with self._watch_lock:
+            if self._watcher is None:
+                self._watcher = threading.Thread(target=self._watch_loop, name="model-watch", daemon=True)
+                self._watcher.start()
+
+    def _watch_loop(self) -> None:
+        while not self._stop_watch.wait(self.check_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Model refresh failed: {e}", exc_info=True)
+
+    def _paths(self) -> List[Path]:
+        names = [NOWCAST_FILE, AMOUNT_FILE, META_FILE]
+        if self.backend == "numpy":
+            names += [NOWCAST_NPZ, AMOUNT_NPZ]
+        return [self.model_dir / name for name in names]
+
+    def _fresh_npz(self) -> Optional[Tuple[Path, Optional[Path]]]:
+        """(nowcast .npz, amount .npz | None) nếu mọi .npz cần dùng mới hơn .pkl tương ứng, ngược lại None."""
+
+        def fresh(npz: Path, pkl: Path) -> bool:
+            if not npz.exists():
+                return False
+            if pkl.exists() and npz.stat().st_mtime_ns < pkl.stat().st_mtime_ns:
+                logger.warning(f"⚠️  {npz.name} older than {pkl.name}, re-export with src/tree_ensemble.py")
+                return False
+            return True
+
+        nowcast = self.model_dir / NOWCAST_NPZ
+        if not fresh(nowcast, self.model_dir / NOWCAST_FILE):
+            return None
+        amount_pkl = self.model_dir / AMOUNT_FILE
+        amount = self.model_dir / AMOUNT_NPZ if amount_pkl.exists() else None
+        if amount is not None and not fresh(amount, amount_pkl):
+            return None
+        return nowcast, amount
+
+    def _signature(self) -> Signature:
+        signature = {}
+        for path in self._paths():
+            try:
+                st = path.stat()
+                signature[path.name] = (st.st_mtime_ns, st.st_size)
+            except FileNotFoundError:
+                continue
+        return signature
+
+    def _recently_modified(self, signature: Signature) -> bool:
+        now_ns = time.time_ns()
+        return any(now_ns - mtime_ns < self.settle * 1e9 for mtime_ns, _ in signature.values())
+
+    def _load(self) -> ModelBundle:
+        t0 = time.perf_counter()
+        signature = self._signature()
+        digest = hashlib.sha256()
+        for path in self._paths():
+            if path.exists():
+                digest.update(path.name.encode())
+                digest.update(path.read_bytes())
+
+        meta = {}
+        try:
+            with open(self.model_dir / META_FILE, "r") as f:
+                meta = json.load(f)
+        except Exception:
+            pass
+
+        npz = self._fresh_npz() if self.backend == "numpy" else None
+        if npz is not None:
+            nowcast = load_numpy_nowcast(npz[0], threshold=float(meta.get("threshold_default", 0.5)))
+            amount = load_numpy_amount(npz[1]) if npz[1] is not None else None
+        else:
+            nowcast = _load_nowcast(self.model_dir / NOWCAST_FILE)
+            amount = None
+            if (self.model_dir / AMOUNT_FILE).exists():
+                amount = _load_amount(self.model_dir / AMOUNT_FILE)
+            if hasattr(nowcast, "set_nthread"):
+                nowcast.set_nthread(PREDICT_NTHREAD, PREDICT_NTHREAD_SINGLE)
+            nowcast = make_nowcast_predictor(nowcast, self.backend, PREDICT_NTHREAD, PREDICT_NTHREAD_SINGLE)
+            amount = make_amount_predictor(amount, self.backend, PREDICT_NTHREAD, PREDICT_NTHREAD_SINGLE)
+        # Trước khi swap: lỗi predict → coi như load lỗi (giữ bundle cũ)
+        warmup_ms = warm_up_models(nowcast, amount) if MODEL_WARMUP else 0.0
+
+        bundle = ModelBundle(
+            nowcast=nowcast,
+            amount=amount,
+            meta=meta,
+            version=digest.hexdigest()[:12],
+            loaded_at=datetime.now(timezone.utc),
+            signature=signature,
+            backend=backend_of(nowcast),
+            warmup_ms=warmup_ms,
+        )
+        logger.info(
+            f"✓ Models loaded: version {bundle.version}, backend {bundle.backend}{' (.npz)' if npz is not None else ''} "
+            f"({(time.perf_counter() - t0) * 1000:.0f} ms, warm-up {warmup_ms:.0f} ms)"
+        )
+        return bundle
+
+    def _notify(self, bundle: ModelBundle) -> None:
+        for callback in list(self._listeners):
+            try:
+                callback(bundle)
+            except Exception as e:
+                logger.error(f"Model listener failed: {e}", exc_info=True)
+
+
+_REGISTRY: Optional[ModelRegistry] = None
+_REGISTRY_LOCK = threading.Lock()
+
+
+def get_registry() -> ModelRegistry:
+    """Registry dùng chung toàn process (models/ của project)."""
+    global _REGISTRY
+    if _REGISTRY is None:
+        with _REGISTRY_LOCK:
+            if _REGISTRY is None:
+                _REGISTRY = ModelRegistry()
+    return _REGISTRY
+
+
+__all__ = [
+    "MODEL_DIR",
+    "ModelBundle",
+    "ModelRegistry",
+    "get_registry",
+    "warm_up_models",
+]
@@ -24,13 +24,13 @@ import paho.mqtt.client as mqtt
 from dotenv import load_dotenv
 
 # Import inference logic
-from inference_decision import (
-    load_api_row,
-    load_models,
-    decide_irrigation,
-)
+from inference_decision import DECISION_PATH_MODEL, DECISION_STATS, decide_by_rules, decide_irrigation
+from api_cache import API_COLUMNS, get_api_cache
+from batch_inference import stack_features
+from forecast_cache import predict_batch_cached
+from metrics import stage_timer
 from feature_engineering import compute_feature_from_window, FEATURE_NAMES
-import numpy as np
+from window_provider import HistoricalWindowProvider, WindowProvider, epoch_to_iso
 import pandas as pd
 
 load_dotenv()
@@ -40,10 +40,6 @@ ROOT = Path(__file__).resolve().parents[1]
 DATA_DIR = ROOT / "data"
 MODEL_DIR = ROOT / "models"
 
-# Sensor files
-SENSOR_REAL = DATA_DIR / "sensor_raw_60d.csv"
-SENSOR_SYNTH = DATA_DIR / "sensor_raw_60d_synth.csv"
-
 # API files (for load_api_row)
 OWM_CSV = DATA_DIR / "owm_history.csv"
 EXT_WEATHER_CSV = DATA_DIR / "external_weather_60d.csv"
@@ -135,59 +131,25 @@ def find_upcoming_slots(schedule: Dict, lookahead_minutes: int = 15, find_next:
     return upcoming
 
 
-def _choose_sensor_path() -> Path:
-    """Chọn file sensor (ưu tiên real, fallback synth)."""
-    if SENSOR_REAL.exists():
-        return SENSOR_REAL
-    if SENSOR_SYNTH.exists():
-        return SENSOR_SYNTH
-    raise FileNotFoundError("No sensor file found (sensor_raw_60d*.csv)")
+# Mặc định (chạy tay / demo): sensor store hoặc CSV; AIService truyền LiveWindowProvider
+DEFAULT_WINDOW_PROVIDER = HistoricalWindowProvider()
 
 
-def load_sensor_buffer_at_timestamp(target_ts: datetime) -> pd.DataFrame:
+def load_sensor_buffer_at_timestamp(target_ts: datetime, device_id: Optional[str] = None) -> pd.DataFrame:
     """
     Load 12 bản ghi sensor tại thời điểm target_ts (hoặc gần nhất trước đó).
     
-    Logic:
-    - Tìm các bản ghi sensor có ts <= target_ts
-    - Lấy 12 bản ghi gần nhất (60 phút với dữ liệu 5 phút)
-    - Nếu không đủ 12 bản ghi, lấy tất cả có thể
+    Giữ cho backward compatibility (DataFrame); xem HistoricalWindowProvider.frame().
     
     Args:
         target_ts: Thời điểm cần lấy dữ liệu (ví dụ: forecast_trigger_ts)
+        device_id: Chỉ lấy dữ liệu của device này (None = mọi device)
     
     Returns:
         DataFrame với 12 bản ghi sensor gần nhất trước target_ts
     """
-    path = _choose_sensor_path()
-    df = pd.read_csv(path, parse_dates=["ts"]).sort_values("ts")
-    
-    # Lọc các bản ghi có ts <= target_ts
-    df_before = df[df["ts"] <= target_ts].copy()
-    
-    if len(df_before) == 0:
-        # Nếu không có dữ liệu trước target_ts, dùng dữ liệu gần nhất
-        print(f"   ⚠️  Không có sensor data trước {target_ts}. Dùng dữ liệu gần nhất.")
-        df_before = df.tail(12).copy()
-    else:
-        # Lấy 12 bản ghi gần nhất trước target_ts
-        df_before = df_before.tail(12).copy()
-    
-    # Đảm bảo có đủ columns
-    df_before = df_before.rename(
-        columns={
-            "ts": "ts",
-            "temp_c": "temp_c",
-            "rh_pct": "rh_pct",
-            "pressure_hpa": "pressure_hpa",
-            "soil_moist_pct": "soil_moist_pct",
-        }
-    )
-    
-    if len(df_before) < 2:
-        raise ValueError(f"Not enough sensor data before {target_ts} (need >=2 rows, got {len(df_before)})")
-    
-    return df_before
+    df, _ = DEFAULT_WINDOW_PROVIDER.frame(target_ts, device_id=device_id)
+    return df
 
 
 def load_sensor_buffer() -> pd.DataFrame:
@@ -195,104 +157,173 @@ def load_sensor_buffer() -> pd.DataFrame:
     return load_sensor_buffer_at_timestamp(datetime.utcnow())
 
 
-def run_forecast_for_slot(slot: Dict) -> Dict:
+def _slot_trigger_ts(slot: Dict) -> datetime:
+    """forecast_trigger_ts của slot (hoặc start_ts - 10 phút, hoặc hiện tại)."""
+    trigger_ts_str = slot.get("forecast_trigger_ts")
+    if trigger_ts_str:
+        return datetime.fromisoformat(trigger_ts_str.replace("Z", ""))
+    start_ts_str = slot.get("start_ts", "")
+    if start_ts_str:
+        start_ts = datetime.fromisoformat(start_ts_str.replace("Z", ""))
+        return start_ts - timedelta(minutes=10)
+    # Fallback: dùng thời điểm hiện tại
+    return datetime.utcnow()
+
+
+def _forecast_error(e: Exception) -> Dict:
+    return {
+        "error": str(e),
+        "decision_path": "error",
+        "recommendation": {
+            "should_irrigate": True,  # Default: tưới nếu lỗi
+            "reason": f"Lỗi dự báo: {e}. Tưới theo lịch mặc định.",
+        },
+    }
+
+
+def _sensor_ref(window) -> Dict:
+    return {
+        "soil_moist_pct": round(float(window.soil_moist_pct[-1]), 2),
+        "temp_c": round(float(window.temp_c[-1]), 2),
+        "rh_pct": round(float(window.rh_pct[-1]), 2),
+        "pressure_hpa": round(float(window.pressure_hpa[-1]), 2),
+    }
+
+
+def _rule_result(window, window_source: str, rule) -> Dict:
+    """Kết quả khi luật độ ẩm đất đã quyết định (không có dự báo mưa)."""
+    should_irrigate, reason, path = rule
+    return {
+        "timestamp": epoch_to_iso(window.ts[-1]),
+        "model_version": None,
+        "window_source": window_source,
+        "decision_path": path,
+        "predictions": {
+            "rain_60min": {"probability": None, "label": None},
+            "rain_amount_60min_mm": None,
+            "rain_amount_source": None,
+        },
+        "sensor_ref": _sensor_ref(window),
+        "recommendation": {
+            "should_irrigate": should_irrigate,
+            "reason": reason,
+            "threshold_used": None,
+        },
+    }
+
+
+def run_forecasts_for_slots(slots: List[Dict], window_provider: Optional[WindowProvider] = None) -> List[Dict]:
     """
-    Chạy dự báo mưa cho một slot.
+    Chạy dự báo mưa cho nhiều slot trong 1 batch.
     
     Logic:
-    - Lấy sensor data TẠI THỜI ĐIỂM forecast_trigger_ts (hoặc trước đó)
-    - Lấy API data gần nhất với forecast_trigger_ts
-    - Tính features và chạy model
+    - Mỗi slot: lấy sensor data TẠI THỜI ĐIỂM forecast_trigger_ts (hoặc trước đó) từ
+      window_provider (AIService: buffer trong RAM; mặc định: sensor store / CSV)
+    - Luật theo độ ẩm đất (decide_by_rules) quyết định được → kết quả ngay,
+      không tra API / tính features / chạy model cho slot đó
+    - Các slot còn lại: API data gần nhất với forecast_trigger_ts (tra cứu cả
+      batch 1 lần) → features → 1 ma trận → nowcast + amount 1 lần gọi mỗi model
+    
+    Slot lỗi (thiếu dữ liệu) nhận kết quả lỗi riêng, không ảnh hưởng slot khác.
     
     Returns:
-        Dict với forecast result và recommendation
+        List kết quả theo thứ tự slots (Dict với forecast result và recommendation)
     """
-    try:
-        # Lấy forecast_trigger_ts từ slot (hoặc tính từ start_ts - 10 phút)
-        trigger_ts_str = slot.get("forecast_trigger_ts")
-        if not trigger_ts_str:
-            start_ts_str = slot.get("start_ts", "")
-            if start_ts_str:
-                start_ts = datetime.fromisoformat(start_ts_str.replace("Z", ""))
-                trigger_ts = start_ts - timedelta(minutes=10)
-            else:
-                # Fallback: dùng thời điểm hiện tại
-                trigger_ts = datetime.utcnow()
-        else:
-            trigger_ts = datetime.fromisoformat(trigger_ts_str.replace("Z", ""))
-        
-        print(f"   📅 Using sensor data at/before: {trigger_ts.strftime('%Y-%m-%d %H:%M')}")
-        
-        # Load sensor buffer TẠI THỜI ĐIỂM trigger_ts (hoặc trước đó)
-        sensor_df = load_sensor_buffer_at_timestamp(trigger_ts)
-        latest_ts = sensor_df.iloc[-1]["ts"]
-        
-        print(f"   📊 Sensor data range: {sensor_df.iloc[0]['ts']} → {latest_ts}")
-        
-        # Load API data gần nhất với trigger_ts
-        api_row = load_api_row(pd.Timestamp(trigger_ts))
-        
-        # Tính features
-        feature_vector = compute_feature_from_window(
-            sensor_df=sensor_df,
-            api_row=api_row,
-            interval_seconds=300,  # 5 phút
-        )
-        x = np.array(feature_vector.to_list(), dtype="float32").reshape(1, -1)
-        
-        # Load models
-        nowcast_model, amount_model, meta = load_models()
-        threshold = float(meta.get("threshold_default", 0.5)) if meta else 0.5
-        
-        # Inference
-        prob = float(nowcast_model.predict_proba(x)[0, 1])
-        label = int(prob >= threshold)
-        
-        amount_mm = None
-        if amount_model is not None:
-            try:
-                import xgboost as xgb
-                if isinstance(amount_model, xgb.Booster):
-                    amount_mm = float(amount_model.predict(xgb.DMatrix(x))[0])
-                else:
-                    amount_mm = float(amount_model.predict(x)[0])
-            except Exception:
-                amount_mm = None
-        
-        # Decision
-        soil_m = float(sensor_df.iloc[-1]["soil_moist_pct"])
-        should_irrigate, reason = decide_irrigation(soil_m, prob)
-        
-        return {
-            "timestamp": latest_ts.isoformat() if hasattr(latest_ts, "isoformat") else str(latest_ts),
-            "predictions": {
-                "rain_60min": {
-                    "probability": round(prob, 4),
-                    "label": label,
-                },
-                "rain_amount_60min_mm": round(amount_mm, 2) if amount_mm is not None else None,
-            },
-            "sensor_ref": {
-                "soil_moist_pct": round(soil_m, 2),
-                "temp_c": round(float(sensor_df.iloc[-1]["temp_c"]), 2),
-                "rh_pct": round(float(sensor_df.iloc[-1]["rh_pct"]), 2),
-                "pressure_hpa": round(float(sensor_df.iloc[-1]["pressure_hpa"]), 2),
-            },
-            "recommendation": {
-                "should_irrigate": should_irrigate,
-                "reason": reason,
-                "threshold_used": threshold,
-            },
-        }
+    provider = window_provider or DEFAULT_WINDOW_PROVIDER
+    results: List[Optional[Dict]] = [None] * len(slots)
+    prepared = []  # (index, window, window_source)
+    trigger_times = []
+    
+    for i, slot in enumerate(slots):
+        try:
+            trigger_ts = _slot_trigger_ts(slot)
+            print(f"   📅 Using sensor data at/before: {trigger_ts.strftime('%Y-%m-%d %H:%M')}")
+            
+            # Cửa sổ sensor TẠI THỜI ĐIỂM trigger_ts (hoặc trước đó)
+            with stage_timer("window_build"):
+                window, window_source = provider.window(trigger_ts, device_id=slot.get("device_id"))
+            print(f"   📊 Sensor data range ({window_source}): "
+                  f"{epoch_to_iso(window.ts[0])} → {epoch_to_iso(window.ts[-1])}")
+            rule = decide_by_rules(float(window.soil_moist_pct[-1]))
+            if rule is not None:
+                DECISION_STATS.record(rule[2])
+                results[i] = _rule_result(window, window_source, rule)
+                continue
+            prepared.append((i, window, window_source))
+            trigger_times.append(pd.Timestamp(trigger_ts))
+        except Exception as e:
+            results[i] = _forecast_error(e)
+    
+    if prepared:
+        try:
+            # API data gần nhất với từng trigger_ts (1 lần tra cứu cho cả batch)
+            with stage_timer("api_lookup"):
+                api_values = get_api_cache().table().lookup_many(trigger_times)
+            
+            # Tính features
+            vectors = []
+            for k, (_, window, _) in enumerate(prepared):
+                with stage_timer("features"):
+                    vectors.append(compute_feature_from_window(
+                        sensor_df=window,
+                        api_row=dict(zip(API_COLUMNS, api_values[k].tolist())),
+                        interval_seconds=300,  # 5 phút
+                    ))
+            
+            # Inference: models từ registry (1 bundle cho cả batch); slot có cùng
+            # device + feature + model version trong FORECAST_CACHE_TTL → lấy từ cache
+            with stage_timer("predict"):
+                batch = predict_batch_cached(
+                    stack_features(vectors), [slots[i].get("device_id") for i, _, _ in prepared]
+                )
+            
+            for k, (i, window, window_source) in enumerate(prepared):
+                prob = float(batch.probability[k])
+                amount_mm = float(batch.amount_mm[k]) if batch.amount_mm is not None else None
+                amount_source = None
+                if batch.amount_from_model is not None:
+                    amount_source = "model" if batch.amount_from_model[k] else "gate"
+                
+                # Decision
+                soil_m = float(window.soil_moist_pct[-1])
+                should_irrigate, reason = decide_irrigation(soil_m, prob)
+                DECISION_STATS.record(DECISION_PATH_MODEL)
+                
+                results[i] = {
+                    "timestamp": epoch_to_iso(window.ts[-1]),
+                    "model_version": batch.model_version,
+                    "window_source": window_source,
+                    "decision_path": DECISION_PATH_MODEL,
+                    "predictions": {
+                        "rain_60min": {
+                            "probability": round(prob, 4),
+                            "label": int(batch.label[k]),
+                        },
+                        "rain_amount_60min_mm": round(amount_mm, 2) if amount_mm is not None else None,
+                        "rain_amount_source": amount_source,
+                    },
+                    "sensor_ref": _sensor_ref(window),
+                    "recommendation": {
+                        "should_irrigate": should_irrigate,
+                        "reason": reason,
+                        "threshold_used": batch.threshold,
+                    },
+                }
+        except Exception as e:
+            for i, _, _ in prepared:
+                results[i] = _forecast_error(e)
+    
+    return results
+
+
+def run_forecast_for_slot(slot: Dict, window_provider: Optional[WindowProvider] = None) -> Dict:
+    """
+    Chạy dự báo mưa cho một slot (batch 1 phần tử, xem run_forecasts_for_slots).
     
-    except Exception as e:
-        return {
-            "error": str(e),
-            "recommendation": {
-                "should_irrigate": True,  # Default: tưới nếu lỗi
-                "reason": f"Lỗi dự báo: {e}. Tưới theo lịch mặc định.",
-            },
-        }
+    Returns:
+        Dict với forecast result và recommendation
+    """
+    return run_forecasts_for_slots([slot], window_provider=window_provider)[0]
 
 
 def update_slot_with_forecast(slot: Dict, forecast_result: Dict) -> Dict:
@@ -416,20 +447,24 @@ def main():
     print("🔮 Running forecasts...")
     print("-" * 70)
     
+    # Chạy dự báo cho tất cả slot trong 1 batch
+    forecast_results = run_forecasts_for_slots(upcoming_slots)
+    
     updated_slots = []
-    for i, slot in enumerate(upcoming_slots, 1):
+    for i, (slot, forecast_result) in enumerate(zip(upcoming_slots, forecast_results), 1):
         print(f"\n[{i}/{len(upcoming_slots)}] Checking slot...")
         
-        # Chạy dự báo
-        forecast_result = run_forecast_for_slot(slot)
-        
         # Cập nhật slot
         updated_slot = update_slot_with_forecast(slot, forecast_result)
         updated_slots.append(updated_slot)
         
-        # In kết quả
-        print(f"   Rain probability: {forecast_result.get('predictions', {}).get('rain_60min', {}).get('probability', 0):.2%}")
-        print(f"   Rain amount: {forecast_result.get('predictions', {}).get('rain_amount_60min_mm', 0):.2f} mm")
+        # In kết quả (decision_path rule:* → không chạy model, không có dự báo)
+        predictions = forecast_result.get("predictions", {})
+        prob = predictions.get("rain_60min", {}).get("probability")
+        amount = predictions.get("rain_amount_60min_mm")
+        print(f"   Decision path: {forecast_result.get('decision_path', 'N/A')}")
+        print(f"   Rain probability: {f'{prob:.2%}' if prob is not None else 'N/A'}")
+        print(f"   Rain amount: {f'{amount:.2f} mm' if amount is not None else 'N/A'}")
         print(f"   Recommendation: {forecast_result.get('recommendation', {}).get('reason', 'N/A')}")
         print(f"   Status: {updated_slot.get('status', 'N/A')}")
         
@@ -0,0 +1,384 @@
+"""
+Predictors - Cùng 1 interface predict cho nowcast + amount, nhiều backend CPU.
+
+Backend chọn lúc khởi động (INFERENCE_BACKEND hoặc `ai_service.py --backend`):
+- xgboost : wrapper gốc (XGBBoosterWithThreshold / XGBAmountRegressor, inplace_predict)
+- numpy   : TreeEnsemble (tree_ensemble.py) - không gọi vào xgboost khi predict;
+            model_registry load thẳng models/*.npz (không cần xgboost) nếu file
+            mới hơn .pkl, ngược lại export lại từ booster
+- onnx    : ONNX Runtime, graph ai.onnx.ml TreeEnsembleRegressor dựng từ TreeEnsemble
+- treelite: thư viện C biên dịch bằng Treelite + TL2cgen (cache .so theo nội dung booster)
+
+onnx / treelite là dependency tuỳ chọn: thiếu package → log cảnh báo, dùng xgboost.
+
+Mọi backend dùng đúng iteration range của wrapper xgboost (nowcast: best_iteration,
+amount: tất cả cây) → kết quả khớp nhau trong sai số float32.
+
+Interface (giống wrapper xgboost, caller không cần biết backend):
+- nowcast: predict_proba(X) → (n, 2), predict(X, threshold=None), threshold
+- amount : predict(X) → (n,)
+- cả 2   : backend, set_nthread(n, single_nthread), get_booster(), num_features()
+            (get_booster() = None khi load từ .npz)
+
+Thread budget: nthread cho batch, single_nthread cho lần gọi ≤ PREDICT_SMALL_BATCH
+dòng (onnx / treelite: 1 session / predictor riêng cho mỗi budget, xem wrappers.py).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+
+from tree_ensemble import TreeEnsemble, export_booster
+from wrappers import PREDICT_SMALL_BATCH, _as_matrix, _iteration_range
+
+logger = logging.getLogger(__name__)
+
+ROOT = Path(__file__).resolve().parents[1]
+
+BACKENDS = ("xgboost", "numpy", "onnx", "treelite")
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "xgboost")
+# Thư mục cache thư viện Treelite đã biên dịch (biên dịch mất vài giây / model)
+TREELITE_LIB_DIR = Path(os.getenv("TREELITE_LIB_DIR", ROOT / "models" / "treelite"))
+TREELITE_TOOLCHAIN = os.getenv("TREELITE_TOOLCHAIN", "gcc")
+
+
+class TreePredictor:
+    """1 booster (trong iteration range đã chọn) → output 1D đã qua link function."""
+
+    backend = ""
+
+    def __init__(self, booster, iteration_range: Tuple[int, int], nthread: int = 0, single_nthread: int = 0):
+        self._booster = booster
+        self.iteration_range = tuple(iteration_range)
+        self.nthread = int(nthread or 0)
+        self.single_nthread = int(single_nthread or 0)
+
+    def get_booster(self):
+        return self._booster
+
+    def num_features(self) -> int:
+        return self._booster.num_features()
+
+    def set_nthread(self, nthread: int, single_nthread: int = None) -> None:
+        self.nthread = int(nthread or 0)
+        if single_nthread is not None:
+            self.single_nthread = int(single_nthread or 0)
+
+    @property
+    def split_budget(self) -> bool:
+        """True nếu lần gọi ít dòng có budget thread riêng."""
+        return bool(self.single_nthread) and self.single_nthread != self.nthread
+
+    def _is_small(self, X: np.ndarray) -> bool:
+        return self.split_budget and len(X) <= PREDICT_SMALL_BATCH
+
+    def predict_values(self, X) -> np.ndarray:
+        raise NotImplementedError
+
+
+class NumpyPredictor(TreePredictor):
+    """TreeEnsemble NumPy (1 thread, không native dependency ngoài NumPy) - bỏ qua thread budget."""
+
+    backend = "numpy"
+
+    def __init__(self, booster, iteration_range, nthread: int = 0, single_nthread: int = 0,
+                 ensemble: Optional[TreeEnsemble] = None):
+        super().__init__(booster, iteration_range, nthread, single_nthread)
+        # ensemble có sẵn (load từ .npz) → không cần booster / xgboost
+        self.ensemble = ensemble if ensemble is not None else export_booster(booster, self.iteration_range)
+
+    def num_features(self) -> int:
+        return self.ensemble.num_feature
+
+    def predict_values(self, X) -> np.ndarray:
+        return self.ensemble.predict(_as_matrix(X))
+
+
+def _onnx_model(ensemble: TreeEnsemble):
+    """TreeEnsemble → ModelProto (TreeEnsembleRegressor, post_transform NONE)."""
+    from onnx import TensorProto, helper
+
+    n_nodes = len(ensemble.feature)
+    tree_id = np.repeat(np.arange(ensemble.num_trees), np.diff(np.r_[ensemble.roots, n_nodes]))
+    root = ensemble.roots[tree_id]
+    node_id = np.arange(n_nodes) - root
+    # TreeEnsemble: lá trỏ về chính nó
+    is_leaf = ensemble.left == np.arange(n_nodes)
+    leaves = np.flatnonzero(is_leaf)
+
+    node = helper.make_node(
+        "TreeEnsembleRegressor", ["X"], ["margin"], domain="ai.onnx.ml",
+        n_targets=1,
+        aggregate_function="SUM",
+        post_transform="NONE",
+        base_values=[float(ensemble.base_margin)],
+        nodes_treeids=tree_id.tolist(),
+        nodes_nodeids=node_id.tolist(),
+        nodes_featureids=ensemble.feature.tolist(),
+        nodes_values=ensemble.threshold.tolist(),
+        nodes_modes=["LEAF" if leaf else "BRANCH_LT" for leaf in is_leaf],
+        nodes_truenodeids=np.where(is_leaf, 0, ensemble.left - root).tolist(),
+        nodes_falsenodeids=np.where(is_leaf, 0, ensemble.right - root).tolist(),
+        nodes_missing_value_tracks_true=ensemble.default_left.astype(int).tolist(),
+        target_treeids=tree_id[leaves].tolist(),
+        target_nodeids=node_id[leaves].tolist(),
+        target_ids=[0] * len(leaves),
+        target_weights=ensemble.value[leaves].tolist(),
+    )
+    graph = helper.make_graph(
+        [node], "tree_ensemble",
+        [helper.make_tensor_value_info("X", TensorProto.FLOAT, [None, ensemble.num_feature or None])],
+        [helper.make_tensor_value_info("margin", TensorProto.FLOAT, [None, 1])],
+    )
+    return helper.make_model(
+        graph, ir_version=8,
+        opset_imports=[helper.make_opsetid("", 17), helper.make_opsetid("ai.onnx.ml", 3)],
+    )
+
+
+class OnnxPredictor(TreePredictor):
+    """ONNX Runtime (CPUExecutionProvider); link function áp dụng sau session.run."""
+
+    backend = "onnx"
+
+    def __init__(self, booster, iteration_range, nthread: int = 0, single_nthread: int = 0):
+        import onnxruntime  # noqa: F401  (ImportError → fallback xgboost)
+
+        super().__init__(booster, iteration_range, nthread, single_nthread)
+        self.ensemble = export_booster(booster, self.iteration_range)
+        self._model_bytes = _onnx_model(self.ensemble).SerializeToString()
+        self._create_sessions()
+
+    def _create_session(self, nthread: int):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = nthread
+        options.inter_op_num_threads = 1
+        return ort.InferenceSession(self._model_bytes, options, providers=["CPUExecutionProvider"])
+
+    def _create_sessions(self) -> None:
+        self._session = self._create_session(self.nthread)
+        self._single_session = self._create_session(self.single_nthread) if self.split_budget else None
+
+    def set_nthread(self, nthread: int, single_nthread: int = None) -> None:
+        super().set_nthread(nthread, single_nthread)
+        self._create_sessions()
+
+    def predict_values(self, X) -> np.ndarray:
+        X = _as_matrix(X)
+        session = self._single_session if self._is_small(X) else self._session
+        margin = session.run(None, {"X": X})[0].reshape(-1)
+        return self.ensemble.transform(margin)
+
+
+class TreelitePredictor(TreePredictor):
+    """Thư viện .so sinh bởi TL2cgen; biên dịch 1 lần / nội dung booster, sau đó load từ cache."""
+
+    backend = "treelite"
+
+    def __init__(self, booster, iteration_range, nthread: int = 0, single_nthread: int = 0):
+        import tl2cgen
+        import treelite
+
+        super().__init__(booster, iteration_range, nthread, single_nthread)
+        begin, end = self.iteration_range
+        sliced = booster[begin:end] if end > 0 else booster
+        raw = bytes(sliced.save_raw("ubj"))
+        self.libpath = TREELITE_LIB_DIR / f"{hashlib.sha256(raw).hexdigest()[:16]}.so"
+        if not self.libpath.exists():
+            TREELITE_LIB_DIR.mkdir(parents=True, exist_ok=True)
+            model = treelite.frontend.from_xgboost(sliced)
+            tmp = self.libpath.with_suffix(f".{os.getpid()}.tmp.so")
+            tl2cgen.export_lib(model, toolchain=TREELITE_TOOLCHAIN, libpath=str(tmp),
+                               params={"parallel_comp": max(1, os.cpu_count() or 1)})
+            os.replace(tmp, self.libpath)
+            logger.info(f"🔧 Treelite library compiled: {self.libpath.name}")
+        self._create_predictors()
+
+    def _create_predictor(self, nthread: int):
+        import tl2cgen
+
+        return tl2cgen.Predictor(str(self.libpath), nthread=nthread or None)
+
+    def _create_predictors(self) -> None:
+        self._predictor = self._create_predictor(self.nthread)
+        self._single_predictor = self._create_predictor(self.single_nthread) if self.split_budget else None
+
+    def set_nthread(self, nthread: int, single_nthread: int = None) -> None:
+        super().set_nthread(nthread, single_nthread)
+        self._create_predictors()
+
+    def predict_values(self, X) -> np.ndarray:
+        import tl2cgen
+
+        X = _as_matrix(X)
+        predictor = self._single_predictor if self._is_small(X) else self._predictor
+        dmat = tl2cgen.DMatrix(X, dtype="float32")
+        return np.asarray(predictor.predict(dmat)).reshape(-1)
+
+
+PREDICTORS = {
+    "numpy": NumpyPredictor,
+    "onnx": OnnxPredictor,
+    "treelite": TreelitePredictor,
+}
+
+
+class NowcastPredictor:
+    """Nowcast (binary:logistic) trên 1 TreePredictor - cùng API với XGBBoosterWithThreshold."""
+
+    def __init__(self, predictor: TreePredictor, threshold: float = 0.5):
+        self._predictor = predictor
+        self.threshold = float(threshold)
+
+    @property
+    def backend(self) -> str:
+        return self._predictor.backend
+
+    @property
+    def nthread(self) -> int:
+        return self._predictor.nthread
+
+    @property
+    def single_nthread(self) -> int:
+        return self._predictor.single_nthread
+
+    def get_booster(self):
+        return self._predictor.get_booster()
+
+    def num_features(self) -> int:
+        return self._predictor.num_features()
+
+    def set_nthread(self, nthread: int, single_nthread: int = None) -> None:
+        self._predictor.set_nthread(nthread, single_nthread)
+
+    def predict_proba(self, X) -> np.ndarray:
+        p = self._predictor.predict_values(X)
+        return np.c_[1 - p, p]
+
+    def predict(self, X, threshold=None):
+        th = self.threshold if threshold is None else float(threshold)
+        return (self.predict_proba(X)[:, 1] >= th).astype(int)
+
+
+class AmountPredictor:
+    """Amount (mm) trên 1 TreePredictor - cùng API với XGBAmountRegressor."""
+
+    def __init__(self, predictor: TreePredictor, use_best_iteration: bool = False):
+        self._predictor = predictor
+        self.use_best_iteration = bool(use_best_iteration)
+
+    @property
+    def backend(self) -> str:
+        return self._predictor.backend
+
+    @property
+    def nthread(self) -> int:
+        return self._predictor.nthread
+
+    @property
+    def single_nthread(self) -> int:
+        return self._predictor.single_nthread
+
+    def get_booster(self):
+        return self._predictor.get_booster()
+
+    def num_features(self) -> int:
+        return self._predictor.num_features()
+
+    def set_nthread(self, nthread: int, single_nthread: int = None) -> None:
+        self._predictor.set_nthread(nthread, single_nthread)
+
+    def predict(self, X) -> np.ndarray:
+        return self._predictor.predict_values(X)
+
+
+def _check_backend(backend: str) -> str:
+    backend = (backend or "xgboost").lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}' (choices: {', '.join(BACKENDS)})")
+    return backend
+
+
+def _build_predictor(backend: str, booster, iteration_range, nthread: int, single_nthread: int):
+    """Dựng predictor của backend; lỗi bất kỳ (thiếu package, compile / build lỗi) → None."""
+    try:
+        return PREDICTORS[backend](booster, iteration_range, nthread, single_nthread)
+    except ImportError as e:
+        logger.warning(f"⚠️  Inference backend '{backend}' unavailable ({e}), using xgboost")
+    except Exception as e:
+        logger.error(f"❌ Inference backend '{backend}' failed to build ({type(e).__name__}: {e}), using xgboost",
+                     exc_info=True)
+    return None
+
+
+def make_nowcast_predictor(model, backend: str = INFERENCE_BACKEND, nthread: int = 0, single_nthread: int = 0):
+    """Wrapper nowcast xgboost → predictor của backend (xgboost: giữ nguyên wrapper)."""
+    backend = _check_backend(backend)
+    if backend == "xgboost":
+        return model
+    booster = model.get_booster()
+    predictor = _build_predictor(backend, booster, _iteration_range(booster), nthread, single_nthread)
+    if predictor is None:
+        return model
+    return NowcastPredictor(predictor, threshold=getattr(model, "threshold", 0.5))
+
+
+def make_amount_predictor(model, backend: str = INFERENCE_BACKEND, nthread: int = 0, single_nthread: int = 0):
+    """Wrapper amount xgboost → predictor của backend (xgboost / None: giữ nguyên)."""
+    backend = _check_backend(backend)
+    if backend == "xgboost" or model is None:
+        return model
+    booster = model.get_booster()
+    use_best = getattr(model, "use_best_iteration", False)
+    predictor = _build_predictor(backend, booster, _iteration_range(booster, use_best), nthread, single_nthread)
+    if predictor is None:
+        return model
+    return AmountPredictor(predictor, use_best_iteration=use_best)
+
+
+def load_numpy_nowcast(path: Path, threshold: float = 0.5) -> NowcastPredictor:
+    """Nowcast backend numpy từ .npz đã export (không import xgboost)."""
+    return NowcastPredictor(NumpyPredictor(None, (0, 0), ensemble=TreeEnsemble.load(path)), threshold=threshold)
+
+
+def load_numpy_amount(path: Path) -> AmountPredictor:
+    """Amount backend numpy từ .npz đã export (iteration range đã áp dụng lúc export)."""
+    return AmountPredictor(NumpyPredictor(None, (0, 0), ensemble=TreeEnsemble.load(path)))
+
+
+def num_features(model) -> int:
+    """Số feature đầu vào của predictor (mọi backend) hoặc wrapper xgboost."""
+    if hasattr(model, "num_features"):
+        return model.num_features()
+    return model.get_booster().num_features()
+
+
+def backend_of(model) -> str:
+    """Tên backend thật sự của model (sau khi có thể đã fallback về xgboost)."""
+    return getattr(model, "backend", "xgboost") if model is not None else ""
+
+
+__all__ = [
+    "BACKENDS",
+    "INFERENCE_BACKEND",
+    "TreePredictor",
+    "NumpyPredictor",
+    "OnnxPredictor",
+    "TreelitePredictor",
+    "NowcastPredictor",
+    "AmountPredictor",
+    "make_nowcast_predictor",
+    "make_amount_predictor",
+    "load_numpy_nowcast",
+    "load_numpy_amount",
+    "num_features",
+    "backend_of",
+]
@@ -2,7 +2,7 @@
 Script chuẩn hóa dữ liệu training theo báo cáo IoT.
 
 Chức năng:
-1. Convert sensor_live.csv → sensor_raw_60d.csv (15s, 4 fields: temp, rh, pressure, soil_moist)
+1. Convert sensor_store (hoặc sensor_live.csv) → sensor_raw_60d.csv (15s, 4 fields: temp, rh, pressure, soil_moist)
 2. Tạo labels_rain_60d.csv từ dữ liệu thật (từ owm_history_3years hoặc API)
 3. Tạo irrigation_events_60d.csv giả lập dựa trên sensor + labels
 4. Kiểm tra external_weather_60d.csv (có thể không cần nữa)
@@ -16,6 +16,8 @@ from pathlib import Path
 from datetime import datetime, timedelta
 from typing import Optional
 
+from sensor_store import open_default_store
+
 ROOT = Path(__file__).resolve().parents[1]
 DATA_DIR = ROOT / "data"
 
@@ -34,6 +36,9 @@ def convert_sensor_live_to_raw_60d() -> None:
     """
     Convert sensor_live.csv → sensor_raw_60d.csv
     
+    Nếu có data/sensor_store (Parquet) thì đọc từ store, chỉ mở partition
+    của 60 ngày gần nhất thay vì parse toàn bộ sensor_live.csv.
+    
     Yêu cầu:
     - Format: 15 giây/bản ghi (hoặc giữ nguyên nếu đã đúng)
     - Fields: ts, device_id, temp_c, rh_pct, pressure_hpa, soil_moist_pct
@@ -44,7 +49,8 @@ def convert_sensor_live_to_raw_60d() -> None:
     print("1️⃣  Converting sensor_live.csv → sensor_raw_60d.csv")
     print("=" * 70)
     
-    if not SENSOR_LIVE.exists():
+    store = open_default_store()
+    if store is None and not SENSOR_LIVE.exists():
         print(f"❌ File not found: {SENSOR_LIVE}")
         print("   → Tạo file sensor_raw_60d.csv rỗng (bạn cần collect data từ MQTT trước)")
         # Tạo file rỗng với đúng format
@@ -54,9 +60,15 @@ def convert_sensor_live_to_raw_60d() -> None:
         df_empty.to_csv(SENSOR_RAW_60D, index=False)
         return
     
-    # Load sensor_live
-    df = pd.read_csv(SENSOR_LIVE, parse_dates=["ts"])
-    print(f"   ✓ Loaded {len(df)} records from sensor_live.csv")
+    if store is not None:
+        # Load 60 ngày gần nhất từ sensor store (partition pruning theo ngày)
+        latest_ts = store.latest_ts()
+        df = store.read(start=latest_ts - timedelta(days=60))
+        print(f"   ✓ Loaded {len(df)} records from {store.root.name}")
+    else:
+        # Load sensor_live
+        df = pd.read_csv(SENSOR_LIVE, parse_dates=["ts"])
+        print(f"   ✓ Loaded {len(df)} records from sensor_live.csv")
     
     # Kiểm tra columns
     required_cols = ["ts", "device_id", "temp_c", "rh_pct", "soil_moist_pct"]
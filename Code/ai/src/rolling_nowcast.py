@@ -0,0 +1,153 @@
+"""
+Rolling Nowcast - Dự báo mưa 60 phút liên tục cho từng device (mỗi reading ~5 phút).
+
+Ngoài slot check (10 phút trước lịch tưới), mỗi reading mới của device:
+1. StreamingFeatureEngine đã cập nhật FeatureVector (O(1), xem streaming_features.py)
+2. RollingNowcaster.on_reading(): nếu device không bị rate limit và đủ dữ liệu
+   → vector của device với API row gần last_ts của chính nó (api_cache, không
+   đổi API row dùng chung của engine) → nowcast 1 dòng → publish payload gọn
+   (retained) lên ai/forecast/rolling/<device_id>
+3. `submit` (tuỳ chọn): chạy bước predict + publish ở nơi khác thay vì trên thread
+   ingest, vd. asyncio runtime đẩy vào predict executor để không chặn event loop
+
+Rate limit theo device: tối đa 1 lần predict / ROLLING_MIN_INTERVAL giây (đồng hồ
+monotonic) → CPU tỉ lệ với số device, không với tần suất gửi của từng device.
+Chỉ chạy nowcast (không amount / quyết định tưới) để giữ chi phí mỗi reading thấp.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+
+from api_cache import get_api_cache
+from metrics import stage_timer
+from model_registry import ModelRegistry, get_registry
+from streaming_features import StreamingFeatureEngine
+from window_provider import epoch_to_iso
+
+logger = logging.getLogger(__name__)
+
+ROLLING_NOWCAST = os.getenv("ROLLING_NOWCAST", "1") == "1"
+# Giây tối thiểu giữa 2 lần predict của cùng device (< 300 để không lỡ nhịp 5 phút vì jitter)
+ROLLING_MIN_INTERVAL = float(os.getenv("ROLLING_MIN_INTERVAL", 240))
+# Số reading tối thiểu của device trước khi dự báo (12 = đủ cửa sổ 1h)
+ROLLING_MIN_SAMPLES = int(os.getenv("ROLLING_MIN_SAMPLES", 12))
+
+TOPIC_ROLLING = "ai/forecast/rolling"
+
+
+class RollingNowcaster:
+    """Nowcast theo reading cho nhiều device, rate limit từng device (thread-safe)."""
+
+    def __init__(
+        self,
+        features: StreamingFeatureEngine,
+        publish: Callable[[str, str], None],
+        registry: Optional[ModelRegistry] = None,
+        min_interval: float = ROLLING_MIN_INTERVAL,
+        min_samples: int = ROLLING_MIN_SAMPLES,
+        topic: str = TOPIC_ROLLING,
+        clock=time.monotonic,
+        submit: Optional[Callable[..., Any]] = None,
+    ):
+        self.features = features
+        self.publish = publish  # publish(topic, payload) - retained
+        self.registry = registry or get_registry()
+        self.min_interval = float(min_interval)
+        self.min_samples = int(min_samples)
+        self.topic = topic
+        self._clock = clock
+        # submit(fn, device_id): chạy predict + publish ngoài thread gọi (None = chạy ngay)
+        self.submit = submit
+        self._lock = threading.Lock()
+        self._last_run: Dict[str, float] = {}
+        self.runs = 0
+        self.rate_limited = 0
+        self.not_ready = 0
+        self.errors = 0
+
+    def topic_for(self, device_id: str) -> str:
+        return f"{self.topic}/{device_id}"
+
+    def on_reading(self, device_id: str) -> Optional[Dict]:
+        """
+        Gọi sau features.update(device_id, ...). Returns payload đã publish hoặc None
+        (None cả khi đã chuyển cho `submit`: payload được publish sau).
+        """
+        ready = self.features.sample_count(device_id) >= self.min_samples
+        now = self._clock()
+        with self._lock:
+            if not ready:
+                self.not_ready += 1
+                return None
+            last = self._last_run.get(device_id)
+            if last is not None and now - last < self.min_interval:
+                self.rate_limited += 1
+                return None
+            self._last_run[device_id] = now
+
+        if self.submit is not None:
+            self.submit(self._run, device_id)
+            return None
+        return self._run(device_id)
+
+    def remove(self, device_id: str) -> None:
+        """Device bị evict khỏi buffer → quên mốc rate limit."""
+        with self._lock:
+            self._last_run.pop(device_id, None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "devices": len(self._last_run),
+                "runs": self.runs,
+                "rate_limited": self.rate_limited,
+                "not_ready": self.not_ready,
+                "errors": self.errors,
+            }
+
+    # ----- Internal -----
+    def _run(self, device_id: str) -> Optional[Dict]:
+        try:
+            with stage_timer("rolling_predict"):
+                payload = self._predict(device_id)
+            self.publish(self.topic_for(device_id), json.dumps(payload, ensure_ascii=False))
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+            logger.error(f"Rolling nowcast failed for [{device_id}]: {e}", exc_info=True)
+            return None
+        with self._lock:
+            self.runs += 1
+        return payload
+
+    def _predict(self, device_id: str) -> Dict:
+        # API row theo giờ của chính device (không set_api_row: O(1), không đụng device khác)
+        ts = self.features.last_ts(device_id)
+        fv = self.features.feature_vector(device_id, api_row=get_api_cache().table().lookup(ts))
+        bundle = self.registry.get()
+        x = np.asarray([fv.to_list()], dtype=np.float32)
+        prob = float(bundle.nowcast.predict_proba(x)[0, 1])
+        return {
+            "device_id": device_id,
+            "ts": epoch_to_iso(ts),
+            "generated_at": datetime.utcnow().isoformat() + "Z",
+            "rain_60min": {"probability": round(prob, 4), "label": int(prob >= bundle.threshold)},
+            "threshold": bundle.threshold,
+            "model_version": bundle.version,
+        }
+
+
+__all__ = [
+    "ROLLING_NOWCAST",
+    "TOPIC_ROLLING",
+    "RollingNowcaster",
+]
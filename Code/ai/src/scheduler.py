@@ -31,6 +31,8 @@ from typing import List, Dict, Any, Literal
 import numpy as np
 import pandas as pd
 
+from sensor_store import open_default_store
+
 
 ROOT = Path(__file__).resolve().parents[1]
 DATA_DIR = ROOT / "data"
@@ -40,6 +42,9 @@ SENSOR_REAL = DATA_DIR / "sensor_raw_60d.csv"
 OWM_HISTORY_3Y = DATA_DIR / "owm_history_3years.csv"
 FORECAST_7D_CSV = DATA_DIR / "forecast_7days.csv"
 
+# Số ngày sensor gần nhất cần đọc từ sensor store (soil reference 7 ngày + 1 ngày dư)
+SOIL_REF_DAYS = 8
+
 # Giả định đơn giản: 1 phút tưới ≈ 0.4 mm nước (tuỳ cấu hình béc tưới ngoài thực tế)
 MM_PER_MIN_IRRIGATION = 0.4
 TARGET_MM_7D = 50.0  # nhu cầu nước mục tiêu / tuần (mm) – chỉ là giá trị tham khảo cho demo
@@ -124,7 +129,24 @@ def _choose_sensor_source() -> Path:
     )
 
 
+def _sensor_source_name() -> str:
+    """Tên nguồn sensor đang dùng (sensor store nếu có dữ liệu, ngược lại CSV)."""
+    store = open_default_store()
+    if store is not None:
+        return store.root.name
+    return _choose_sensor_source().name
+
+
 def load_sensor() -> pd.DataFrame:
+    # Ưu tiên sensor store: chỉ đọc partition của SOIL_REF_DAYS ngày cuối
+    store = open_default_store()
+    if store is not None:
+        days = store.days()
+        start = pd.Timestamp(days[-SOIL_REF_DAYS]) if len(days) >= SOIL_REF_DAYS else None
+        df = store.read(start=start)
+        print(f"✓ Loaded sensor data from {store.root.name}: {len(df)} rows")
+        return df
+
     sensor_path = _choose_sensor_source()
     df = pd.read_csv(sensor_path, parse_dates=["ts"])
     df = df.sort_values("ts").reset_index(drop=True)
@@ -444,7 +466,7 @@ def build_output_json(plans: List[DayPlan]) -> Dict[str, Any]:
             "horizon_7_days": summary_long,
         },
         "meta": {
-            "source_sensor": _choose_sensor_source().name,
+            "source_sensor": _sensor_source_name(),
             "source_api": str(FORECAST_7D_CSV.name)
             if FORECAST_7D_CSV.exists()
             else OWM_HISTORY_3Y.name,
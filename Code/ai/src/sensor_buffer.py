@@ -0,0 +1,291 @@
+"""
+Sensor Buffer - Cửa sổ dữ liệu sensor gần nhất cho feature engineering.
+
+- SensorBuffer: 1 cửa sổ 120 phút (24 records @ 5 phút) của MỘT device,
+  lưu dạng ring buffer NumPy (không giữ dict / DataFrame)
+- DeviceBufferPool: quản lý nhiều SensorBuffer theo device_id
+    + mỗi device 1 cửa sổ riêng (không trộn dữ liệu giữa các device)
+    + giới hạn tổng số records (memory budget) → evict device ít dùng nhất (LRU)
+    + evict device không gửi dữ liệu quá `idle_ttl` giây
+    + báo cáo trạng thái ready theo từng device
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from feature_engineering import SensorWindow
+from sensor_writer import DEFAULT_DEVICE_ID
+
+# 120 phút @ 5 phút/bản ghi; cần tối thiểu 12 bản ghi (60 phút) để dự báo
+BUFFER_MAX_SIZE = 24
+BUFFER_MIN_READY = 12
+
+# Thứ tự kênh trong ring buffer (CSV format) + key tương ứng trong payload MQTT
+CHANNELS = ("temp_c", "rh_pct", "pressure_hpa", "soil_moist_pct")
+PAYLOAD_KEYS = ("temperature", "humidity", "pressure", "soilMoisture")
+
+
+def parse_epoch_seconds(value) -> int:
+    """ISO timestamp (payload MQTT) → epoch giây UTC. Naive được coi là UTC."""
+    if value is None:
+        return int(datetime.now(timezone.utc).timestamp())
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return int(value)
+    if isinstance(value, str):
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    else:
+        dt = pd.Timestamp(value).to_pydatetime()
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+class SensorBuffer:
+    """
+    Buffer lưu 120 phút data sensor (24 records @ 5 min interval).
+
+    Ring buffer NumPy cấp phát sẵn: ts (int64 epoch giây) + 4 kênh float32.
+    Mỗi giá trị được ghi 2 lần (vị trí i và i + capacity) nên N bản ghi gần
+    nhất luôn là 1 slice liên tục → window() trả về view, không copy.
+    """
+
+    def __init__(self, max_size: int = BUFFER_MAX_SIZE, min_ready: int = BUFFER_MIN_READY):
+        self.max_size = max_size
+        self.min_ready = min_ready
+        self._ts = np.zeros(2 * max_size, dtype=np.int64)
+        self._values = np.zeros((len(CHANNELS), 2 * max_size), dtype=np.float32)
+        self._next = 0   # vị trí ghi tiếp theo trong [0, max_size)
+        self._count = 0
+        # Số lần ghi còn lại trước khi cặp lệch thứ tự mới nhất bị ghi đè khỏi
+        # ring buffer (0 = toàn bộ buffer đã tăng dần → window() không cần sort)
+        self._unsorted_left = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add(self, data: Dict):
+        """Thêm data (payload MQTT) vào buffer"""
+        self.add_values(
+            parse_epoch_seconds(data.get("timestamp")),
+            *(float(data.get(key, 0) or 0) for key in PAYLOAD_KEYS),
+        )
+
+    def add_values(self, ts: int, temp_c: float, rh_pct: float, pressure_hpa: float, soil_moist_pct: float):
+        """Thêm 1 bản ghi đã parse (ts epoch giây UTC)."""
+        i = self._next
+        j = i + self.max_size
+        if self._unsorted_left:
+            self._unsorted_left -= 1
+        if self._count and ts < self._ts[j - 1]:
+            # Bản ghi trước (vị trí i - 1) bị ghi đè sau max_size - 1 lần ghi nữa
+            self._unsorted_left = self.max_size - 1
+        self._ts[i] = self._ts[j] = ts
+        col = self._values[:, i]
+        col[0], col[1], col[2], col[3] = temp_c, rh_pct, pressure_hpa, soil_moist_pct
+        self._values[:, j] = col
+        self._next = (i + 1) % self.max_size
+        self._count = min(self._count + 1, self.max_size)
+
+    def is_ready(self) -> bool:
+        """Kiểm tra xem đã đủ data chưa (cần ít nhất 12 records = 60 phút)"""
+        return self._count >= self.min_ready
+
+    def last_ts(self) -> Optional[int]:
+        """Epoch giây của bản ghi mới nhất."""
+        return int(self._ts[self._next + self.max_size - 1]) if self._count else None
+
+    def last(self) -> Optional[tuple]:
+        """Bản ghi mới nhất: (ts, temp_c, rh_pct, pressure_hpa, soil_moist_pct)."""
+        if not self._count:
+            return None
+        j = self._next + self.max_size - 1
+        return (int(self._ts[j]), *(float(v) for v in self._values[:, j]))
+
+    def window(self, n: Optional[int] = None) -> SensorWindow:
+        """
+        n bản ghi gần nhất (mặc định: toàn bộ) dạng SensorWindow.
+
+        Các mảng là view liên tục vào ring buffer (zero-copy); chỉ copy khi
+        dữ liệu đến không theo thứ tự thời gian.
+        """
+        n = self._count if n is None else min(n, self._count)
+        end = self._next + self.max_size
+        sl = slice(end - n, end)
+        ts = self._ts[sl]
+        values = self._values[:, sl]
+        if self._unsorted_left and n > 1 and np.any(np.diff(ts) < 0):
+            order = np.argsort(ts, kind="stable")
+            ts = ts[order]
+            values = values[:, order]
+        return SensorWindow(ts, values[0], values[1], values[2], values[3])
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """Convert buffer thành DataFrame (tương thích code cũ; hot path dùng window())"""
+        if not self._count:
+            return pd.DataFrame()
+        w = self.window()
+        return pd.DataFrame({
+            "ts": pd.to_datetime(w.ts, unit="s"),
+            "temp_c": w.temp_c,
+            "rh_pct": w.rh_pct,
+            "pressure_hpa": w.pressure_hpa,
+            "soil_moist_pct": w.soil_moist_pct,
+        })
+
+
+class DeviceBufferPool:
+    """
+    SensorBuffer theo từng device_id, có memory budget + LRU eviction (thread-safe).
+
+    Budget tính theo số records: max_devices = max_total_records // max_size.
+    """
+
+    def __init__(
+        self,
+        max_size: int = BUFFER_MAX_SIZE,
+        min_ready: int = BUFFER_MIN_READY,
+        max_total_records: int = 240_000,
+        idle_ttl: Optional[float] = 6 * 3600,
+    ):
+        self.max_size = max_size
+        self.min_ready = min_ready
+        self.max_devices = max(1, int(max_total_records) // max_size)
+        self.idle_ttl = idle_ttl
+
+        self._lock = threading.Lock()
+        self._buffers: "OrderedDict[str, SensorBuffer]" = OrderedDict()
+        self._last_seen: Dict[str, float] = {}
+        self.evicted_lru = 0
+        self.evicted_idle = 0
+
+    def __len__(self) -> int:
+        return len(self._buffers)
+
+    def __contains__(self, device_id: str) -> bool:
+        return device_id in self._buffers
+
+    def add(self, data: Dict) -> str:
+        """Thêm 1 reading vào buffer của device tương ứng. Returns device_id."""
+        device_id = str(data.get("device_id", DEFAULT_DEVICE_ID))
+        with self._lock:
+            buf = self._buffers.get(device_id)
+            if buf is None:
+                buf = self._new_buffer()
+                self._buffers[device_id] = buf
+            else:
+                self._buffers.move_to_end(device_id)
+            buf.add(data)
+            self._last_seen[device_id] = time.monotonic()
+
+            # Vượt memory budget → evict device ít dùng nhất
+            while len(self._buffers) > self.max_devices:
+                old_id, _ = self._buffers.popitem(last=False)
+                self._last_seen.pop(old_id, None)
+                self.evicted_lru += 1
+        return device_id
+
+    def warm(self, device_id: str, ts, values, idle_seconds: float = 0.0) -> SensorBuffer:
+        """
+        Nạp các bản ghi đã lưu (warm start) vào buffer của device.
+
+        ts: epoch giây (tăng dần); values: mảng (n, 4) theo CHANNELS.
+        idle_seconds: reading cuối cách đây bao lâu → giữ đúng thời gian idle.
+        """
+        with self._lock:
+            buf = self._buffers.get(device_id)
+            if buf is None:
+                buf = self._new_buffer()
+                self._buffers[device_id] = buf
+            for t, row in zip(ts, values):
+                buf.add_values(int(t), *row)
+            self._last_seen[device_id] = time.monotonic() - max(0.0, idle_seconds)
+            while len(self._buffers) > self.max_devices:
+                old_id, _ = self._buffers.popitem(last=False)
+                self._last_seen.pop(old_id, None)
+                self.evicted_lru += 1
+        return buf
+
+    def get(self, device_id: str) -> Optional[SensorBuffer]:
+        """Buffer của device (None nếu chưa có / đã bị evict)."""
+        return self._buffers.get(device_id)
+
+    def devices(self) -> List[str]:
+        """Danh sách device_id (cũ nhất → mới nhất theo lần nhận dữ liệu)."""
+        with self._lock:
+            return list(self._buffers.keys())
+
+    def total_records(self) -> int:
+        with self._lock:
+            return sum(len(b) for b in self._buffers.values())
+
+    def evict_idle(self, now: Optional[float] = None) -> List[str]:
+        """Bỏ các device không gửi dữ liệu quá idle_ttl giây."""
+        if not self.idle_ttl:
+            return []
+        now = time.monotonic() if now is None else now
+        evicted = []
+        with self._lock:
+            # OrderedDict theo thứ tự lần nhận cuối → dừng ở device đầu tiên còn active
+            for device_id in list(self._buffers.keys()):
+                if now - self._last_seen.get(device_id, now) <= self.idle_ttl:
+                    break
+                del self._buffers[device_id]
+                self._last_seen.pop(device_id, None)
+                evicted.append(device_id)
+            self.evicted_idle += len(evicted)
+        return evicted
+
+    def is_ready(self, device_id: str) -> bool:
+        buf = self._buffers.get(device_id)
+        return buf is not None and buf.is_ready()
+
+    def ready_devices(self) -> List[str]:
+        with self._lock:
+            return [d for d, b in self._buffers.items() if b.is_ready()]
+
+    def readiness(self) -> Dict[str, Dict]:
+        """Trạng thái từng device: số records, ready chưa, bao lâu chưa gửi dữ liệu."""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                device_id: {
+                    "size": len(buf),
+                    "max_size": buf.max_size,
+                    "ready": buf.is_ready(),
+                    "idle_seconds": round(now - self._last_seen.get(device_id, now), 1),
+                }
+                for device_id, buf in self._buffers.items()
+            }
+
+    def stats(self) -> Dict:
+        with self._lock:
+            ready = sum(1 for b in self._buffers.values() if b.is_ready())
+            return {
+                "devices": len(self._buffers),
+                "devices_ready": ready,
+                "max_devices": self.max_devices,
+                "records": sum(len(b) for b in self._buffers.values()),
+                "evicted_lru": self.evicted_lru,
+                "evicted_idle": self.evicted_idle,
+            }
+
+    def _new_buffer(self) -> SensorBuffer:
+        return SensorBuffer(max_size=self.max_size, min_ready=self.min_ready)
+
+
+__all__ = [
+    "BUFFER_MAX_SIZE",
+    "BUFFER_MIN_READY",
+    "CHANNELS",
+    "parse_epoch_seconds",
+    "SensorBuffer",
+    "DeviceBufferPool",
+]
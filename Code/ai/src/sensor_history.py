@@ -0,0 +1,307 @@
+"""
+Sensor History - Lịch sử sensor trong RAM, index theo thời gian, tra cứu as-of O(log n).
+
+Thay cho pattern cũ ở mỗi lần dự báo: pd.read_csv toàn file → sort → lọc
+ts <= target bằng boolean mask → tail(12).
+
+- DeviceHistory: mảng cột của 1 device (ts int64 epoch giây tăng dần + 4 kênh
+  float64), cấp phát dư (gấp đôi khi đầy) → append amortized O(1)
+- asof(target, n): np.searchsorted trên ts → n bản ghi gần nhất có ts <= target,
+  trả về SensorWindow là view (không copy)
+- SensorHistory: DeviceHistory theo device_id + chuỗi gộp mọi device (dùng khi
+  slot không ghi device / device không có dữ liệu, giống CSV cũ)
+- get_history(path): load CSV 1 lần / process; file được append thêm → chỉ
+  đọc phần byte mới; file bị ghi lại (nhỏ đi) → load lại toàn bộ
+"""
+
+from __future__ import annotations
+
+import io
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from feature_engineering import SensorWindow
+
+CHANNELS = ("temp_c", "rh_pct", "pressure_hpa", "soil_moist_pct")
+NAT = np.iinfo(np.int64).min
+
+
+def to_epoch_seconds(values) -> np.ndarray:
+    """Cột ts (chuỗi / datetime, naive = UTC) → epoch giây int64 (không parse được → NAT)."""
+    ts = pd.to_datetime(pd.Series(values), utc=True, format="mixed", errors="coerce").dt.tz_localize(None)
+    return ts.to_numpy(dtype="datetime64[s]").astype(np.int64)
+
+
+def _target_epoch(target) -> int:
+    if isinstance(target, (int, np.integer)):
+        return int(target)
+    ts = pd.Timestamp(target)
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert("UTC").tz_localize(None)
+    return int((ts - pd.Timestamp(0)) // pd.Timedelta(seconds=1))
+
+
+class DeviceHistory:
+    """Chuỗi thời gian của 1 device, sắp xếp theo ts (mảng cột NumPy)."""
+
+    def __init__(self, capacity: int = 1024):
+        self._ts = np.empty(capacity, dtype=np.int64)
+        self._values = np.empty((len(CHANNELS), capacity), dtype=np.float64)
+        self._n = 0
+
+    def __len__(self) -> int:
+        return self._n
+
+    @property
+    def ts(self) -> np.ndarray:
+        return self._ts[:self._n]
+
+    def extend(self, ts: np.ndarray, values: np.ndarray) -> None:
+        """
+        Thêm nhiều bản ghi. values: mảng (4, n) theo CHANNELS.
+
+        Dữ liệu mới hơn bản ghi cuối (trường hợp thường gặp) → ghi nối tiếp;
+        có bản ghi cũ hơn → merge lại bằng sort ổn định (hiếm).
+        """
+        ts = np.asarray(ts, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64).reshape(len(CHANNELS), -1)
+        if not len(ts):
+            return
+        if np.any(np.diff(ts) < 0):
+            order = np.argsort(ts, kind="stable")
+            ts, values = ts[order], values[:, order]
+
+        n = self._n
+        if n and ts[0] < self._ts[n - 1]:
+            merged_ts = np.concatenate([self._ts[:n], ts])
+            merged_values = np.concatenate([self._values[:, :n], values], axis=1)
+            order = np.argsort(merged_ts, kind="stable")
+            self._n = 0
+            self._reserve(len(order))
+            self._ts[:len(order)] = merged_ts[order]
+            self._values[:, :len(order)] = merged_values[:, order]
+            self._n = len(order)
+            return
+
+        self._reserve(n + len(ts))
+        self._ts[n:n + len(ts)] = ts
+        self._values[:, n:n + len(ts)] = values
+        self._n = n + len(ts)
+
+    def append(self, ts: int, temp_c: float, rh_pct: float, pressure_hpa: float, soil_moist_pct: float) -> None:
+        """Thêm 1 bản ghi (ts epoch giây UTC)."""
+        self.extend(np.array([ts]), np.array([[temp_c], [rh_pct], [pressure_hpa], [soil_moist_pct]]))
+
+    def asof(self, target, n: int = 12) -> SensorWindow:
+        """n bản ghi gần nhất có ts <= target (view, có thể rỗng)."""
+        end = int(np.searchsorted(self.ts, _target_epoch(target), side="right"))
+        return self._slice(max(0, end - n), end)
+
+    def between(self, start, end) -> SensorWindow:
+        """Các bản ghi có start <= ts <= end."""
+        ts = self.ts
+        lo = int(np.searchsorted(ts, _target_epoch(start), side="left"))
+        hi = int(np.searchsorted(ts, _target_epoch(end), side="right"))
+        return self._slice(lo, hi)
+
+    def tail(self, n: int = 12) -> SensorWindow:
+        return self._slice(max(0, self._n - n), self._n)
+
+    def _slice(self, lo: int, hi: int) -> SensorWindow:
+        v = self._values
+        return SensorWindow(self._ts[lo:hi], v[0, lo:hi], v[1, lo:hi], v[2, lo:hi], v[3, lo:hi])
+
+    def _reserve(self, size: int) -> None:
+        capacity = len(self._ts)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        ts = np.empty(capacity, dtype=np.int64)
+        values = np.empty((len(CHANNELS), capacity), dtype=np.float64)
+        ts[:self._n] = self._ts[:self._n]
+        values[:, :self._n] = self._values[:, :self._n]
+        self._ts, self._values = ts, values
+
+
+class SensorHistory:
+    """
+    DeviceHistory theo device_id (thread-safe cho append; đọc không khoá).
+
+    Lưu ý: SensorWindow trả về là view → append có thể cấp phát lại mảng,
+    view cũ vẫn hợp lệ (giữ mảng cũ) nhưng không thấy dữ liệu mới.
+    """
+
+    def __init__(self):
+        self._devices: Dict[str, DeviceHistory] = {}
+        self._all: Optional[DeviceHistory] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return sum(len(h) for h in self._devices.values())
+
+    def __contains__(self, device_id: str) -> bool:
+        return device_id in self._devices
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, default_device: str = "esp32-01") -> "SensorHistory":
+        history = cls()
+        history.extend_frame(df, default_device=default_device)
+        return history
+
+    def extend_frame(self, df: pd.DataFrame, default_device: str = "esp32-01") -> int:
+        """Thêm các dòng của DataFrame (cột ts, [device_id], 4 kênh). Returns số dòng."""
+        if df is None or not len(df):
+            return 0
+        ts = to_epoch_seconds(df["ts"])
+        valid = ts != NAT
+        values = np.vstack([pd.to_numeric(df[c], errors="coerce").to_numpy(dtype=np.float64) for c in CHANNELS])
+        if "device_id" in df.columns:
+            devices = df["device_id"].fillna(default_device).astype(str).to_numpy()
+        else:
+            devices = np.full(len(df), default_device, dtype=object)
+
+        with self._lock:
+            for device_id in pd.unique(devices[valid]):
+                mask = valid & (devices == device_id)
+                self._device(device_id).extend(ts[mask], values[:, mask])
+            self._all = None
+        return int(valid.sum())
+
+    def append(self, device_id: str, ts: int, temp_c: float, rh_pct: float,
+               pressure_hpa: float, soil_moist_pct: float) -> None:
+        """Thêm 1 reading (vd. từ MQTT) mà không đọc lại file."""
+        with self._lock:
+            self._device(str(device_id)).append(ts, temp_c, rh_pct, pressure_hpa, soil_moist_pct)
+            self._all = None
+
+    def devices(self) -> List[str]:
+        return list(self._devices.keys())
+
+    def get(self, device_id: Optional[str] = None) -> DeviceHistory:
+        """
+        Lịch sử của device; device_id=None hoặc device không có dữ liệu →
+        chuỗi gộp mọi device (giống đọc CSV không lọc device).
+        """
+        if device_id is not None and device_id in self._devices:
+            return self._devices[device_id]
+        if len(self._devices) == 1:
+            return next(iter(self._devices.values()))
+        all_history = self._all
+        if all_history is None:
+            with self._lock:
+                all_history = DeviceHistory(capacity=max(1, len(self)))
+                for h in self._devices.values():
+                    all_history.extend(h.ts, h._values[:, :len(h)])
+                self._all = all_history
+        return all_history
+
+    def asof(self, target, device_id: Optional[str] = None, n: int = 12) -> SensorWindow:
+        """n bản ghi gần nhất có ts <= target của device (O(log n))."""
+        return self.get(device_id).asof(target, n)
+
+    def tail(self, n: int = 12, device_id: Optional[str] = None) -> SensorWindow:
+        return self.get(device_id).tail(n)
+
+    def time_range(self, device_id: Optional[str] = None) -> Optional[Tuple[int, int]]:
+        """(ts đầu, ts cuối) epoch giây; None nếu chưa có dữ liệu."""
+        if not self._devices:
+            return None
+        ts = self.get(device_id).ts
+        return (int(ts[0]), int(ts[-1])) if len(ts) else None
+
+    def _device(self, device_id: str) -> DeviceHistory:
+        history = self._devices.get(device_id)
+        if history is None:
+            history = self._devices[device_id] = DeviceHistory()
+        return history
+
+
+class CsvHistory:
+    """SensorHistory của 1 file CSV, đồng bộ theo mtime/size (chỉ đọc phần append mới)."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._history: Optional[SensorHistory] = None
+        self._header = b""
+        self._offset = 0
+        self._signature: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+        self.full_loads = 0
+        self.incremental_loads = 0
+
+    def get(self) -> SensorHistory:
+        st = os.stat(self.path)
+        signature = (st.st_mtime_ns, st.st_size)
+        if self._history is not None and signature == self._signature:
+            return self._history
+        with self._lock:
+            if self._history is None or signature != self._signature:
+                if self._history is None or st.st_size < self._offset:
+                    self._load_full()
+                else:
+                    self._load_appended()
+                self._signature = signature
+        return self._history
+
+    def _load_full(self) -> None:
+        with open(self.path, "rb") as f:
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        header_end = data.find(b"\n") + 1
+        self._header = data[:header_end]
+        df = pd.read_csv(io.BytesIO(data[:end])) if end > header_end else pd.DataFrame()
+        self._history = SensorHistory.from_frame(df)
+        self._offset = max(end, header_end)
+        self.full_loads += 1
+
+    def _load_appended(self) -> None:
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read()
+        # Chỉ lấy các dòng đầy đủ; dòng đang ghi dở để lần sau
+        end = data.rfind(b"\n") + 1
+        if end:
+            self._history.extend_frame(pd.read_csv(io.BytesIO(self._header + data[:end])))
+            self._offset += end
+        self.incremental_loads += 1
+
+
+_CSV_HISTORIES: Dict[Path, CsvHistory] = {}
+_CSV_HISTORIES_LOCK = threading.Lock()
+
+
+def get_history(path: Path) -> SensorHistory:
+    """SensorHistory dùng chung toàn process cho file CSV (load 1 lần, cập nhật khi file đổi)."""
+    path = Path(path).resolve()
+    source = _CSV_HISTORIES.get(path)
+    if source is None:
+        with _CSV_HISTORIES_LOCK:
+            source = _CSV_HISTORIES.setdefault(path, CsvHistory(path))
+    return source.get()
+
+
+def frame_from_window(window: SensorWindow) -> pd.DataFrame:
+    """SensorWindow → DataFrame (ts datetime naive UTC + 4 kênh) cho code dùng DataFrame."""
+    return pd.DataFrame({
+        "ts": pd.to_datetime(window.ts, unit="s"),
+        "temp_c": window.temp_c,
+        "rh_pct": window.rh_pct,
+        "pressure_hpa": window.pressure_hpa,
+        "soil_moist_pct": window.soil_moist_pct,
+    })
+
+
+__all__ = [
+    "DeviceHistory",
+    "SensorHistory",
+    "CsvHistory",
+    "get_history",
+    "frame_from_window",
+    "to_epoch_seconds",
+]
@@ -0,0 +1,424 @@
+"""
+Sensor Store - Kho dữ liệu sensor dạng cột (Parquet), phân vùng theo ngày + thiết bị.
+
+Thay cho 1 file sensor_live.csv ngày càng lớn (mọi consumer phải parse toàn bộ):
+- Ghi append-only: mỗi lần flush tạo 1 "hot segment" nhỏ trong hot/
+    hot/seg-<min_ms>-<max_ms>-<id>.parquet
+- Compact: gộp các hot segment vào partition theo ngày / device
+    day=2024-11-20/device=esp32-01/data.parquet
+  chạy trên thread nền của store (đủ `compact_after_segments` segment), không
+  chặn append() / flush của GroupCommitWriter
+- Đọc: chỉ chạm các partition nằm trong khoảng thời gian + device cần thiết
+  (ví dụ "60 phút gần nhất của esp32-01" chỉ đọc vài KB).
+
+Dùng làm sink cho sensor_writer.GroupCommitWriter (write_rows / sync / close).
+
+Chạy:
+    python src/sensor_store.py info
+    python src/sensor_store.py import-csv [--csv data/sensor_live.csv]
+    python src/sensor_store.py compact
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import threading
+import uuid
+from datetime import timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote, unquote
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+ROOT = Path(__file__).resolve().parents[1]
+DATA_DIR = ROOT / "data"
+SENSOR_STORE_DIR = DATA_DIR / "sensor_store"
+
+SENSOR_COLUMNS = ["ts", "device_id", "temp_c", "rh_pct", "pressure_hpa", "soil_moist_pct"]
+VALUE_COLUMNS = ["temp_c", "rh_pct", "pressure_hpa", "soil_moist_pct"]
+
+# Số lần đọc lại khi hot segment bị compact giữa lúc list và lúc đọc
+READ_RETRIES = 5
+
+# Số lần mở rộng lookback khi cần lấy N bản ghi gần nhất (read_asof)
+ASOF_LOOKBACKS = [timedelta(hours=2), timedelta(days=1), timedelta(days=7), None]
+
+
+def _to_naive_utc(ts) -> Optional[pd.Timestamp]:
+    """Chuẩn hóa timestamp về pd.Timestamp naive (UTC) - giống prepare_training_data."""
+    if ts is None:
+        return None
+    ts = pd.Timestamp(ts)
+    if ts.tz is not None:
+        ts = ts.tz_convert("UTC").tz_localize(None)
+    return ts
+
+
+def _normalize_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Ép kiểu cột: ts naive UTC, device_id string, giá trị float."""
+    df = df.copy()
+    df["ts"] = pd.to_datetime(df["ts"], utc=True, format="mixed").dt.tz_localize(None)
+    if "device_id" not in df.columns:
+        df["device_id"] = "esp32-01"
+    df["device_id"] = df["device_id"].astype(str)
+    for col in VALUE_COLUMNS:
+        if col not in df.columns:
+            df[col] = np.nan
+        df[col] = df[col].astype("float64")
+    return df[SENSOR_COLUMNS]
+
+
+class SensorStore:
+    """Append-only store: hot segments + partition day/device (Parquet)."""
+
+    def __init__(
+        self,
+        root: Path = SENSOR_STORE_DIR,
+        compact_after_segments: int = 32,
+        writer_id: Optional[str] = None,
+    ):
+        if not PYARROW_AVAILABLE:
+            raise ImportError("SensorStore cần pyarrow (pip install pyarrow)")
+        self.root = Path(root)
+        self.hot_dir = self.root / "hot"
+        self.name = self.root.name
+        self.compact_after_segments = int(compact_after_segments)
+        # Nhiều process cùng ghi 1 store (worker_pool): mỗi writer chỉ compact
+        # segment của mình; device-affine → không 2 writer ghi cùng partition
+        self.writer_id = writer_id
+        self._compact_lock = threading.Lock()
+        self._compact_wakeup = threading.Event()
+        self._compactor: Optional[threading.Thread] = None
+        self._closed = False
+        self._written_segments: List[Path] = []
+        self.hot_dir.mkdir(parents=True, exist_ok=True)
+
+    # ===== Ghi =====
+    def append(self, df: pd.DataFrame) -> Optional[Path]:
+        """Ghi 1 hot segment từ DataFrame (các cột như sensor_live.csv)."""
+        if df is None or len(df) == 0:
+            return None
+        df = _normalize_frame(df)
+        min_ms = int(df["ts"].min().value // 1_000_000)
+        max_ms = int(df["ts"].max().value // 1_000_000)
+        suffix = f"-{self.writer_id}" if self.writer_id else ""
+        name = f"seg-{min_ms}-{max_ms}-{uuid.uuid4().hex[:8]}{suffix}.parquet"
+        path = self.hot_dir / name
+        tmp = path.with_suffix(".tmp")
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp)
+        os.replace(tmp, path)
+        self._written_segments.append(path)
+
+        if self.compact_after_segments and len(self._own_segments()) >= self.compact_after_segments:
+            self._schedule_compact()
+        return path
+
+    def write_rows(self, rows: List[Dict]) -> None:
+        """Sink API cho GroupCommitWriter: mỗi batch → 1 hot segment."""
+        self.append(pd.DataFrame(rows))
+
+    def sync(self) -> None:
+        """fsync các hot segment đã ghi từ lần sync trước."""
+        written, self._written_segments = self._written_segments, []
+        for path in written:
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except FileNotFoundError:
+                continue  # đã được compact
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def close(self) -> None:
+        """Dừng thread compact (không compact thêm) rồi fsync segment còn lại."""
+        self._closed = True
+        self._compact_wakeup.set()
+        if self._compactor is not None:
+            self._compactor.join()
+        self.sync()
+
+    def _schedule_compact(self) -> None:
+        """Đánh thức thread compact nền (khởi tạo lần đầu)."""
+        if self._closed:
+            return
+        if self._compactor is None:
+            self._compactor = threading.Thread(
+                target=self._compact_loop, name=f"compact-{self.name}", daemon=True
+            )
+            self._compactor.start()
+        self._compact_wakeup.set()
+
+    def _compact_loop(self) -> None:
+        while True:
+            self._compact_wakeup.wait()
+            self._compact_wakeup.clear()
+            if self._closed:
+                return
+            try:
+                self.compact()
+            except Exception as e:
+                logger.error(f"Error compacting {self.name}: {e}", exc_info=True)
+
+    def compact(self) -> int:
+        """
+        Gộp hot segments vào partition day=/device=.
+
+        Ghi partition trước (tmp + os.replace), xóa hot segment sau → reader
+        luôn thấy dữ liệu ở ít nhất 1 nơi (read() có dedupe).
+
+        Returns:
+            Số hot segment đã gộp
+        """
+        with self._compact_lock:
+            segments = self._own_segments()
+            if not segments:
+                return 0
+            hot = pd.concat([pq.read_table(p).to_pandas() for p in segments], ignore_index=True)
+            hot["day"] = hot["ts"].dt.strftime("%Y-%m-%d")
+
+            for (day, device_id), group in hot.groupby(["day", "device_id"], sort=False):
+                part_path = self._partition_path(day, device_id)
+                group = group.drop(columns=["day"])
+                if part_path.exists():
+                    group = pd.concat([pq.read_table(part_path).to_pandas(), group], ignore_index=True)
+                group = (
+                    group.drop_duplicates(subset=["ts", "device_id"], keep="last")
+                    .sort_values("ts")
+                    .reset_index(drop=True)
+                )
+                part_path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = part_path.with_suffix(".tmp")
+                pq.write_table(pa.Table.from_pandas(group[SENSOR_COLUMNS], preserve_index=False), tmp)
+                os.replace(tmp, part_path)
+
+            for p in segments:
+                p.unlink(missing_ok=True)
+            logger.info(f"✓ Compacted {len(segments)} hot segment(s) into {self.root.name}")
+            return len(segments)
+
+    # ===== Đọc =====
+    def read(
+        self,
+        start=None,
+        end=None,
+        device_id: Optional[str] = None,
+        columns: Optional[List[str]] = None,
+    ) -> pd.DataFrame:
+        """
+        Đọc dữ liệu trong [start, end] (bao gồm 2 đầu), lọc theo device.
+
+        Chỉ mở các partition có ngày trong khoảng và đúng device; hot segment
+        được lọc theo khoảng thời gian ghi trên tên file.
+        """
+        start = _to_naive_utc(start)
+        end = _to_naive_utc(end)
+        columns = list(columns or SENSOR_COLUMNS)
+        read_cols = list(dict.fromkeys(["ts", "device_id"] + columns))
+
+        filters = []
+        if start is not None:
+            filters.append(("ts", ">=", start))
+        if end is not None:
+            filters.append(("ts", "<=", end))
+        if device_id is not None:
+            filters.append(("device_id", "=", str(device_id)))
+
+        # Hot trước, partition sau (xem compact()). Segment biến mất giữa lúc list
+        # và lúc đọc → compact đã ghi partition (có thể sau lúc list partition)
+        # → list + đọc lại toàn bộ
+        for _ in range(READ_RETRIES):
+            paths = self._hot_segments(start, end) + self._partition_files(start, end, device_id)
+            try:
+                tables = [pq.read_table(path, columns=read_cols, filters=filters or None) for path in paths]
+                break
+            except FileNotFoundError:
+                continue
+        else:
+            raise RuntimeError(f"Hot segments của {self.name} liên tục bị compact trong lúc đọc")
+        if not tables:
+            return pd.DataFrame(columns=columns)
+
+        df = pa.concat_tables(tables).to_pandas()
+        df = (
+            df.drop_duplicates(subset=["ts", "device_id"], keep="last")
+            .sort_values("ts")
+            .reset_index(drop=True)
+        )
+        return df[columns]
+
+    def read_asof(self, end=None, n: int = 12, device_id: Optional[str] = None) -> pd.DataFrame:
+        """
+        Lấy n bản ghi gần nhất có ts <= end (end=None → bản ghi mới nhất).
+
+        Mở rộng lookback dần (2h → 1 ngày → 7 ngày → toàn bộ) để chỉ đọc
+        partition gần end trong trường hợp thường gặp.
+        """
+        end = _to_naive_utc(end) if end is not None else self.latest_ts(device_id)
+        if end is None:
+            return pd.DataFrame(columns=SENSOR_COLUMNS)
+        df = pd.DataFrame(columns=SENSOR_COLUMNS)
+        for lookback in ASOF_LOOKBACKS:
+            start = end - lookback if lookback is not None else None
+            df = self.read(start=start, end=end, device_id=device_id)
+            if len(df) >= n:
+                break
+        return df.tail(n).reset_index(drop=True)
+
+    def tail(self, n: int = 12, device_id: Optional[str] = None) -> pd.DataFrame:
+        """n bản ghi mới nhất."""
+        return self.read_asof(end=None, n=n, device_id=device_id)
+
+    def latest_ts(self, device_id: Optional[str] = None) -> Optional[pd.Timestamp]:
+        """Timestamp mới nhất (chỉ đọc cột ts của ngày cuối + hot segments)."""
+        # Hot trước, partition sau: segment đã bị compact thì dữ liệu của nó
+        # đã nằm trong partition được list sau đó
+        candidates = []
+        if device_id is None:
+            # Không lọc device: max ts nằm sẵn trong tên hot segment
+            ranges = [self._segment_range(p) for p in self._hot_segments()]
+            if ranges:
+                candidates.append(pd.Timestamp(max(r[1] for r in ranges), unit="ms"))
+        else:
+            filters = [("device_id", "=", str(device_id))]
+            for path in self._hot_segments():
+                try:
+                    ts = pq.read_table(path, columns=["ts"], filters=filters).column("ts")
+                except FileNotFoundError:
+                    continue
+                if len(ts):
+                    candidates.append(pd.Timestamp(pa.compute.max(ts).as_py()))
+        days = self.days(device_id)
+        if days:
+            df = self.read(start=pd.Timestamp(days[-1]), device_id=device_id, columns=["ts"])
+            if len(df):
+                candidates.append(df["ts"].max())
+        return max(candidates) if candidates else None
+
+    def days(self, device_id: Optional[str] = None) -> List[str]:
+        """Danh sách ngày (YYYY-MM-DD) đã compact, tăng dần."""
+        days = []
+        for day_dir in self.root.glob("day=*"):
+            if device_id is None or (day_dir / f"device={quote(str(device_id), safe='-_.')}").exists():
+                days.append(day_dir.name.split("=", 1)[1])
+        return sorted(days)
+
+    def devices(self) -> List[str]:
+        """Danh sách device_id đã compact."""
+        return sorted({unquote(p.name.split("=", 1)[1]) for p in self.root.glob("day=*/device=*")})
+
+    def is_empty(self) -> bool:
+        return not self._hot_segments() and not any(self.root.glob("day=*/device=*/data.parquet"))
+
+    # ===== Helpers =====
+    def _partition_path(self, day: str, device_id: str) -> Path:
+        return self.root / f"day={day}" / f"device={quote(str(device_id), safe='-_.')}" / "data.parquet"
+
+    def _partition_files(self, start, end, device_id: Optional[str]) -> List[Path]:
+        start_day = start.strftime("%Y-%m-%d") if start is not None else None
+        end_day = end.strftime("%Y-%m-%d") if end is not None else None
+        device_glob = f"device={quote(str(device_id), safe='-_.')}" if device_id is not None else "device=*"
+        files = []
+        for day_dir in sorted(self.root.glob("day=*")):
+            day = day_dir.name.split("=", 1)[1]
+            if (start_day and day < start_day) or (end_day and day > end_day):
+                continue
+            files.extend(sorted(day_dir.glob(f"{device_glob}/data.parquet")))
+        return files
+
+    @staticmethod
+    def _segment_range(path: Path) -> Tuple[int, int]:
+        _, min_ms, max_ms, _ = path.stem.split("-", 3)
+        return int(min_ms), int(max_ms)
+
+    def _hot_segments(self, start=None, end=None) -> List[Path]:
+        segments = []
+        start_ms = start.value // 1_000_000 if start is not None else None
+        end_ms = end.value // 1_000_000 if end is not None else None
+        for path in self.hot_dir.glob("seg-*.parquet"):
+            min_ms, max_ms = self._segment_range(path)
+            if (start_ms is not None and max_ms < start_ms) or (end_ms is not None and min_ms > end_ms):
+                continue
+            segments.append(path)
+        return sorted(segments, key=self._segment_range)
+
+
+    def _own_segments(self) -> List[Path]:
+        """Hot segment do writer này ghi (tất cả nếu không đặt writer_id)."""
+        segments = self._hot_segments()
+        if self.writer_id:
+            segments = [p for p in segments if p.stem.endswith(f"-{self.writer_id}")]
+        return segments
+
+
+def open_default_store() -> Optional[SensorStore]:
+    """Mở store mặc định nếu có pyarrow và store đã có dữ liệu, ngược lại None."""
+    if not PYARROW_AVAILABLE or not SENSOR_STORE_DIR.exists():
+        return None
+    store = SensorStore(SENSOR_STORE_DIR)
+    return None if store.is_empty() else store
+
+
+def import_csv(store: SensorStore, csv_path: Path, chunk_rows: int = 50_000) -> int:
+    """Migrate sensor_live.csv cũ vào store (theo chunk, rồi compact)."""
+    total = 0
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_rows):
+        store.append(chunk)
+        total += len(chunk)
+    store.compact()
+    return total
+
+
+__all__ = [
+    "PYARROW_AVAILABLE",
+    "SENSOR_STORE_DIR",
+    "SENSOR_COLUMNS",
+    "SensorStore",
+    "open_default_store",
+    "import_csv",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sensor store (Parquet, day/device partitions)")
+    parser.add_argument("command", choices=["info", "import-csv", "compact"])
+    parser.add_argument("--csv", type=str, default=str(DATA_DIR / "sensor_live.csv"),
+                        help="File CSV nguồn cho import-csv (default: data/sensor_live.csv)")
+    parser.add_argument("--root", type=str, default=str(SENSOR_STORE_DIR),
+                        help="Thư mục store (default: data/sensor_store)")
+    args = parser.parse_args()
+
+    store = SensorStore(Path(args.root), compact_after_segments=0)
+
+    if args.command == "import-csv":
+        n = import_csv(store, Path(args.csv))
+        print(f"✓ Imported {n} rows from {Path(args.csv).name} into {store.root}")
+    elif args.command == "compact":
+        n = store.compact()
+        print(f"✓ Compacted {n} hot segment(s)")
+
+    days = store.days()
+    print(f"Store: {store.root}")
+    print(f"   Days: {len(days)} ({days[0] if days else '-'} → {days[-1] if days else '-'})")
+    print(f"   Devices: {', '.join(store.devices()) or '-'}")
+    print(f"   Hot segments: {len(store._hot_segments())}")
+    print(f"   Latest ts: {store.latest_ts()}")
+
+
+if __name__ == "__main__":
+    main()
+
@@ -0,0 +1,296 @@
+"""
+Sensor Writer - Ghi dữ liệu sensor vào CSV theo kiểu group-commit.
+
+Thay vì mở file, tạo csv.DictWriter rồi đóng file cho MỖI message MQTT,
+writer này giữ file mở suốt vòng đời service và gom các dòng vào buffer:
+- Flush khi đủ `batch_size` dòng hoặc sau `flush_interval` giây, luôn trên thread
+  nền: write() chỉ append + đánh thức flusher, không chạm đĩa trên thread gọi
+  (vd. paho network thread). Chỉ khi buffer vượt `max_pending` dòng (đĩa chậm hơn
+  tốc độ nhận) write() mới chờ flusher (backpressure, tối đa flush_interval giây)
+- fsync theo policy: "never" | "interval" | "always"
+    + never   : chỉ flush vào page cache của OS (nhanh nhất)
+    + interval: fsync tối đa 1 lần mỗi `fsync_interval` giây
+    + always  : fsync sau mỗi lần flush (an toàn nhất)
+- Thống kê: số dòng, rows/sec, độ trễ flush (avg/max)
+
+Dùng chung cho ai_service.py và collect_data_mqtt.py. Sink mặc định là CSV
+(CsvSink); sensor_store.SensorStore cũng dùng được làm sink (Parquet).
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SENSOR_LIVE_FIELDNAMES = ['ts', 'device_id', 'temp_c', 'rh_pct', 'pressure_hpa', 'soil_moist_pct']
+DEFAULT_DEVICE_ID = "esp32-01"
+
+FSYNC_POLICIES = ("never", "interval", "always")
+
+
+def payload_to_row(data: Dict, default_ts: Optional[str] = None) -> Dict:
+    """Map data từ ESP32 format (MQTT) sang CSV format (sensor_live.csv)."""
+    return {
+        'ts': data.get('timestamp', default_ts or datetime.utcnow().isoformat()),
+        'device_id': data.get('device_id', DEFAULT_DEVICE_ID),
+        'temp_c': float(data.get('temperature', 0)),
+        'rh_pct': float(data.get('humidity', 0)),
+        'pressure_hpa': float(data.get('pressure', 0)),
+        'soil_moist_pct': float(data.get('soilMoisture', 0)),
+    }
+
+
+class CsvSink:
+    """
+    Sink ghi vào 1 file CSV giữ mở suốt vòng đời writer.
+
+    write_rows() là all-or-nothing: batch được format trong RAM rồi ghi thẳng
+    (không buffer); ghi lỗi giữa chừng (vd. đầy đĩa) → truncate file về kích
+    thước trước khi ghi → GroupCommitWriter thử lại batch không tạo dòng trùng.
+    """
+
+    def __init__(self, path: Path, fieldnames: Optional[List[str]] = None):
+        self.path = Path(path)
+        self.name = self.path.name
+        self.fieldnames = list(fieldnames or SENSOR_LIVE_FIELDNAMES)
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        is_new = not self.path.exists() or self.path.stat().st_size == 0
+        self._file = open(self.path, 'ab', buffering=0)
+        if is_new:
+            self._append(self._encode([], header=True))
+            logger.info(f"✓ Created {self.path.name}")
+
+    def write_rows(self, rows: List[Dict]) -> None:
+        self._append(self._encode(rows))
+
+    def _encode(self, rows: List[Dict], header: bool = False) -> bytes:
+        buf = io.StringIO(newline='')
+        writer = csv.DictWriter(buf, fieldnames=self.fieldnames, extrasaction='ignore')
+        if header:
+            writer.writeheader()
+        writer.writerows(rows)
+        return buf.getvalue().encode('utf-8')
+
+    def _append(self, data: bytes) -> None:
+        fd = self._file.fileno()
+        offset = os.fstat(fd).st_size
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[self._file.write(view):]
+        except BaseException:
+            # Bỏ phần đã ghi dở → file đúng như trước batch
+            try:
+                os.ftruncate(fd, offset)
+            except OSError as e:
+                logger.error(f"Cannot roll back partial write to {self.name}: {e}")
+            raise
+
+    def sync(self) -> None:
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class GroupCommitWriter:
+    """
+    Writer long-lived với batch + flush interval + fsync policy (thread-safe).
+
+    `sink` cần có: write_rows(rows), sync(), close() (xem CsvSink, SensorStore).
+    write_rows() phải all-or-nothing: lỗi → batch được trả lại buffer và ghi lại
+    ở lần flush sau (CsvSink truncate phần ghi dở, SensorStore ghi tmp + os.replace).
+    """
+
+    def __init__(
+        self,
+        sink,
+        batch_size: int = 64,
+        flush_interval: float = 1.0,
+        fsync_policy: str = "interval",
+        fsync_interval: float = 5.0,
+        max_pending: Optional[int] = None,
+    ):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"fsync_policy phải là một trong {FSYNC_POLICIES}, nhận: {fsync_policy}")
+
+        self.sink = sink
+        self.name = getattr(sink, "name", type(sink).__name__)
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = float(flush_interval)
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = float(fsync_interval)
+        # Hard cap của buffer (mặc định 16 batch) → vượt thì write() chờ flusher
+        self.max_pending = max(self.batch_size, int(max_pending or 16 * self.batch_size))
+
+        # _lock: chỉ giữ khi thao tác _pending / counters (ngắn);
+        # _io_lock: tuần tự hoá ghi sink / fsync / close (không chặn write())
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._space = threading.Condition(self._lock)
+        self._pending: List[Dict] = []
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._dirty = False
+        self._last_fsync = time.monotonic()
+
+        # Thống kê
+        self._started_at = time.monotonic()
+        self.rows_written = 0
+        self.flush_count = 0
+        self.fsync_count = 0
+        self.flush_seconds_total = 0.0
+        self.flush_seconds_max = 0.0
+
+        self._flusher = threading.Thread(target=self._flush_loop, name=f"{self.name}-flusher", daemon=True)
+        self._flusher.start()
+
+    def write(self, row: Dict) -> None:
+        """Thêm 1 dòng vào buffer (không chạm disk; đủ batch → đánh thức flusher)."""
+        with self._lock:
+            if self._closed:
+                raise ValueError(f"Writer đã đóng: {self.name}")
+            if len(self._pending) >= self.max_pending:
+                # Backpressure: đĩa không theo kịp → chờ flusher lấy bớt (có giới hạn)
+                self._wakeup.set()
+                deadline = time.monotonic() + self.flush_interval
+                while len(self._pending) >= self.max_pending and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._space.wait(remaining)
+                if self._closed:
+                    raise ValueError(f"Writer đã đóng: {self.name}")
+            self._pending.append(row)
+            if len(self._pending) >= self.batch_size:
+                self._wakeup.set()
+
+    def flush(self) -> None:
+        """Ghi toàn bộ dòng đang chờ xuống file (trên thread gọi)."""
+        with self._io_lock:
+            self._flush_io()
+
+    def close(self) -> None:
+        """Flush + fsync lần cuối và đóng file."""
+        with self._io_lock:
+            with self._lock:
+                if self._closed:
+                    return
+                # Đóng trước: write() sau đây báo lỗi, dòng đang chờ vẫn được ghi bên dưới
+                self._closed = True
+                self._space.notify_all()
+            try:
+                self._flush_io(final=True)
+                if self.fsync_policy != "never":
+                    self._fsync_io()
+            finally:
+                self.sink.close()
+        self._wakeup.set()
+        self._flusher.join(timeout=self.flush_interval + 1.0)
+
+    def stats(self) -> Dict:
+        """Counters: rows/sec, flush latency, pending..."""
+        with self._lock:
+            elapsed = max(time.monotonic() - self._started_at, 1e-9)
+            return {
+                "rows_written": self.rows_written,
+                "rows_pending": len(self._pending),
+                "rows_per_sec": self.rows_written / elapsed,
+                "flush_count": self.flush_count,
+                "fsync_count": self.fsync_count,
+                "flush_latency_avg_ms": (
+                    self.flush_seconds_total / self.flush_count * 1000 if self.flush_count else 0.0
+                ),
+                "flush_latency_max_ms": self.flush_seconds_max * 1000,
+            }
+
+    def __enter__(self) -> "GroupCommitWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def _flush_io(self, final: bool = False) -> None:
+        """Lấy các dòng đang chờ rồi ghi sink ngoài _lock (caller giữ _io_lock)."""
+        with self._lock:
+            if not self._pending or (self._closed and not final):
+                return
+            rows, self._pending = self._pending, []
+            self._space.notify_all()
+        t0 = time.perf_counter()
+        try:
+            self.sink.write_rows(rows)
+        except Exception:
+            # Ghi lỗi → trả lại đầu buffer (giữ thứ tự), lần flush sau thử lại
+            with self._lock:
+                self._pending[:0] = rows
+            raise
+        self._dirty = True
+
+        if self.fsync_policy == "always":
+            self._fsync_io()
+        else:
+            self._maybe_fsync_io()
+
+        dt = time.perf_counter() - t0
+        with self._lock:
+            self.rows_written += len(rows)
+            self.flush_count += 1
+            self.flush_seconds_total += dt
+            self.flush_seconds_max = max(self.flush_seconds_max, dt)
+
+    def _fsync_io(self) -> None:
+        self.sink.sync()
+        self._last_fsync = time.monotonic()
+        self._dirty = False
+        self.fsync_count += 1
+
+    def _maybe_fsync_io(self) -> None:
+        if (
+            self.fsync_policy == "interval"
+            and self._dirty
+            and time.monotonic() - self._last_fsync >= self.fsync_interval
+        ):
+            self._fsync_io()
+
+    def _flush_loop(self) -> None:
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                with self._io_lock:
+                    if self._closed:
+                        return
+                    self._flush_io()
+                    self._maybe_fsync_io()
+            except Exception as e:
+                logger.error(f"Error flushing {self.name}: {e}", exc_info=True)
+
+
+class SensorCsvWriter(GroupCommitWriter):
+    """GroupCommitWriter ghi vào sensor_live.csv (CsvSink)."""
+
+    def __init__(self, path: Path, fieldnames: Optional[List[str]] = None, **kwargs):
+        self.path = Path(path)
+        super().__init__(CsvSink(self.path, fieldnames), **kwargs)
+
+
+__all__ = [
+    "SENSOR_LIVE_FIELDNAMES",
+    "DEFAULT_DEVICE_ID",
+    "FSYNC_POLICIES",
+    "CsvSink",
+    "GroupCommitWriter",
+    "SensorCsvWriter",
+    "payload_to_row",
+]
@@ -0,0 +1,257 @@
+"""
+Streaming Feature Engine - Cập nhật 13 features nowcast theo từng reading (O(1)).
+
+Thay vì sort + tính lại toàn bộ cửa sổ (compute_feature_from_window) mỗi
+lần cần dự báo, mỗi device giữ trạng thái nhỏ:
+- pressure_slope_1h : deque các giá trị áp suất trong 1h gần nhất (mốc t-1h)
+- temp_drop_15m / rh_rise_15m : deque nhiệt độ / độ ẩm trong 15 phút gần nhất
+- soil_moist_smooth : tổng trượt (running sum) của window_soil mẫu gần nhất
+- dew point sensor tính 1 lần / reading; dew point API tính 1 lần / lần đổi API row
+
+FeatureVector của mỗi device luôn sẵn sàng, cho kết quả giống
+compute_feature_from_window trên cửa sổ chứa các reading đã nhận
+(xem check_streaming_features.py).
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, Mapping, Optional
+
+from feature_engineering import (
+    FeatureVector,
+    compute_dew_point,
+    cyclical_encode_hour,
+    cyclical_encode_month,
+    window_sizes,
+)
+
+
+class _DeviceFeatureState:
+    """Trạng thái streaming của 1 device."""
+
+    __slots__ = (
+        "pressure", "temp", "rh", "soil", "soil_sum",
+        "last_ts", "last_temp", "last_rh", "last_pressure", "last_soil",
+        "dew_sensor", "count", "vector",
+    )
+
+    def __init__(self, window_1h: int, window_15m: int, window_soil: int):
+        self.pressure = deque(maxlen=window_1h)
+        self.temp = deque(maxlen=window_15m)
+        self.rh = deque(maxlen=window_15m)
+        self.soil = deque(maxlen=window_soil)
+        self.soil_sum = 0.0
+        self.last_ts: Optional[int] = None
+        self.last_temp = 0.0
+        self.last_rh = 0.0
+        self.last_pressure = 0.0
+        self.last_soil = 0.0
+        self.dew_sensor = 0.0
+        self.count = 0
+        self.vector: Optional[FeatureVector] = None
+
+
+class _ApiFeatures:
+    """Các giá trị suy ra từ 1 API row (dew point API tính 1 lần)."""
+
+    __slots__ = ("pop", "rain_1h", "uvi", "temp", "rh", "dew")
+
+    def __init__(self, api_row: Mapping):
+        self.pop = float(api_row.get("api_pop", 0.0))
+        self.rain_1h = float(api_row.get("api_rain_1h", 0.0))
+        self.uvi = float(api_row.get("api_uvi", 0.0))
+        self.temp = api_row.get("api_temp_c")
+        self.rh = api_row.get("api_rh_pct")
+        self.dew = (
+            compute_dew_point(float(self.temp), float(self.rh))
+            if self.temp is not None and self.rh is not None
+            else None
+        )
+
+
+class StreamingFeatureEngine:
+    """
+    Engine tính feature online cho nhiều device (thread-safe).
+
+    Dùng:
+        engine.set_api_row(api_row)                    # khi có API data mới
+        fv = engine.update("esp32-01", ts, t, rh, p, soil)
+        fv = engine.feature_vector("esp32-01")         # vector mới nhất
+        fv = engine.feature_vector("esp32-01", api_row=row)  # với API row riêng (không cache)
+    """
+
+    def __init__(self, interval_seconds: int = 300, api_row: Optional[Mapping] = None):
+        self.interval_seconds = interval_seconds
+        self.window_1h, self.window_15m, self.window_soil = window_sizes(interval_seconds)
+        self._lock = threading.Lock()
+        self._states: Dict[str, _DeviceFeatureState] = {}
+        self.out_of_order = 0
+        self.set_api_row(api_row if api_row is not None else {})
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def set_api_row(self, api_row: Mapping) -> None:
+        """Cập nhật API data dùng chung; vector các device được tính lại khi đọc."""
+        api = _ApiFeatures(api_row)
+        with self._lock:
+            self._api_row = api_row
+            self._api = api
+            for state in self._states.values():
+                state.vector = None
+
+    def update(
+        self,
+        device_id: str,
+        ts: int,
+        temp_c: float,
+        rh_pct: float,
+        pressure_hpa: float,
+        soil_moist_pct: float,
+    ) -> Optional[FeatureVector]:
+        """
+        Thêm 1 reading (ts epoch giây UTC) và trả về FeatureVector mới của device.
+
+        Reading cũ hơn hoặc trùng reading cuối bị bỏ qua (trả về None).
+        """
+        with self._lock:
+            state = self._states.get(device_id)
+            if state is None:
+                state = _DeviceFeatureState(self.window_1h, self.window_15m, self.window_soil)
+                self._states[device_id] = state
+            elif ts <= state.last_ts:
+                self.out_of_order += 1
+                return None
+
+            temp_c = float(temp_c)
+            rh_pct = float(rh_pct)
+            pressure_hpa = float(pressure_hpa)
+            soil_moist_pct = float(soil_moist_pct)
+
+            state.pressure.append(pressure_hpa)
+            state.temp.append(temp_c)
+            state.rh.append(rh_pct)
+            if len(state.soil) == state.soil.maxlen:
+                state.soil_sum -= state.soil[0]
+            state.soil.append(soil_moist_pct)
+            state.soil_sum += soil_moist_pct
+
+            state.last_ts = int(ts)
+            state.last_temp = temp_c
+            state.last_rh = rh_pct
+            state.last_pressure = pressure_hpa
+            state.last_soil = soil_moist_pct
+            state.dew_sensor = compute_dew_point(temp_c, rh_pct)
+            state.count += 1
+
+            state.vector = self._build_vector(state)
+            return state.vector
+
+    def feature_vector(self, device_id: str, api_row: Optional[Mapping] = None) -> Optional[FeatureVector]:
+        """
+        FeatureVector mới nhất của device (None nếu chưa có reading nào).
+
+        api_row: tính với API row này thay cho row dùng chung (không cache, không
+        đổi row của engine → các device khác không phải tính lại).
+        """
+        api = _ApiFeatures(api_row) if api_row is not None else None
+        with self._lock:
+            state = self._states.get(device_id)
+            if state is None:
+                return None
+            if api is not None:
+                return self._build_vector(state, api)
+            if state.vector is None:
+                state.vector = self._build_vector(state)
+            return state.vector
+
+    def sample_count(self, device_id: str) -> int:
+        state = self._states.get(device_id)
+        return state.count if state is not None else 0
+
+    def last_ts(self, device_id: str) -> Optional[int]:
+        state = self._states.get(device_id)
+        return state.last_ts if state is not None else None
+
+    def remove(self, device_id: str) -> None:
+        with self._lock:
+            self._states.pop(device_id, None)
+
+    def rebuild(self, device_id: str, window) -> Optional[FeatureVector]:
+        """
+        Dựng lại state của device từ cửa sổ đã sắp xếp theo ts (SensorWindow).
+
+        Dùng khi reading đến lệch thứ tự: update() không chèn được vào giữa cửa sổ
+        trượt → replay buffer (đủ dài cho mọi cửa sổ feature) để reading đó được tính.
+        Caller phải tuần tự hoá các lần update / rebuild của cùng device.
+        """
+        self.remove(device_id)
+        vector = None
+        rows = zip(window.ts.tolist(), window.temp_c.tolist(), window.rh_pct.tolist(),
+                   window.pressure_hpa.tolist(), window.soil_moist_pct.tolist())
+        for ts, temp_c, rh_pct, pressure_hpa, soil_moist_pct in rows:
+            vector = self.update(device_id, int(ts), temp_c, rh_pct, pressure_hpa, soil_moist_pct) or vector
+        return vector
+
+    def _build_vector(self, state: _DeviceFeatureState, api: Optional[_ApiFeatures] = None) -> FeatureVector:
+        api = api or self._api
+        last_dt = datetime.fromtimestamp(state.last_ts, tz=timezone.utc)
+        month_enc = cyclical_encode_month(last_dt.month)
+        hour_enc = cyclical_encode_hour(last_dt.hour)
+
+        if state.count < 2:
+            # Giống compute_feature_from_window: thiếu dữ liệu → vector zero
+            return FeatureVector(
+                api_pop=0.0,
+                api_rain_1h=0.0,
+                pressure_slope_1h=0.0,
+                temp_drop_15m=0.0,
+                rh_rise_15m=0.0,
+                dew_point_diff=0.0,
+                temp_bias=0.0,
+                soil_moist_smooth=state.last_soil,
+                month_sin=month_enc["month_sin"],
+                month_cos=month_enc["month_cos"],
+                hour_sin=hour_enc["hour_sin"],
+                hour_cos=hour_enc["hour_cos"],
+                uvi_index=0.0,
+            )
+
+        # deque[0] = mốc t-1h / t-15m (hoặc reading đầu tiên nếu chưa đủ dữ liệu)
+        if len(state.soil) == state.soil.maxlen:
+            soil_moist_smooth = state.soil_sum / len(state.soil)
+        else:
+            soil_moist_smooth = state.last_soil
+
+        if api.dew is not None:
+            dew_api = api.dew
+        else:
+            dew_api = compute_dew_point(
+                float(api.temp if api.temp is not None else state.last_temp),
+                float(api.rh if api.rh is not None else state.last_rh),
+            )
+        api_temp = float(api.temp) if api.temp is not None else state.last_temp
+
+        return FeatureVector(
+            api_pop=api.pop,
+            api_rain_1h=api.rain_1h,
+            pressure_slope_1h=state.last_pressure - state.pressure[0],
+            temp_drop_15m=state.temp[0] - state.last_temp,
+            rh_rise_15m=state.last_rh - state.rh[0],
+            dew_point_diff=float(state.dew_sensor - dew_api),
+            temp_bias=float(api_temp - state.last_temp),
+            soil_moist_smooth=float(soil_moist_smooth),
+            month_sin=month_enc["month_sin"],
+            month_cos=month_enc["month_cos"],
+            hour_sin=hour_enc["hour_sin"],
+            hour_cos=hour_enc["hour_cos"],
+            uvi_index=api.uvi,
+        )
+
+
+__all__ = [
+    "StreamingFeatureEngine",
+]
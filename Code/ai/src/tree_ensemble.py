@@ -0,0 +1,292 @@
+"""
+Tree Ensemble - Evaluator NumPy thuần cho booster XGBoost (nowcast + amount).
+
+Serving không cần xgboost (và overhead mỗi lần gọi của nó) khi có file .npz:
+- export_booster(): booster.save_raw("json") → gộp tất cả cây (trong iteration
+  range mà wrapper đang dùng khi predict, vd. best_iteration của nowcast) vào
+  các mảng node phẳng: feature, threshold (float32), left, right,
+  default_left, value. Node lá trỏ về chính nó → duyệt đủ max_depth bước
+  không cần kiểm tra lá.
+- TreeEnsemble.predict_margin(): duyệt MỌI cây cho cả batch cùng lúc theo
+  từng tầng (level-synchronous): mỗi tầng 1 lần gather NumPy trên mảng
+  (n_rows, n_trees) chỉ số node.
+- So sánh giống xgboost: float32, đi trái nếu x < threshold, NaN → default_left.
+- base_score (output space) → margin theo objective: logistic → logit,
+  squarederror → giữ nguyên, tweedie/gamma/poisson → log.
+
+File .npz là artifact sinh ra (không commit): chạy lại sau mỗi lần train model.
+model_registry (backend numpy) chỉ dùng .npz mới hơn .pkl tương ứng.
+
+Chạy:
+    python src/tree_ensemble.py [--model-dir models]   # export .npz + kiểm tra khớp xgboost
+"""
+
+from __future__ import annotations
+
+import json
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Tuple
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+MODEL_DIR = ROOT / "models"
+
+NOWCAST_NPZ = "xgb_nowcast.npz"
+AMOUNT_NPZ = "xgb_amount.npz"
+
+LOGISTIC_OBJECTIVES = {"binary:logistic", "reg:logistic"}
+LOG_LINK_OBJECTIVES = {"reg:tweedie", "reg:gamma", "count:poisson"}
+IDENTITY_OBJECTIVES = {"reg:squarederror", "reg:squaredlogerror", "reg:pseudohubererror",
+                       "reg:absoluteerror", "reg:quantileerror", "binary:logitraw"}
+
+
+def _parse_base_score(value) -> float:
+    """'[6.1545026E-1]' (xgboost >= 2) hoặc '0.5' → float."""
+    return float(str(value).strip("[]").split(",")[0])
+
+
+def _base_margin(base_score: float, objective: str) -> float:
+    if objective in LOGISTIC_OBJECTIVES:
+        return float(np.log(base_score / (1.0 - base_score)))
+    if objective in LOG_LINK_OBJECTIVES:
+        return float(np.log(base_score))
+    if objective in IDENTITY_OBJECTIVES:
+        return base_score
+    raise ValueError(f"Unsupported objective for NumPy evaluator: {objective}")
+
+
+def _tree_depth(left: np.ndarray, right: np.ndarray) -> int:
+    depth = np.zeros(len(left), dtype=np.int32)
+    for node in range(len(left)):  # cha luôn có id nhỏ hơn con
+        if left[node] != -1:
+            depth[left[node]] = depth[right[node]] = depth[node] + 1
+    return int(depth.max())
+
+
+@dataclass(frozen=True)
+class TreeEnsemble:
+    """Các cây đã gộp thành mảng node phẳng (bất biến)."""
+
+    feature: np.ndarray        # int32, lá: 0
+    threshold: np.ndarray      # float32
+    left: np.ndarray           # int32, chỉ số tuyệt đối; lá: chính nó
+    right: np.ndarray          # int32
+    default_left: np.ndarray   # bool
+    value: np.ndarray          # float32, giá trị lá (node trong: 0)
+    roots: np.ndarray          # int32, node gốc của từng cây
+    max_depth: int
+    base_margin: float
+    objective: str
+    num_feature: int
+
+    @property
+    def num_trees(self) -> int:
+        return len(self.roots)
+
+    # ----- Inference -----
+    def predict_margin(self, X) -> np.ndarray:
+        """Tổng giá trị lá + base_margin cho từng dòng (giống output_margin=True)."""
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        n = len(X)
+        if not n:
+            return np.empty(0, dtype=np.float32)
+        flat = np.ascontiguousarray(X).reshape(-1)
+        offsets = (np.arange(n, dtype=np.int64) * X.shape[1])[:, None]
+        has_nan = bool(np.isnan(flat).any())
+        idx = np.broadcast_to(self.roots, (n, self.num_trees))
+        for _ in range(self.max_depth):
+            x = flat.take(offsets + self.feature.take(idx))
+            go_left = x < self.threshold.take(idx)
+            if has_nan:
+                go_left = np.where(np.isnan(x), self.default_left.take(idx), go_left)
+            idx = np.where(go_left, self.left.take(idx), self.right.take(idx))
+        # Cộng dồn theo float32 như xgboost
+        return self.value.take(idx).sum(axis=1, dtype=np.float32) + np.float32(self.base_margin)
+
+    def predict(self, X) -> np.ndarray:
+        """Output đã qua link function của objective (xác suất / lượng mưa)."""
+        return self.transform(self.predict_margin(X))
+
+    def transform(self, margin: np.ndarray) -> np.ndarray:
+        """Margin → output space (sigmoid / exp / giữ nguyên theo objective)."""
+        if self.objective in LOGISTIC_OBJECTIVES:
+            return 1.0 / (1.0 + np.exp(-margin))
+        if self.objective in LOG_LINK_OBJECTIVES:
+            return np.exp(margin)
+        return margin
+
+    def predict_proba(self, X) -> np.ndarray:
+        """[1 - p, p] như XGBBoosterWithThreshold.predict_proba (objective logistic)."""
+        p = self.predict(X)
+        return np.c_[1 - p, p]
+
+    # ----- Artifact -----
+    def save(self, path: Path) -> Path:
+        path = Path(path)
+        np.savez_compressed(
+            path,
+            feature=self.feature, threshold=self.threshold, left=self.left, right=self.right,
+            default_left=self.default_left, value=self.value, roots=self.roots,
+            meta=np.array(json.dumps({
+                "max_depth": self.max_depth, "base_margin": self.base_margin,
+                "objective": self.objective, "num_feature": self.num_feature,
+            })),
+        )
+        return path
+
+    @classmethod
+    def load(cls, path: Path) -> "TreeEnsemble":
+        with np.load(Path(path), allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            return cls(
+                feature=data["feature"], threshold=data["threshold"], left=data["left"],
+                right=data["right"], default_left=data["default_left"], value=data["value"],
+                roots=data["roots"], **meta,
+            )
+
+
+def export_booster(booster, iteration_range: Tuple[int, int] = (0, 0)) -> TreeEnsemble:
+    """
+    xgb.Booster → TreeEnsemble.
+
+    iteration_range giống Booster.predict: (0, 0) = tất cả cây,
+    (0, best_iteration + 1) = chỉ các cây tới best_iteration.
+    """
+    model = json.loads(booster.save_raw("json"))
+    learner = model["learner"]
+    objective = learner["objective"]["name"]
+    params = learner["learner_model_param"]
+    if int(params.get("num_class", 0)) > 1 or int(params.get("num_target", 1)) > 1:
+        raise ValueError("Multi-class / multi-target models are not supported")
+    gbm = learner["gradient_booster"]
+    if gbm["name"] != "gbtree":
+        raise ValueError(f"Unsupported booster: {gbm['name']}")
+
+    trees = gbm["model"]["trees"]
+    indptr = gbm["model"].get("iteration_indptr") or list(range(len(trees) + 1))
+    begin, end = iteration_range
+    end = end if end > 0 else len(indptr) - 1
+    trees = trees[indptr[begin]:indptr[end]]
+
+    parts: Dict[str, list] = {k: [] for k in ("feature", "threshold", "left", "right", "default_left", "value")}
+    roots, offset, max_depth = [], 0, 0
+    for tree in trees:
+        if any(int(t) != 0 for t in tree["split_type"]):
+            raise ValueError("Categorical splits are not supported")
+        left = np.asarray(tree["left_children"], dtype=np.int32)
+        right = np.asarray(tree["right_children"], dtype=np.int32)
+        cond = np.asarray(tree["split_conditions"], dtype=np.float32)
+        is_leaf = left == -1
+        nodes = np.arange(len(left), dtype=np.int32) + offset
+
+        parts["feature"].append(np.where(is_leaf, 0, tree["split_indices"]).astype(np.int32))
+        parts["threshold"].append(np.where(is_leaf, 0, cond).astype(np.float32))
+        parts["left"].append(np.where(is_leaf, nodes, left + offset).astype(np.int32))
+        parts["right"].append(np.where(is_leaf, nodes, right + offset).astype(np.int32))
+        parts["default_left"].append(np.asarray(tree["default_left"], dtype=bool))
+        # split_conditions của node lá chứa giá trị lá (đã nhân learning rate)
+        parts["value"].append(np.where(is_leaf, cond, 0).astype(np.float32))
+        roots.append(offset)
+        max_depth = max(max_depth, _tree_depth(left, right))
+        offset += len(left)
+
+    return TreeEnsemble(
+        **{k: np.concatenate(v) for k, v in parts.items()},
+        roots=np.asarray(roots, dtype=np.int32),
+        max_depth=max_depth,
+        base_margin=_base_margin(_parse_base_score(params["base_score"]), objective),
+        objective=objective,
+        num_feature=int(params.get("num_feature", 0)),
+    )
+
+
+def load_xgb_models(model_dir: Path = MODEL_DIR) -> Dict:
+    """Wrapper xgboost (unpickle .pkl) của model_dir: {"nowcast": ..., "amount": ... | None}."""
+    from model_registry import AMOUNT_FILE, NOWCAST_FILE, _load_amount, _load_nowcast
+
+    model_dir = Path(model_dir)
+    amount_path = model_dir / AMOUNT_FILE
+    return {
+        "nowcast": _load_nowcast(model_dir / NOWCAST_FILE),
+        "amount": _load_amount(amount_path) if amount_path.exists() else None,
+    }
+
+
+def export_models(model_dir: Path = MODEL_DIR, models: Dict = None) -> Dict[str, Path]:
+    """
+    Export nowcast + amount (.pkl của model_dir) ra .npz trong model_dir.
+
+    Luôn đọc từ .pkl (không qua registry: bundle backend numpy có thể đã load
+    từ chính .npz). Dùng đúng iteration range mà wrapper dùng khi predict:
+    nowcast theo best_iteration; amount theo use_best_iteration của XGBAmountRegressor.
+    """
+    from wrappers import _iteration_range
+
+    models = models or load_xgb_models(model_dir)
+    out = {}
+    booster = models["nowcast"].get_booster()
+    out["nowcast"] = export_booster(booster, _iteration_range(booster)).save(Path(model_dir) / NOWCAST_NPZ)
+    if models["amount"] is not None:
+        booster = models["amount"].get_booster()
+        use_best = getattr(models["amount"], "use_best_iteration", False)
+        out["amount"] = export_booster(booster, _iteration_range(booster, use_best)).save(
+            Path(model_dir) / AMOUNT_NPZ
+        )
+    return out
+
+
+def main():
+    import argparse
+
+    from feature_engineering import FEATURE_NAMES
+
+    parser = argparse.ArgumentParser(description="Export XGBoost models → NumPy tree ensemble (.npz)")
+    parser.add_argument("--model-dir", type=str, default=str(MODEL_DIR))
+    parser.add_argument("--rows", type=int, default=10_000, help="Số dòng kiểm tra khớp xgboost")
+    args = parser.parse_args()
+
+    models = load_xgb_models(Path(args.model_dir))
+    paths = export_models(Path(args.model_dir), models)
+
+    rng = np.random.default_rng(0)
+    X = rng.normal(0, 2, size=(args.rows, len(FEATURE_NAMES))).astype(np.float32)
+    X[rng.random(X.shape) < 0.02] = np.nan  # missing → default_left
+
+    print("=" * 70)
+    print(f"🌲 TREE ENSEMBLE EXPORT ({args.model_dir})")
+    print("=" * 70)
+    for name, path in paths.items():
+        ensemble = TreeEnsemble.load(path)
+        model = models[name]
+        ref = model.predict_proba(X)[:, 1] if name == "nowcast" else model.predict(X)
+        t0 = time.perf_counter()
+        got = ensemble.predict(X)
+        batch_ms = (time.perf_counter() - t0) * 1000
+        t0 = time.perf_counter()
+        for i in range(200):
+            ensemble.predict(X[i:i + 1])
+        single_us = (time.perf_counter() - t0) / 200 * 1e6
+        diff = float(np.max(np.abs(ref - got)))
+        print(f"   {name:<8} → {path.name} ({path.stat().st_size / 1024:.0f} KB, "
+              f"{ensemble.num_trees} trees, depth {ensemble.max_depth}, {ensemble.objective})")
+        print(f"            max |xgboost - numpy| = {diff:.2e} | "
+              f"1 row {single_us:.0f} µs | {args.rows} rows {batch_ms:.0f} ms")
+
+
+__all__ = [
+    "NOWCAST_NPZ",
+    "AMOUNT_NPZ",
+    "TreeEnsemble",
+    "export_booster",
+    "load_xgb_models",
+    "export_models",
+]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Warm Start - Nạp lại cửa sổ SensorBuffer từ cuối dữ liệu đã lưu khi service khởi động.
+
+Không có warm start, sau restart buffer rỗng → cần 12 reading mới (60 phút)
+trước khi dự báo được. Ở đây chỉ đọc phần CUỐI dữ liệu:
+- sensor store (Parquet): latest_ts() rồi read(start=...) → chỉ mở partition
+  ngày gần nhất + hot segment có khoảng thời gian phù hợp (time index trên tên file)
+- sensor_live.csv: seek ngược từ cuối file theo block (64KB, gấp đôi dần) tới
+  khi dòng đầu block cũ hơn mốc cần đọc → không đọc cả file
+
+Chỉ device có reading mới nhất trong `max_age` giây (so với hiện tại) được nạp;
+dữ liệu cũ hơn sẽ tạo cửa sổ có khoảng trống → feature sai.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+WARM_START_MAX_AGE = float(os.getenv("WARM_START_MAX_AGE", 30 * 60))  # giây
+READING_INTERVAL = timedelta(minutes=5)
+CSV_BLOCK_SIZE = 64 * 1024
+CSV_MAX_TAIL_BYTES = 256 * 1024 * 1024
+
+
+def _utcnow() -> pd.Timestamp:
+    return pd.Timestamp(datetime.now(timezone.utc)).tz_localize(None)
+
+
+def _to_naive_utc(series: pd.Series) -> pd.Series:
+    return pd.to_datetime(series, utc=True, errors="coerce").dt.tz_localize(None)
+
+
+def read_csv_tail(path: Path, since: pd.Timestamp, block_size: int = CSV_BLOCK_SIZE,
+                  max_bytes: int = CSV_MAX_TAIL_BYTES) -> tuple[pd.DataFrame, int]:
+    """
+    Các dòng có ts >= since ở cuối CSV (file ghi append, ts tăng dần).
+
+    Returns: (DataFrame, số byte đã đọc)
+    """
+    path = Path(path)
+    with open(path, "rb") as f:
+        header = f.readline()
+        header_end = f.tell()
+        fields = next(csv.reader([header.decode("utf-8")]))
+        if "ts" not in fields:
+            raise ValueError(f"{path.name}: missing 'ts' column")
+        ts_col = fields.index("ts")
+
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        data = b""
+        size = block_size
+        while pos > header_end and len(data) < max_bytes:
+            step = min(size, pos - header_end)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+            size *= 2
+
+            if pos == header_end:
+                break
+            # Dòng đầu của block có thể bị cắt → xét dòng đầy đủ đầu tiên
+            start = data.find(b"\n") + 1
+            end = data.find(b"\n", start)
+            if start == 0 or end == -1:
+                continue
+            try:
+                row = next(csv.reader([data[start:end].decode("utf-8")]))
+                first_ts = pd.to_datetime(row[ts_col], utc=True).tz_localize(None)
+            except (StopIteration, IndexError, ValueError):
+                continue
+            if first_ts < since:
+                break
+
+    body = data[data.find(b"\n") + 1:] if pos > header_end else data
+    df = pd.read_csv(io.BytesIO(header + body))
+    if df.empty:
+        return df, len(data)
+    df["ts"] = _to_naive_utc(df["ts"])
+    return df[df["ts"] >= since].reset_index(drop=True), len(data)
+
+
+def read_store_tail(store, since: pd.Timestamp) -> pd.DataFrame:
+    """Các dòng có ts >= since trong sensor store (partition pruning theo ngày)."""
+    return store.read(start=since)
+
+
+def warm_start(
+    buffers,
+    features=None,
+    store=None,
+    csv_path: Optional[Path] = None,
+    max_age: float = WARM_START_MAX_AGE,
+    owns: Optional[Callable[[str], bool]] = None,
+    now: Optional[pd.Timestamp] = None,
+) -> Dict:
+    """
+    Nạp cửa sổ gần nhất của từng device vào DeviceBufferPool (+ StreamingFeatureEngine).
+
+    Args:
+        buffers: DeviceBufferPool
+        features: StreamingFeatureEngine (tuỳ chọn)
+        store: SensorStore (ưu tiên) hoặc None
+        csv_path: sensor_live.csv (dùng khi không có store)
+        max_age: bỏ device có reading mới nhất cũ hơn max_age giây
+        owns: lọc device (worker_pool: chỉ device thuộc worker)
+
+    Returns:
+        dict báo cáo: source, rows, bytes, devices, ready, elapsed_ms
+    """
+    t0 = time.perf_counter()
+    now = now if now is not None else _utcnow()
+    horizon = READING_INTERVAL * buffers.max_size
+    since = now - pd.Timedelta(seconds=max_age) - horizon
+    report = {"source": None, "rows": 0, "bytes": 0, "devices": 0, "ready": 0, "elapsed_ms": 0.0}
+
+    df = None
+    if store is not None and not store.is_empty():
+        df = read_store_tail(store, since)
+        report["source"] = store.name
+    elif csv_path is not None and Path(csv_path).exists():
+        df, report["bytes"] = read_csv_tail(csv_path, since)
+        report["source"] = Path(csv_path).name
+
+    if df is not None and len(df):
+        if "device_id" not in df.columns:
+            df["device_id"] = "esp32-01"
+        df = df.dropna(subset=["ts"]).sort_values("ts", kind="stable")
+        report["rows"] = len(df)
+
+        for device_id, group in df.groupby("device_id", sort=False):
+            device_id = str(device_id)
+            if owns is not None and not owns(device_id):
+                continue
+            last_ts = group["ts"].iloc[-1]
+            if (now - last_ts).total_seconds() > max_age:
+                continue
+            # Chỉ giữ cửa sổ 120 phút liền trước reading cuối
+            group = group[group["ts"] > last_ts - horizon].tail(buffers.max_size)
+            epochs = ((group["ts"] - pd.Timestamp(0)) // pd.Timedelta(seconds=1)).to_numpy()
+            values = group[["temp_c", "rh_pct", "pressure_hpa", "soil_moist_pct"]].to_numpy(dtype=float)
+            buf = buffers.warm(device_id, epochs, values, idle_seconds=(now - last_ts).total_seconds())
+            if features is not None:
+                for ts, row in zip(epochs, values):
+                    features.update(device_id, int(ts), *row)
+            report["devices"] += 1
+            report["ready"] += int(buf.is_ready())
+
+    report["elapsed_ms"] = (time.perf_counter() - t0) * 1000
+    return report
+
+
+__all__ = [
+    "WARM_START_MAX_AGE",
+    "read_csv_tail",
+    "read_store_tail",
+    "warm_start",
+]
@@ -0,0 +1,211 @@
+"""
+Window Provider - Nguồn cửa sổ sensor (12 bản ghi / 60 phút) cho dự báo trước khi tưới.
+
+run_forecast_for_slot() không tự đọc file nữa mà hỏi 1 WindowProvider:
+- LiveWindowProvider: đọc thẳng từ DeviceBufferPool của AIService (RAM, zero-copy),
+  dùng cho production → không đọc đĩa, luôn có reading mới nhất
+- HistoricalWindowProvider: sensor store (Parquet) hoặc sensor_raw_60d*.csv
+  (index trong RAM, xem sensor_history.py), dùng cho chạy tay / backfill / demo
+
+Live không đủ dữ liệu (device chưa ready, buffer cũ so với slot, slot ở quá khứ)
+→ chuyển sang provider `fallback` (thường là Historical).
+Mọi provider trả về SensorWindow (mảng cột, ts epoch giây UTC) + tên nguồn.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import logging
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, ContextManager, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from feature_engineering import SensorWindow
+from sensor_history import frame_from_window, get_history
+from sensor_store import open_default_store
+
+logger = logging.getLogger(__name__)
+
+ROOT = Path(__file__).resolve().parents[1]
+DATA_DIR = ROOT / "data"
+
+# Sensor files (historical)
+SENSOR_REAL = DATA_DIR / "sensor_raw_60d.csv"
+SENSOR_SYNTH = DATA_DIR / "sensor_raw_60d_synth.csv"
+
+# 60 phút @ 5 phút/bản ghi
+WINDOW_RECORDS = 12
+# Live: reading mới nhất phải trong khoảng [target - staleness, target + lead]
+LIVE_MAX_STALENESS = 15 * 60  # giây
+LIVE_MAX_LEAD = 10 * 60  # check chạy tới 5 phút sau trigger → reading sau trigger vẫn hợp lệ
+
+
+def _to_epoch(ts) -> int:
+    """datetime / Timestamp (naive = UTC) → epoch giây."""
+    ts = pd.Timestamp(ts)
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert("UTC").tz_localize(None)
+    return int((ts - pd.Timestamp(0)) // pd.Timedelta(seconds=1))
+
+
+def window_from_frame(df: pd.DataFrame) -> SensorWindow:
+    """DataFrame (cột ts, temp_c, rh_pct, pressure_hpa, soil_moist_pct) → SensorWindow."""
+    ts = pd.to_datetime(df["ts"], utc=True).dt.tz_localize(None)
+    return SensorWindow(
+        ((ts - pd.Timestamp(0)) // pd.Timedelta(seconds=1)).to_numpy(dtype=np.int64),
+        df["temp_c"].to_numpy(dtype=float),
+        df["rh_pct"].to_numpy(dtype=float),
+        df["pressure_hpa"].to_numpy(dtype=float),
+        df["soil_moist_pct"].to_numpy(dtype=float),
+    )
+
+
+class WindowProvider:
+    """Interface: cửa sổ n bản ghi gần nhất có ts <= target_ts của 1 device."""
+
+    name = "base"
+
+    def window(self, target_ts: datetime, device_id: Optional[str] = None,
+               n: int = WINDOW_RECORDS) -> Tuple[SensorWindow, str]:
+        """Returns: (SensorWindow, tên nguồn). Raise ValueError nếu < 2 bản ghi."""
+        raise NotImplementedError
+
+
+class HistoricalWindowProvider(WindowProvider):
+    """Sensor store (nếu có) hoặc sensor_raw_60d*.csv (SensorHistory dùng chung)."""
+
+    name = "historical"
+
+    def __init__(self, csv_path: Optional[Path] = None):
+        self.csv_path = Path(csv_path) if csv_path is not None else None
+
+    def _choose_sensor_path(self) -> Path:
+        """Chọn file sensor (ưu tiên real, fallback synth)."""
+        if self.csv_path is not None:
+            return self.csv_path
+        if SENSOR_REAL.exists():
+            return SENSOR_REAL
+        if SENSOR_SYNTH.exists():
+            return SENSOR_SYNTH
+        raise FileNotFoundError("No sensor file found (sensor_raw_60d*.csv)")
+
+    def window(self, target_ts: datetime, device_id: Optional[str] = None,
+               n: int = WINDOW_RECORDS) -> Tuple[SensorWindow, str]:
+        """
+        n bản ghi gần nhất tại target_ts (hoặc trước đó).
+
+        - Có sensor store → chỉ đọc partition quanh target_ts
+        - Không có store → index trong RAM của CSV (sensor_history, load 1 lần)
+        - Không có dữ liệu trước target_ts → dùng n bản ghi gần nhất
+        - Device chưa có dữ liệu → dùng dữ liệu mọi device (như CSV cũ)
+        """
+        store = open_default_store() if self.csv_path is None else None
+        if store is not None:
+            source = store.name
+            if device_id is not None and store.latest_ts(device_id) is None:
+                device_id = None
+            df = store.read_asof(end=target_ts, n=n, device_id=device_id)
+            if len(df) == 0:
+                print(f"   ⚠️  Không có sensor data trước {target_ts}. Dùng dữ liệu gần nhất.")
+                df = store.tail(n, device_id=device_id)
+            window = window_from_frame(df)
+        else:
+            path = self._choose_sensor_path()
+            source = path.name
+            history = get_history(path).get(device_id)
+            window = history.asof(target_ts, n)
+            if len(window) == 0:
+                print(f"   ⚠️  Không có sensor data trước {target_ts}. Dùng dữ liệu gần nhất.")
+                window = history.tail(n)
+
+        if len(window) < 2:
+            raise ValueError(f"Not enough sensor data before {target_ts} (need >=2 rows, got {len(window)})")
+        return window, source
+
+    def frame(self, target_ts: datetime, device_id: Optional[str] = None,
+              n: int = WINDOW_RECORDS) -> Tuple[pd.DataFrame, str]:
+        """Như window() nhưng trả về DataFrame (code cũ)."""
+        window, source = self.window(target_ts, device_id, n)
+        return frame_from_window(window), source
+
+
+class LiveWindowProvider(WindowProvider):
+    """
+    Cửa sổ từ DeviceBufferPool trong RAM (AIService.buffers).
+
+    Dùng buffer khi: device có buffer ready, và reading mới nhất (sau khi bỏ
+    các reading > target + max_lead) không cũ hơn target - max_staleness.
+    Ngược lại → fallback (None: raise ValueError).
+
+    buf.window() là view vào ring buffer: ingest ghi reading mới sẽ ghi đè phần
+    tử đầu của view. `lock_for(device_id)` (AIService._device_lock, cùng lock với
+    handle_sensor_data) được giữ khi đọc + cắt cửa sổ, kết quả được copy trước
+    khi nhả lock → slot check chạy song song với ingest không thấy cửa sổ rách.
+    """
+
+    name = "live"
+
+    def __init__(self, buffers, fallback: Optional[WindowProvider] = None,
+                 max_staleness: float = LIVE_MAX_STALENESS, max_lead: float = LIVE_MAX_LEAD,
+                 lock_for: Optional[Callable[[str], ContextManager]] = None):
+        self.buffers = buffers
+        self.fallback = fallback
+        self.lock_for = lock_for or (lambda device_id: contextlib.nullcontext())
+        self.max_staleness = max_staleness
+        self.max_lead = max_lead
+        self.hits = 0
+        self.fallbacks = 0
+
+    def _live_window(self, target_ts: datetime, device_id: Optional[str], n: int) -> Optional[SensorWindow]:
+        if device_id is None:
+            # Slot không ghi device → device gửi dữ liệu gần nhất
+            devices = self.buffers.devices()
+            if not devices:
+                return None
+            device_id = devices[-1]
+        target = _to_epoch(target_ts)
+        with self.lock_for(device_id):
+            buf = self.buffers.get(device_id)
+            if buf is None or not buf.is_ready():
+                return None
+            w = buf.window()
+            end = int(np.searchsorted(w.ts, target + self.max_lead, side="right"))
+            if end < 2 or w.ts[end - 1] < target - self.max_staleness:
+                return None
+            sl = slice(max(0, end - n), end)
+            # Copy trước khi nhả lock: view sẽ bị ingest ghi đè
+            return SensorWindow(w.ts[sl].copy(), w.temp_c[sl].copy(), w.rh_pct[sl].copy(),
+                                w.pressure_hpa[sl].copy(), w.soil_moist_pct[sl].copy())
+
+    def window(self, target_ts: datetime, device_id: Optional[str] = None,
+               n: int = WINDOW_RECORDS) -> Tuple[SensorWindow, str]:
+        w = self._live_window(target_ts, device_id, n)
+        if w is not None:
+            self.hits += 1
+            return w, self.name
+        self.fallbacks += 1
+        if self.fallback is None:
+            raise ValueError(f"No live sensor window for {device_id or 'any device'} at {target_ts}")
+        logger.info(f"Live buffer not usable for {device_id or 'any device'} at {target_ts} → {self.fallback.name}")
+        return self.fallback.window(target_ts, device_id, n)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "fallbacks": self.fallbacks}
+
+
+def epoch_to_iso(ts: int) -> str:
+    """Epoch giây → ISO (naive UTC, giống Timestamp.isoformat() của dữ liệu CSV)."""
+    return datetime.fromtimestamp(int(ts), tz=timezone.utc).replace(tzinfo=None).isoformat()
+
+
+__all__ = [
+    "WINDOW_RECORDS",
+    "WindowProvider",
+    "HistoricalWindowProvider",
+    "LiveWindowProvider",
+    "window_from_frame",
+    "epoch_to_iso",
+]
@@ -0,0 +1,353 @@
+"""
+Worker Pool - Chạy N AIService worker (process) với device-affine partitioning.
+
+Mỗi device_id luôn thuộc đúng 1 worker: partition_for(device_id) = crc32 % N
+→ SensorBuffer / streaming features của device chỉ nằm ở worker đó, ingest +
+inference scale theo số core.
+
+2 chế độ nhận dữ liệu:
+- dispatch : process cha subscribe sensor/data/push, đọc device_id rồi đẩy
+             payload vào queue của worker sở hữu (multiprocessing.Queue)
+- shared   : mỗi worker subscribe MQTT 5 shared subscription
+             $share/<group>/sensor/data/push (broker chia tải round-robin);
+             message của device thuộc worker khác được chuyển tiếp qua
+             ai/internal/sensor/<worker> (worker nào cũng subscribe topic riêng)
+
+Lưu trữ: bắt buộc sensor store Parquet; mỗi worker ghi + compact hot segment
+của riêng mình (SensorStore(writer_id="w<k>")), partition day/device không bị
+2 worker ghi cùng lúc. Lịch tưới do worker 0 sinh; mỗi worker chỉ chạy forecast
+cho slot của device mình (slot không có device_id → worker 0).
+
+Chạy:
+    python src/worker_pool.py --workers 4 --mode dispatch
+    python src/worker_pool.py --workers 4 --mode shared --group ai-workers
+
+Test không cần broker thật: backend="thread" + local_broker.LocalBroker
+(xem check_worker_pool.py).
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import paho.mqtt.client as mqtt
+
+from ai_service import (
+    MQTT_BROKER,
+    MQTT_PORT,
+    AIService,
+    GroupCommitWriter,
+    PYARROW_AVAILABLE,
+    SENSOR_STORE_BATCH_SIZE,
+    SENSOR_STORE_DIR,
+    SENSOR_STORE_FLUSH_INTERVAL,
+    SENSOR_WRITER_FSYNC,
+    SensorStore,
+)
+from sensor_writer import DEFAULT_DEVICE_ID
+
+logger = logging.getLogger(__name__)
+
+# ===== Config =====
+WORKER_COUNT = int(os.getenv("AI_WORKERS", os.cpu_count() or 1))
+WORKER_MODE = os.getenv("AI_WORKER_MODE", "dispatch")        # dispatch | shared
+MQTT_SHARE_GROUP = os.getenv("MQTT_SHARE_GROUP", "ai-workers")
+DISPATCH_QUEUE_SIZE = int(os.getenv("DISPATCH_QUEUE_SIZE", 10_000))
+PARTITION_TOPIC = "ai/internal/sensor"
+WORKER_MODES = ("dispatch", "shared")
+
+
+def partition_for(device_id: str, workers: int) -> int:
+    """Worker sở hữu device (crc32 ổn định giữa các process / lần chạy, khác hash())."""
+    return zlib.crc32(str(device_id).encode("utf-8")) % workers
+
+
+def device_id_from_payload(payload) -> str:
+    """device_id trong payload JSON (payload lỗi → device mặc định; worker sẽ log lỗi)."""
+    try:
+        data = json.loads(payload)
+        return str(data.get("device_id", DEFAULT_DEVICE_ID))
+    except (ValueError, AttributeError, TypeError):
+        return DEFAULT_DEVICE_ID
+
+
+class PartitionedAIService(AIService):
+    """AIService chỉ giữ state + chạy forecast cho các device thuộc worker này."""
+
+    def __init__(
+        self,
+        index: int,
+        workers: int,
+        mode: str = "dispatch",
+        client=None,
+        share_group: str = MQTT_SHARE_GROUP,
+        store_dir: Path = SENSOR_STORE_DIR,
+        schedule: bool = True,
+    ):
+        self.index = index
+        self.workers = workers
+        self.mode = mode
+        self.share_group = share_group
+        self.store_dir = Path(store_dir)
+        self.schedule_enabled = schedule
+        self.forwarded = 0
+        self.TOPIC_PARTITION = f"{PARTITION_TOPIC}/{index}"
+        super().__init__(client=client)
+
+    def _create_client(self) -> mqtt.Client:
+        # Shared subscription cần MQTT 5
+        client = mqtt.Client(
+            client_id=f"ai_service_w{self.index}_{int(time.time())}",
+            protocol=mqtt.MQTTv5 if self.mode == "shared" else mqtt.MQTTv311,
+        )
+        return self._configure_client(client)
+
+    def _open_sensor_writer(self) -> GroupCommitWriter:
+        if not PYARROW_AVAILABLE:
+            raise RuntimeError("Worker pool cần sensor store Parquet (pip install pyarrow)")
+        return GroupCommitWriter(
+            SensorStore(self.store_dir, writer_id=f"w{self.index}"),
+            batch_size=SENSOR_STORE_BATCH_SIZE,
+            flush_interval=SENSOR_STORE_FLUSH_INTERVAL,
+            fsync_policy=SENSOR_WRITER_FSYNC,
+        )
+
+    def owns(self, device_id: str) -> bool:
+        return partition_for(device_id, self.workers) == self.index
+
+    def owns_slot(self, slot: Dict) -> bool:
+        device_id = slot.get("device_id")
+        if device_id is None:
+            return self.index == 0
+        return self.owns(device_id)
+
+    def subscriptions(self) -> List[str]:
+        if self.mode == "shared":
+            return [f"$share/{self.share_group}/{self.TOPIC_SENSOR}", self.TOPIC_PARTITION]
+        return []  # dispatch: nhận payload qua queue từ process cha
+
+    def on_message(self, client, userdata, msg):
+        if msg.topic == self.TOPIC_PARTITION:
+            self.ingest.submit(msg.payload)
+        elif msg.topic == self.TOPIC_SENSOR:
+            owner = partition_for(device_id_from_payload(msg.payload), self.workers)
+            if owner == self.index:
+                self.ingest.submit(msg.payload)
+            else:
+                # Shared subscription không giữ affinity → chuyển cho worker sở hữu
+                client.publish(f"{PARTITION_TOPIC}/{owner}", msg.payload, qos=1)
+                self.forwarded += 1
+
+    def publish_schedule(self) -> Optional[Dict]:
+        # Chỉ worker 0 sinh + publish lịch; worker khác đọc file lịch
+        if self.index != 0 or not self.schedule_enabled:
+            return None
+        return super().publish_schedule()
+
+    def worker_stats(self) -> Dict:
+        return {
+            "worker": self.index,
+            "devices": self.buffers.devices(),
+            "ingest": self.ingest.stats(),
+            "forwarded": self.forwarded,
+        }
+
+
+def _run_worker(
+    index: int,
+    workers: int,
+    mode: str,
+    inbox,
+    client_factory: Optional[Callable[[int], object]],
+    share_group: str,
+    store_dir: Path,
+    schedule: bool,
+    results=None,
+):
+    """Entry point của 1 worker (process hoặc thread)."""
+    client = client_factory(index) if client_factory is not None else None
+    service = PartitionedAIService(
+        index, workers, mode=mode, client=client, share_group=share_group,
+        store_dir=store_dir, schedule=schedule,
+    )
+
+    def pump():
+        # dispatch: payload từ process cha; None = dừng (cả 2 chế độ)
+        while True:
+            payload = inbox.get()
+            if payload is None:
+                service.stop()
+                return
+            service.ingest.submit(payload)
+
+    threading.Thread(target=pump, name=f"worker-{index}-inbox", daemon=True).start()
+    service.start()
+    if results is not None:
+        results[index] = service.worker_stats()
+
+
+class WorkerPool:
+    """
+    Khởi động N PartitionedAIService (+ dispatcher nếu mode="dispatch").
+
+    backend="process" cho production; backend="thread" chạy cùng process
+    (test với LocalBroker, không scale CPU).
+    """
+
+    def __init__(
+        self,
+        workers: int = WORKER_COUNT,
+        mode: str = WORKER_MODE,
+        backend: str = "process",
+        client_factory: Optional[Callable[[int], object]] = None,
+        dispatcher_client=None,
+        queue_size: int = DISPATCH_QUEUE_SIZE,
+        share_group: str = MQTT_SHARE_GROUP,
+        store_dir: Path = SENSOR_STORE_DIR,
+        schedule: bool = True,
+    ):
+        if mode not in WORKER_MODES:
+            raise ValueError(f"mode must be one of {WORKER_MODES}, got {mode!r}")
+        if backend not in ("process", "thread"):
+            raise ValueError(f"backend must be 'process' or 'thread', got {backend!r}")
+        self.workers = max(1, workers)
+        self.mode = mode
+        self.backend = backend
+        self.client_factory = client_factory
+        self.dispatcher_client = dispatcher_client
+        self.queue_size = queue_size
+        self.share_group = share_group
+        self.store_dir = Path(store_dir)
+        self.schedule = schedule
+
+        self._queues: list = []
+        self._handles: list = []
+        self.results: Dict[int, Dict] = {}
+        self.dispatched = [0] * self.workers
+        self.dropped = [0] * self.workers
+
+    # ----- Lifecycle -----
+    def start(self) -> "WorkerPool":
+        # Worker trước dispatcher: fork trước khi có thread MQTT trong process cha
+        for index in range(self.workers):
+            if self.backend == "process":
+                inbox = mp.Queue(maxsize=self.queue_size)
+                handle = mp.Process(
+                    target=_run_worker,
+                    args=(index, self.workers, self.mode, inbox, self.client_factory, self.share_group,
+                          self.store_dir, self.schedule),
+                    name=f"ai-worker-{index}",
+                )
+            else:
+                inbox = queue.Queue(maxsize=self.queue_size)
+                handle = threading.Thread(
+                    target=_run_worker,
+                    args=(index, self.workers, self.mode, inbox, self.client_factory, self.share_group,
+                          self.store_dir, self.schedule, self.results),
+                    name=f"ai-worker-{index}",
+                    daemon=True,
+                )
+            handle.start()
+            self._queues.append(inbox)
+            self._handles.append(handle)
+
+        if self.mode == "dispatch":
+            self._start_dispatcher()
+        logger.info(f"✓ Worker pool started: {self.workers} {self.backend} worker(s), mode={self.mode}")
+        return self
+
+    def _start_dispatcher(self):
+        client = self.dispatcher_client
+        if client is None:
+            client = AIService._configure_client(mqtt.Client(
+                client_id=f"ai_dispatcher_{int(time.time())}",
+                clean_session=True,
+                protocol=mqtt.MQTTv311,
+            ))
+            self.dispatcher_client = client
+        client.on_connect = self._on_dispatcher_connect
+        client.on_message = self._on_dispatcher_message
+        client.connect(MQTT_BROKER, MQTT_PORT, keepalive=60)
+        client.loop_start()
+
+    def _on_dispatcher_connect(self, client, userdata, flags, rc, properties=None):
+        if rc == 0:
+            client.subscribe(AIService.TOPIC_SENSOR, qos=1)
+            logger.info(f"✓ Dispatcher subscribed to {AIService.TOPIC_SENSOR}")
+        else:
+            logger.error(f"Dispatcher connection failed with code {rc}")
+
+    def _on_dispatcher_message(self, client, userdata, msg):
+        index = partition_for(device_id_from_payload(msg.payload), self.workers)
+        try:
+            self._queues[index].put_nowait(msg.payload)
+            self.dispatched[index] += 1
+        except queue.Full:
+            self.dropped[index] += 1
+
+    def stop(self, timeout: float = 30.0):
+        """Dừng dispatcher, báo worker xử lý nốt queue rồi dừng."""
+        if self.mode == "dispatch" and self.dispatcher_client is not None:
+            self.dispatcher_client.loop_stop()
+            self.dispatcher_client.disconnect()
+        for inbox in self._queues:
+            inbox.put(None)
+        deadline = time.monotonic() + timeout
+        for handle in self._handles:
+            handle.join(max(0.0, deadline - time.monotonic()))
+            if self.backend == "process" and handle.is_alive():
+                logger.warning(f"{handle.name} did not stop in time, terminating")
+                handle.terminate()
+
+    def stats(self) -> Dict:
+        return {
+            "workers": self.workers,
+            "mode": self.mode,
+            "dispatched": list(self.dispatched),
+            "dropped": list(self.dropped),
+            "alive": sum(1 for h in self._handles if h.is_alive()),
+        }
+
+    def run_forever(self):
+        self.start()
+        try:
+            while any(h.is_alive() for h in self._handles):
+                time.sleep(1)
+        except KeyboardInterrupt:
+            logger.info("\n⚠️  Worker pool stopped by user")
+        finally:
+            self.stop()
+            logger.info(f"Worker pool: {self.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI Service worker pool (device-affine)")
+    parser.add_argument("--workers", type=int, default=WORKER_COUNT)
+    parser.add_argument("--mode", choices=WORKER_MODES, default=WORKER_MODE)
+    parser.add_argument("--group", default=MQTT_SHARE_GROUP, help="Shared subscription group (mode=shared)")
+    args = parser.parse_args()
+
+    WorkerPool(workers=args.workers, mode=args.mode, share_group=args.group).run_forever()
+
+
+__all__ = [
+    "PARTITION_TOPIC",
+    "partition_for",
+    "device_id_from_payload",
+    "PartitionedAIService",
+    "WorkerPool",
+]
+
+
+if __name__ == "__main__":
+    main()
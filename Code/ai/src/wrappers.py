@@ -1,33 +1,147 @@
 # src/wrappers.py
+from __future__ import annotations
+
+import os
+from typing import TYPE_CHECKING
+
 import numpy as np
-import xgboost as xgb
 
-def _predict_proba_booster(booster: xgb.Booster, X):
-    dm = xgb.DMatrix(X)
-    best_ntree_limit = getattr(booster, "best_ntree_limit", None)
-    best_iteration  = getattr(booster, "best_iteration", None)
-    if best_ntree_limit is not None:
-        p = booster.predict(dm, ntree_limit=best_ntree_limit)
-    elif best_iteration is not None:
-        p = booster.predict(dm, iteration_range=(0, best_iteration + 1))
+# xgboost (~1 s import, kéo theo sklearn / scipy) chỉ cần khi unpickle model
+# hoặc fallback DMatrix → import module này không tốn chi phí đó (predictors.py)
+if TYPE_CHECKING:
+    import xgboost as xgb
+
+# Số thread cho predict (0 = mặc định của xgboost: tất cả core)
+PREDICT_NTHREAD = int(os.getenv("PREDICT_NTHREAD", 0))
+# Budget riêng cho lần gọi ít dòng (≤ PREDICT_SMALL_BATCH: rolling nowcast, slot check),
+# 0 = dùng chung PREDICT_NTHREAD. xgboost chia dòng theo block 64 cho mỗi thread →
+# ≤ 64 dòng không tận dụng được nhiều thread, chỉ tốn dựng OpenMP team mỗi lần gọi
+PREDICT_NTHREAD_SINGLE = int(os.getenv("PREDICT_NTHREAD_SINGLE", 1))
+PREDICT_SMALL_BATCH = int(os.getenv("PREDICT_SMALL_BATCH", 64))
+
+
+def _iteration_range(booster: xgb.Booster, use_best_iteration: bool = True) -> tuple:
+    """(0, best_iteration + 1) nếu booster có early stopping, ngược lại (0, 0) = tất cả cây."""
+    best_iteration = getattr(booster, "best_iteration", None) if use_best_iteration else None
+    return (0, int(best_iteration) + 1) if best_iteration is not None else (0, 0)
+
+
+def _as_matrix(X) -> np.ndarray:
+    """Input → mảng 2D float32 liên tục (inplace_predict không phải copy lại)."""
+    X = np.asarray(X, dtype=np.float32)
+    if X.ndim == 1:
+        X = X.reshape(1, -1)
+    return np.ascontiguousarray(X)
+
+
+def _predict_values(booster: xgb.Booster, X, use_best_iteration: bool = True) -> np.ndarray:
+    """
+    Output của booster cho từng dòng (1D).
+
+    inplace_predict đọc thẳng mảng NumPy → không tạo DMatrix mỗi lần gọi
+    (DMatrix 1×13 tốn nhiều hơn chính việc duyệt cây). xgboost cũ → DMatrix.
+    """
+    X = _as_matrix(X)
+    iteration_range = _iteration_range(booster, use_best_iteration)
+    if hasattr(booster, "inplace_predict"):
+        p = booster.inplace_predict(X, iteration_range=iteration_range, validate_features=False)
     else:
-        p = booster.predict(dm)
-    p = np.asarray(p).reshape(-1)
+        import xgboost as xgb
+
+        dm = xgb.DMatrix(X)
+        best_ntree_limit = getattr(booster, "best_ntree_limit", None) if use_best_iteration else None
+        if best_ntree_limit is not None:
+            p = booster.predict(dm, ntree_limit=best_ntree_limit)
+        else:
+            p = booster.predict(dm, iteration_range=iteration_range)
+    return np.asarray(p).reshape(-1)
+
+
+def _set_nthread(booster: xgb.Booster, nthread: int) -> None:
+    # nthread ≤ 0 → đặt lại 0 (mặc định xgboost: mọi core), xoá giới hạn đã đặt trước đó
+    booster.set_param({"nthread": max(int(nthread or 0), 0)})
+
+
+def _single_booster(booster: xgb.Booster, nthread: int, single_nthread: int):
+    """Bản sao booster (nthread = single_nthread) cho lần gọi ít dòng; None nếu cùng budget."""
+    if not single_nthread or single_nthread == nthread:
+        return None
+    single = booster.copy()
+    single.set_param({"nthread": int(single_nthread)})
+    return single
+
+
+def _booster_for(model, X: np.ndarray) -> xgb.Booster:
+    """Booster theo số dòng: ≤ PREDICT_SMALL_BATCH → budget single-row (nếu có)."""
+    single = model._single
+    return single if single is not None and len(X) <= PREDICT_SMALL_BATCH else model._booster
+
+
+def _predict_proba_booster(booster: xgb.Booster, X):
+    p = _predict_values(booster, X)
     return np.c_[1 - p, p]
 
+
 class XGBBoosterWithThreshold:
     """Wrapper để pickle an toàn: giữ booster + threshold."""
-    def __init__(self, booster: xgb.Booster, threshold: float = 0.5):
+    # Pickle cũ không có các field này → dùng giá trị class
+    nthread = 0
+    single_nthread = 0
+    _single = None
+
+    def __init__(self, booster: xgb.Booster, threshold: float = 0.5, nthread: int = 0, single_nthread: int = 0):
         self._booster = booster
         self.threshold = float(threshold)
+        self.set_nthread(nthread, single_nthread)
 
     def get_booster(self) -> xgb.Booster:
         return self._booster
 
+    def set_nthread(self, nthread: int, single_nthread: int = None) -> None:
+        """Giới hạn số thread khi predict (0 = mặc định xgboost); single_nthread: lần gọi ít dòng."""
+        self.nthread = int(nthread or 0)
+        if single_nthread is not None:
+            self.single_nthread = int(single_nthread or 0)
+        _set_nthread(self._booster, self.nthread)
+        self._single = _single_booster(self._booster, self.nthread, self.single_nthread)
+
     def predict_proba(self, X):
-        return _predict_proba_booster(self._booster, X)
+        X = _as_matrix(X)
+        return _predict_proba_booster(_booster_for(self, X), X)
 
     def predict(self, X, threshold=None):
         th = self.threshold if threshold is None else float(threshold)
         p1 = self.predict_proba(X)[:, 1]
         return (p1 >= th).astype(int)
+
+
+class XGBAmountRegressor:
+    """
+    Wrapper cho booster lượng mưa (xgb_amount.pkl lưu xgb.Booster trần).
+
+    predict(X) nhận mảng NumPy (inplace_predict, không DMatrix). Mặc định dùng
+    tất cả cây như booster.predict(DMatrix) trước đây (use_best_iteration=False).
+    """
+
+    single_nthread = 0
+    _single = None
+
+    def __init__(self, booster: xgb.Booster, use_best_iteration: bool = False, nthread: int = 0,
+                 single_nthread: int = 0):
+        self._booster = booster
+        self.use_best_iteration = bool(use_best_iteration)
+        self.set_nthread(nthread, single_nthread)
+
+    def get_booster(self) -> xgb.Booster:
+        return self._booster
+
+    def set_nthread(self, nthread: int, single_nthread: int = None) -> None:
+        self.nthread = int(nthread or 0)
+        if single_nthread is not None:
+            self.single_nthread = int(single_nthread or 0)
+        _set_nthread(self._booster, self.nthread)
+        self._single = _single_booster(self._booster, self.nthread, self.single_nthread)
+
+    def predict(self, X) -> np.ndarray:
+        X = _as_matrix(X)
+        return _predict_values(_booster_for(self, X), X, use_best_iteration=self.use_best_iteration)